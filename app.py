@@ -1,22 +1,31 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session, Response
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
+from contextlib import ExitStack
+from functools import partial
+import json
 import os
-import pandas as pd
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
-from webdriver_manager.chrome import ChromeDriverManager
-from webdriver_manager.core.os_manager import ChromeType
-from whatsapp_utils import process_recommendations
+import uuid
+from jobs import JobManager, JOB_FINISHED, JOB_FAILED
+from job_queue import JobQueue
+from driver_pool import DriverPool
+from chat_index import ChatIndex, normalize_name
+from sharding import assign_groups, send_sharded, run_shards, failed_shard, merge_results, ProgressMerger
+from staging import StagingStore, missing_columns, normalize_frame, content_hash
+from ledger import LedgerWriter, LEDGER_PENDING, LEDGER_DELIVERED, LEDGER_FAILED, LEDGER_UNCHANGED, LEDGER_DONE
+from throttle import SendScheduler
+from scheduler import CampaignScheduler
+from pacing import Pacer
+import metrics
+from metrics import CampaignTimings, SEND_FAILURES
+import message_templates
+from message_templates import (MessageRenderer, DEFAULT_TEMPLATES, TEMPLATE_LABELS, TEMPLATE_FIELDS, template_kind,
+                               RECOMMENDATION_FORMATS)
 import time
 from dotenv import load_dotenv
 import platform
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.common.by import By
 
 # Load environment variables
 load_dotenv()
@@ -31,6 +40,14 @@ app.config['UPLOAD_FOLDER'] = 'uploads'
 if not os.path.exists(app.config['UPLOAD_FOLDER']):
     os.makedirs(app.config['UPLOAD_FOLDER'])
 
+# Staged uploads with more rows than this are sent as a stream of groups
+STREAM_SEND_ROWS = int(os.getenv('STREAM_SEND_ROWS', '50000'))
+# 'daemon': campaigns are queued in JOB_QUEUE_DB and sent by sender_daemon.py
+SEND_MODE = os.getenv('SEND_MODE', 'local')
+
+# Parsed uploads waiting to be sent
+staging_store = StagingStore(os.getenv('STAGING_DB', os.path.join(app.config['UPLOAD_FOLDER'], 'staging.db')))
+
 db = SQLAlchemy(app)
 login_manager = LoginManager()
 login_manager.init_app(app)
@@ -48,6 +65,139 @@ class User(UserMixin, db.Model):
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
 
+# Chat titles seen in a WhatsApp session's chat list (see chat_index.py)
+class ChatIndexEntry(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    session_key = db.Column(db.String(255), nullable=False, index=True)
+    normalized_name = db.Column(db.String(255), nullable=False, index=True)
+    title = db.Column(db.String(255), nullable=False)
+    last_seen = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    
+    __table_args__ = (db.UniqueConstraint('session_key', 'title'),)
+
+# A send campaign: one upload sent with one message type/format, possibly
+# over several runs when it is resumed
+class Campaign(db.Model):
+    id = db.Column(db.String(32), primary_key=True, default=lambda: uuid.uuid4().hex)
+    owner_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    upload_id = db.Column(db.String(64), nullable=False)
+    message_type = db.Column(db.String(20), nullable=False)
+    format_type = db.Column(db.String(20))
+    message_text = db.Column(db.Text)
+    # Skip groups whose message is the same as the last one delivered to them
+    only_changed = db.Column(db.Boolean, default=False)
+    # Send time of a scheduled campaign (see scheduler.py)
+    scheduled_at = db.Column(db.DateTime)
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    last_job_id = db.Column(db.String(32))
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.now, onupdate=datetime.now)
+
+# Per-group delivery record of a campaign (see ledger.py)
+class SendLedger(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    campaign_id = db.Column(db.String(32), db.ForeignKey('campaign.id'), nullable=False, index=True)
+    group_name = db.Column(db.String(255), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default=LEDGER_PENDING)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    message_hash = db.Column(db.String(64))
+    # What the chat list showed for the sent message (see confirmation.py)
+    confirmation = db.Column(db.String(20))
+    error = db.Column(db.Text)
+    first_attempt_at = db.Column(db.DateTime)
+    last_attempt_at = db.Column(db.DateTime)
+    delivered_at = db.Column(db.DateTime)
+    
+    __table_args__ = (
+        db.UniqueConstraint('campaign_id', 'group_name'),
+        db.Index('ix_send_ledger_group_status', 'group_name', 'status')
+    )
+
+# Edited wording of a message kind (see message_templates.py); kinds without
+# a row use the default template
+class MessageTemplate(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), unique=True, nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    updated_by = db.Column(db.Integer, db.ForeignKey('user.id'))
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.now, onupdate=datetime.now)
+
+def template_body(kind):
+    template = MessageTemplate.query.filter_by(kind=kind).first()
+    return template.body if template is not None else DEFAULT_TEMPLATES[kind]
+
+def add_pending_ledger_entries(campaign_id, group_names):
+    existing = {row.group_name for row in SendLedger.query.filter_by(campaign_id=campaign_id)}
+    for group_name in group_names:
+        if str(group_name) not in existing:
+            db.session.add(SendLedger(campaign_id=campaign_id, group_name=str(group_name)))
+    db.session.commit()
+
+def write_ledger_records(campaign_id, records):
+    """Apply a batch of LedgerWriter records; runs on the writer thread."""
+    with app.app_context():
+        names = {str(record['group_name']) for record in records}
+        rows = {
+            row.group_name: row
+            for row in SendLedger.query.filter(SendLedger.campaign_id == campaign_id,
+                                               SendLedger.group_name.in_(names))
+        }
+        for record in records:
+            group_name = str(record['group_name'])
+            row = rows.get(group_name)
+            if row is None:
+                row = rows[group_name] = SendLedger(campaign_id=campaign_id, group_name=group_name, attempts=0)
+                db.session.add(row)
+            row.status = record['status']
+            row.attempts = (row.attempts or 0) + record.get('attempts', 1)
+            row.message_hash = record['message_hash'] or row.message_hash
+            row.error = record['error']
+            row.confirmation = record.get('confirmation')
+            row.first_attempt_at = row.first_attempt_at or record['at']
+            row.last_attempt_at = record['at']
+            if record['status'] == LEDGER_DELIVERED:
+                row.delivered_at = record['at']
+        db.session.commit()
+
+def delivered_groups(campaign_id):
+    """Groups of a campaign that need no further send."""
+    rows = SendLedger.query.filter(SendLedger.campaign_id == campaign_id, SendLedger.status.in_(LEDGER_DONE))
+    return {row.group_name for row in rows}
+
+def last_delivered_hashes(group_names, batch_size=500):
+    """{group name: hash of the last message delivered to it} over all campaigns."""
+    names = [str(name) for name in group_names]
+    hashes = {}
+    for start in range(0, len(names), batch_size):
+        rows = (
+            db.session.query(SendLedger.group_name, SendLedger.message_hash)
+            .filter(SendLedger.status == LEDGER_DELIVERED,
+                    SendLedger.message_hash.isnot(None),
+                    SendLedger.group_name.in_(names[start:start + batch_size]))
+            .order_by(SendLedger.delivered_at)
+        )
+        # Later deliveries overwrite earlier ones
+        hashes.update(rows)
+    return hashes
+
+def load_chat_index(session_key):
+    entries = ChatIndexEntry.query.filter_by(session_key=session_key).all()
+    return [(entry.title, entry.last_seen) for entry in entries]
+
+def save_chat_index(session_key, titles, seen_at):
+    existing = {
+        entry.title: entry
+        for entry in ChatIndexEntry.query.filter_by(session_key=session_key).all()
+    }
+    for title in titles:
+        entry = existing.get(title)
+        if entry is None:
+            db.session.add(ChatIndexEntry(session_key=session_key, title=title,
+                                          normalized_name=normalize_name(title), last_seen=seen_at))
+        else:
+            entry.last_seen = seen_at
+    db.session.commit()
+
 @login_manager.user_loader
 def load_user(user_id):
     return User.query.get(int(user_id))
@@ -95,13 +245,14 @@ def upload_file():
             print("No selected file")
             return jsonify({'error': 'No file selected'}), 400
         
-        if not file.filename.endswith(('.xlsx', '.xls')):
+        if not file.filename.lower().endswith(('.xlsx', '.xls', '.csv')):
             print("Invalid file format")
-            return jsonify({'error': 'Invalid file format. Please upload an Excel file'}), 400
+            return jsonify({'error': 'Invalid file format. Please upload an Excel or CSV file'}), 400
         
         # Generate unique filename
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f"recommendations_{timestamp}.xlsx"
+        extension = os.path.splitext(file.filename)[1].lower()
+        filename = f"recommendations_{timestamp}{extension}"
         filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
         print(f"Saving file to: {filepath}")
         
@@ -112,17 +263,41 @@ def upload_file():
         file.save(filepath)
         print("File saved successfully")
         
+        # Check if this is a generic message upload
+        is_generic = request.form.get('type') == 'generic'
+        message_type = 'generic' if is_generic else 'stock'
+        
+        # The same sheet uploaded again (e.g. after a failed run) reuses its
+        # staged parse
+        upload_id = content_hash(filepath, message_type)
+        upload_info = staging_store.info(upload_id)
+        if upload_info is not None:
+            os.remove(filepath)
+            session['upload_id'] = upload_id
+            session['message_type'] = message_type
+            print(f"File already staged as upload {upload_id}")
+            return jsonify({
+                'message': 'File uploaded successfully',
+                'upload_id': upload_id,
+                'groups_count': upload_info['groups'],
+                'reused': True
+            })
+        
+        # pandas/openpyxl are only loaded once there is something to parse
+        from ingest import should_stream
+        if should_stream(filepath):
+            return stage_streaming_upload(filepath, message_type, file.filename, upload_id)
+        
         try:
             # Read and validate the Excel file
             print("Reading Excel file...")
-            df = pd.read_excel(filepath)
-            
-            # Check if this is a generic message upload
-            is_generic = request.form.get('type') == 'generic'
+            import pandas as pd
+            with metrics.phase('upload_parse'):
+                df = pd.read_excel(filepath)
             
             if is_generic:
                 # For generic messages, only validate group_name column
-                if 'group_name' not in df.columns:
+                if missing_columns(df.columns, message_type):
                     raise ValueError("Excel file must contain a 'group_name' column")
                 # Check for client_name column but don't require it
                 has_client_names = 'client_name' in df.columns
@@ -133,42 +308,26 @@ def upload_file():
                 # For stock recommendations, validate all required columns
                 print(f"Found columns: {df.columns.tolist()}")
                 
-                required_columns = {
-                    'group_name': ['group_name'],
-                    'Company': ['Company'],
-                    'NSE ticker': ['NSE ticker'],
-                    'Reco.': ['Reco.'],
-                    'Quantity': ['Quantity'],
-                    'Approx. CMP ₹': ['Approx. CMP ₹'],
-                    'Value': ['Approx. Value @CMP ₹ Lakh', 'Approx. Value @CMP ₹ Lakhs'],
-                    'Order Type': ['Order Type']
-                }
-                # Add client_name as an optional column
-                optional_columns = ['client_name']
-                
-                missing_columns = []
-                for col_key, variations in required_columns.items():
-                    if not any(var in df.columns for var in variations):
-                        missing_columns.append(col_key)
-                
-                if missing_columns:
-                    print(f"Missing columns: {missing_columns}")
+                missing = missing_columns(df.columns, message_type)
+                if missing:
+                    print(f"Missing columns: {missing}")
                     os.remove(filepath)
-                    return jsonify({'error': f'Missing required columns: {", ".join(missing_columns)}'}), 400
-                
-                # Rename the column if it's the 'Lakhs' version
-                if 'Approx. Value @CMP ₹ Lakhs' in df.columns:
-                    df = df.rename(columns={'Approx. Value @CMP ₹ Lakhs': 'Approx. Value @CMP ₹ Lakh'})
-                    df.to_excel(filepath, index=False)
-                    print("Standardized column names")
+                    return jsonify({'error': f'Missing required columns: {", ".join(missing)}'}), 400
+            
+            # Stage the parsed sheet so sending never has to parse it again
+            df = normalize_frame(df, message_type)
+            with metrics.phase('upload_stage'):
+                staging_store.stage(df, message_type, source_name=file.filename, upload_id=upload_id)
+            os.remove(filepath)
             
-            # Store the filepath and type in session
-            session['uploaded_file'] = filepath
-            session['message_type'] = 'generic' if is_generic else 'stock'
-            print("File processed and stored in session")
+            # Store the upload id and type in session
+            session['upload_id'] = upload_id
+            session['message_type'] = message_type
+            print(f"File staged as upload {upload_id}")
             
             return jsonify({
                 'message': 'File uploaded successfully',
+                'upload_id': upload_id,
                 'groups_count': len(df['group_name'].unique())
             })
             
@@ -185,112 +344,859 @@ def upload_file():
             os.remove(filepath)
         return jsonify({'error': str(e)}), 500
 
+def stage_streaming_upload(filepath, message_type, source_name, upload_id=None):
+    """Stage a CSV or large workbook chunk by chunk instead of loading it whole."""
+    from ingest import stream_to_staging, MissingColumnsError
+    try:
+        print("Streaming file into staging...")
+        with metrics.phase('upload_stream'):
+            upload_id = stream_to_staging(filepath, message_type, staging_store, source_name=source_name,
+                                          upload_id=upload_id)
+        info = staging_store.info(upload_id)
+        
+        # Store the upload id and type in session
+        session['upload_id'] = upload_id
+        session['message_type'] = message_type
+        print(f"File staged as upload {upload_id} ({info['rows']} rows)")
+        
+        return jsonify({
+            'message': 'File uploaded successfully',
+            'upload_id': upload_id,
+            'groups_count': info['groups']
+        })
+    
+    except MissingColumnsError as e:
+        print(f"Missing columns: {e.missing}")
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        print(f"Error processing file: {str(e)}")
+        return jsonify({'error': f'Error processing file: {str(e)}'}), 400
+    finally:
+        if os.path.exists(filepath):
+            os.remove(filepath)
+
+def release_upload(upload_id):
+    """Delete a staged upload once no campaign may need it any more."""
+    # Uploads are shared by campaigns of the same sheet; keep it while any
+    # of them may still need it
+    still_needed = Campaign.query.filter(Campaign.upload_id == upload_id,
+                                         Campaign.status.notin_(('completed', 'cancelled'))).count()
+    if not still_needed:
+        staging_store.delete(upload_id)
+
+def campaign_renderer(campaign):
+    """The campaign's template, compiled; the wording is fixed for the whole
+    run, even if it is edited meanwhile."""
+    kind = template_kind(campaign.message_type, campaign.format_type)
+    return MessageRenderer(kind, template_body(kind))
+
+def resolve_groups(browsers, group_names):
+    """Resolve every group on every session: {session id: (resolved, unresolved)}."""
+    return {
+        browser.id: get_chat_index(browser).prepare(browser.driver, group_names)
+        for browser in browsers
+    }
+
+def get_chat_index(browser):
+    """The chat index for a pooled browser session, loaded from the database once."""
+    if getattr(browser, 'chat_index', None) is None:
+        browser.chat_index = ChatIndex(browser.profile_dir, load=load_chat_index, save=save_chat_index)
+    return browser.chat_index
+
+class CampaignRun:
+    """One run of a queued campaign.
+
+    start() marks the campaign running; load() reads its staged rows (or
+    leaves very large ones to be streamed), the groups not delivered yet,
+    its renderer and a ledger writer; finish() flushes the ledger and sets
+    the campaign's final status.
+    """
+
+    def __init__(self, job):
+        self.job = job
+        self.upload_id = job.payload['upload_id']
+        self.campaign = None
+        # What a scheduled campaign already did during its warm-up
+        self.prepared = {}
+        self.streaming = False
+        self.df = None
+        self.group_names = []
+        self.message_renderer = None
+        self.last_delivered = None
+        self.ledger = None
+        self.unresolved = {}
+
+    def start(self):
+        self.campaign = db.session.get(Campaign, self.job.payload['campaign_id'])
+        self.campaign.status = 'running'
+        self.campaign.last_job_id = self.job.id
+        db.session.commit()
+        self.prepared = prepared_campaigns.pop(self.campaign.id, {})
+
+    def load(self):
+        # Load the sheet staged at upload time; very large ones are streamed
+        # group by group instead of loaded whole
+        upload_info = staging_store.info(self.upload_id)
+        if upload_info is None:
+            raise RuntimeError('File not found. Please upload again')
+        self.streaming = upload_info['rows'] > STREAM_SEND_ROWS
+        self.df = self.prepared.get('df')
+        if self.df is None and not self.streaming:
+            self.df = staging_store.load(self.upload_id)
+        
+        # On a resumed campaign only the groups not yet delivered are sent
+        group_names = staging_store.group_names(self.upload_id)
+        already_delivered = delivered_groups(self.campaign.id)
+        if already_delivered:
+            group_names = [name for name in group_names if str(name) not in already_delivered]
+            print(f"Resuming campaign {self.campaign.id}: {len(already_delivered)} groups already delivered")
+            self.job.emit('resuming', delivered=len(already_delivered), remaining=len(group_names))
+        add_pending_ledger_entries(self.campaign.id, group_names)
+        self.group_names = group_names
+        self.message_renderer = self.prepared.get('message_renderer') or campaign_renderer(self.campaign)
+        self.last_delivered = last_delivered_hashes(group_names) if self.campaign.only_changed else None
+        # Read now: the writer thread has no session to reload an expired
+        # campaign with, and coalesced runs commit while others are sending
+        campaign_id = self.campaign.id
+        self.ledger = LedgerWriter(lambda records: write_ledger_records(campaign_id, records))
+
+    def fail_unresolved(self, unresolved):
+        """Record the groups no session can reach as failed."""
+        self.unresolved = unresolved
+        if not unresolved:
+            return
+        print(f"Unresolved groups: {unresolved}")
+        self.job.emit('unresolved', groups=unresolved)
+        for group_name, reason in unresolved.items():
+            self.ledger.record(group_name, None, LEDGER_FAILED, reason)
+            SEND_FAILURES.inc(reason='unresolved')
+
+    def results(self, results):
+        """The job result for the merged send results of this campaign."""
+        for group_name, reason in self.unresolved.items():
+            results['failed'].append({'group': group_name, 'error': reason} if self.job.kind == 'generic' else group_name)
+        return {
+            'campaign_id': self.campaign.id,
+            'successful_groups': results['success'],
+            'failed_groups': results['failed'],
+            'unchanged_groups': results['unchanged'],
+            'confirmations': results['confirmations'],
+            'unresolved_groups': self.unresolved,
+            'sessions': results['sessions'],
+            'stats': results['stats']
+        }
+
+    def finish(self):
+        try:
+            if self.ledger is not None:
+                self.ledger.close()
+            
+            # Keep the staged upload until every group got its message, so
+            # the campaign can be resumed
+            remaining = SendLedger.query.filter(SendLedger.campaign_id == self.campaign.id,
+                                                SendLedger.status.notin_(LEDGER_DONE)).count()
+            self.campaign.status = 'completed' if self.ledger is not None and remaining == 0 else 'incomplete'
+            db.session.commit()
+            if self.campaign.status == 'completed':
+                release_upload(self.upload_id)
+        except Exception as e:
+            print(f"Error during cleanup: {str(e)}")
+
+def checkout_sessions(runs):
+    """Reuse warm, logged-in browsers; this only blocks on the first job or
+    when a QR code has to be scanned again."""
+    def waiting():
+        for run in runs:
+            run.job.emit('waiting_for_login')
+    
+    with metrics.phase('sessions_ready'):
+        browsers = driver_pool.checkout_many(int(os.getenv('SEND_SHARDS', str(driver_pool.size))), on_wait=waiting)
+    print("WhatsApp Web is ready!")
+    for run in runs:
+        run.job.emit('ready', sessions=[browser.id for browser in browsers])
+    return browsers
+
+def checkin_sessions(browsers):
+    for browser in browsers:
+        try:
+            driver_pool.checkin(browser)
+        except Exception as e:
+            print(f"Error returning session {browser.id}: {str(e)}")
+
+def run_send_job(job):
+    """Run a queued campaign on a job worker thread."""
+    with app.app_context(), CampaignTimings().active() as timings:
+        results = _run_send_job(job, timings)
+        results['timings'] = timings.summary(sends=len(results['successful_groups']))
+        print(f"Campaign timings: {results['timings']}")
+        return results
+
+def _run_send_job(job, timings):
+    payload = job.payload
+    run = CampaignRun(job)
+    run.start()
+    browsers = []
+    try:
+        run.load()
+        browsers = checkout_sessions([run])
+        
+        # Resolve every group on every session, then give each group to
+        # exactly one session that has it
+        with metrics.phase('resolve_groups'):
+            resolutions = run.prepared.get('resolutions', {})
+            if all(browser.id in resolutions for browser in browsers):
+                resolutions = {browser.id: resolutions[browser.id] for browser in browsers}
+            else:
+                resolutions = resolve_groups(browsers, run.group_names)
+        shards, unresolved = assign_groups(run.group_names, resolutions)
+        run.fail_unresolved(unresolved)
+        
+        def send_shard(browser, chat_titles, progress_callback):
+            if run.streaming:
+                shard = staging_store.iter_groups(run.upload_id, names=set(chat_titles))
+            else:
+                shard = run.df[run.df['group_name'].isin(list(chat_titles))].copy()
+            # Every send also waits for a slot under the shared rate limits
+            pacer = Pacer(throttle=lambda: acquire_slot(browser.id))
+            
+            # Phases timed on the shard's thread count towards this campaign
+            with timings.active():
+                # Selenium and pandas are loaded with the first campaign
+                from whatsapp_utils import process_generic_messages, process_recommendations
+                if job.kind == 'generic':
+                    return process_generic_messages(browser.driver, shard, payload['message'], None,
+                                                    progress_callback=progress_callback, pacer=pacer,
+                                                    chat_titles=chat_titles, total_groups=len(chat_titles),
+                                                    ledger=run.ledger, message_renderer=run.message_renderer,
+                                                    last_delivered=run.last_delivered)
+                return process_recommendations(browser.driver, shard, payload['format'],
+                                               progress_callback=progress_callback, pacer=pacer,
+                                               chat_titles=chat_titles, total_groups=len(chat_titles),
+                                               ledger=run.ledger, message_renderer=run.message_renderer,
+                                               last_delivered=run.last_delivered, rendered=run.prepared.get('rendered'))
+        
+        campaign = run.campaign
+        with send_scheduler.campaign(campaign.id, account=campaign.owner_id,
+                                     message_type=campaign.message_type) as acquire_slot:
+            results = send_sharded(browsers, shards, send_shard, progress_callback=job.progress,
+                                   generic=job.kind == 'generic')
+        return run.results(results)
+    
+    finally:
+        # Ensure cleanup happens even if there's an error
+        checkin_sessions(browsers)
+        run.finish()
+
+def run_send_jobs(jobs):
+    """Run campaigns that were queued together as one coalesced send, so a
+    group that several of them message has its chat opened once (see
+    whatsapp_utils.process_coalesced). Campaigns with streamed uploads are
+    run on their own afterwards. Returns {job id: results or exception}."""
+    coalesced = []
+    separate = []
+    for job in jobs:
+        upload_info = staging_store.info(job.payload['upload_id'])
+        if upload_info is not None and upload_info['rows'] > STREAM_SEND_ROWS:
+            separate.append(job)
+        else:
+            coalesced.append(job)
+    if len(coalesced) < 2:
+        separate = coalesced + separate
+        coalesced = []
+    
+    outcomes = {}
+    if coalesced:
+        print(f"Coalescing {len(coalesced)} campaigns")
+        with app.app_context(), CampaignTimings().active() as timings:
+            try:
+                outcomes.update(_run_coalesced(coalesced, timings))
+            except Exception as e:
+                print(f"Coalesced send failed: {str(e)}")
+                outcomes.update({job.id: e for job in coalesced if job.id not in outcomes})
+            # The phases cover the coalesced send as a whole
+            for results in outcomes.values():
+                if not isinstance(results, Exception):
+                    results['timings'] = timings.summary(sends=len(results['successful_groups']))
+    for job in separate:
+        try:
+            outcomes[job.id] = run_send_job(job)
+        except Exception as e:
+            outcomes[job.id] = e
+    return outcomes
+
+def _run_coalesced(jobs, timings):
+    runs = []
+    outcomes = {}
+    for job in jobs:
+        run = CampaignRun(job)
+        run.start()
+        try:
+            run.load()
+        except Exception as e:
+            outcomes[job.id] = e
+            run.finish()
+            continue
+        runs.append(run)
+    if not runs:
+        return outcomes
+    
+    browsers = []
+    try:
+        browsers = checkout_sessions(runs)
+        for run in runs:
+            run.job.emit('coalesced', campaigns=[other.campaign.id for other in runs if other is not run])
+        
+        # One resolution and one session per group, whichever campaigns send to it
+        run_groups = {run.job.id: set(run.group_names) for run in runs}
+        group_names = list(dict.fromkeys(name for run in runs for name in run.group_names))
+        with metrics.phase('resolve_groups'):
+            resolutions = resolve_groups(browsers, group_names)
+        shards, unresolved = assign_groups(group_names, resolutions)
+        progress = {}
+        for run in runs:
+            run.fail_unresolved({name: reason for name, reason in unresolved.items() if name in run_groups[run.job.id]})
+            progress[run.job.id] = ProgressMerger(len(run_groups[run.job.id]) - len(run.unresolved), run.job.progress)
+        
+        def send_shard(browser, chat_titles):
+            from whatsapp_utils import campaign_messages, CampaignOutbox, process_coalesced
+            outboxes = []
+            for run in runs:
+                names = [name for name in chat_titles if name in run_groups[run.job.id]]
+                messages = campaign_messages(run.df[run.df['group_name'].isin(names)], run.job.kind,
+                                             run.message_renderer, run.job.payload['message'],
+                                             run.job.payload['format'], run.prepared.get('rendered'))
+                outboxes.append(CampaignOutbox(messages, run.job.kind == 'generic', progress[run.job.id],
+                                               run.ledger, run.last_delivered,
+                                               throttle=partial(acquire_slots[run.job.id], browser.id)))
+            with timings.active():
+                shard_results = process_coalesced(browser.driver, outboxes, chat_titles)
+            return {run.job.id: results for run, results in zip(runs, shard_results)}
+        
+        with ExitStack() as stack:
+            acquire_slots = {
+                run.job.id: stack.enter_context(send_scheduler.campaign(
+                    run.campaign.id, account=run.campaign.owner_id, message_type=run.campaign.message_type))
+                for run in runs
+            }
+            shard_outcomes = run_shards(browsers, shards, send_shard)
+        
+        for run in runs:
+            outcomes[run.job.id] = run.results(merge_results({
+                session_id: failed_shard([name for name in shards[session_id] if name in run_groups[run.job.id]], outcome,
+                                         run.job.kind == 'generic')
+                if isinstance(outcome, Exception) else outcome[run.job.id]
+                for session_id, outcome in shard_outcomes.items()
+            }))
+        return outcomes
+    
+    finally:
+        checkin_sessions(browsers)
+        for run in runs:
+            run.finish()
+
+driver_pool = DriverPool(
+    size=int(os.getenv('WHATSAPP_SESSIONS', '1')),
+    profile_root=os.getenv('CHROME_PROFILE_DIR', 'chrome_profiles')
+)
+# Rate limits shared by every campaign sent from this process
+send_scheduler = SendScheduler()
+# Campaigns queued while a worker is busy are sent together (see run_send_jobs)
+job_options = {
+    'workers': int(os.getenv('SEND_WORKERS', '1')),
+    'batch_runner': run_send_jobs if os.getenv('SEND_COALESCE', '1').lower() in ('1', 'true', 'yes') else None,
+    'max_batch': int(os.getenv('SEND_COALESCE_MAX', '10'))
+}
+if SEND_MODE == 'daemon':
+    job_manager = JobQueue(os.getenv('JOB_QUEUE_DB', os.path.join(app.config['UPLOAD_FOLDER'], 'jobs.db')),
+                           run_send_job, **job_options)
+else:
+    job_manager = JobManager(run_send_job, **job_options)
+
+# Scheduled campaign id -> what its warm-up prepared (sheet, renderer,
+# rendered messages, group resolutions); taken by the run
+prepared_campaigns = {}
+
+def load_scheduled_campaigns():
+    with app.app_context():
+        # Warm-ups of campaigns that are no longer waiting for their run:
+        # cancelled, sent or deleted since, possibly by another process. A
+        # claimed campaign keeps its warm-up until its job takes it
+        if prepared_campaigns:
+            waiting = {
+                campaign.id
+                for campaign in Campaign.query.filter(Campaign.id.in_(list(prepared_campaigns)),
+                                                      Campaign.status.in_(('scheduled', 'queued', 'running')))
+            }
+            for campaign_id in set(prepared_campaigns) - waiting:
+                prepared_campaigns.pop(campaign_id, None)
+        return [
+            (campaign.id, campaign.scheduled_at.timestamp())
+            for campaign in Campaign.query.filter_by(status='scheduled')
+            if campaign.scheduled_at is not None
+        ]
+
+def prepare_scheduled_campaign(campaign_id):
+    """Warm-up before a scheduled campaign's send time: render its messages,
+    start and log in the sessions, and resolve every group."""
+    with app.app_context():
+        campaign = db.session.get(Campaign, campaign_id)
+        if campaign is None or campaign.status != 'scheduled':
+            return
+        print(f"Preparing scheduled campaign {campaign.id} (sends at {campaign.scheduled_at})")
+        upload_info = staging_store.info(campaign.upload_id)
+        if upload_info is None:
+            raise RuntimeError('The upload for this campaign is no longer available')
+        
+        prepared = {'message_renderer': campaign_renderer(campaign)}
+        if upload_info['rows'] <= STREAM_SEND_ROWS:
+            with metrics.phase('prerender'):
+                prepared['df'] = staging_store.load(campaign.upload_id)
+                if campaign.message_type == 'generic':
+                    # Fills the renderer's cache of rendered messages
+                    from preview import iter_messages
+                    for _ in iter_messages([prepared['df']], prepared['message_renderer'], campaign.message_text):
+                        pass
+                else:
+                    prepared['rendered'] = prepared['message_renderer'].recommendation_messages(prepared['df'])
+                    if campaign.format_type == 'image':
+                        # Drawn into the picture cache, where the run finds them
+                        from table_images import TableImages
+                        TableImages().prerender(prepared['df'])
+        
+        group_names = staging_store.group_names(campaign.upload_id)
+        browsers = driver_pool.checkout_many(
+            int(os.getenv('SEND_SHARDS', str(driver_pool.size))),
+            on_wait=lambda: print(f"Scheduled campaign {campaign.id} is waiting for a QR scan")
+        )
+        try:
+            with metrics.phase('resolve_groups'):
+                prepared['resolutions'] = resolve_groups(browsers, group_names)
+        finally:
+            for browser in browsers:
+                driver_pool.checkin(browser)
+        prepared_campaigns[campaign.id] = prepared
+        print(f"Scheduled campaign {campaign.id} is ready")
+
+def start_scheduled_campaign(campaign_id):
+    with app.app_context():
+        # Claimed in one statement, so a campaign seen by two schedulers (a
+        # second app process, or the daemon's) is still only sent once
+        claimed = db.session.execute(
+            db.update(Campaign)
+            .where(Campaign.id == campaign_id, Campaign.status == 'scheduled')
+            .values(status='running')
+        ).rowcount
+        db.session.commit()
+        if not claimed:
+            return
+        campaign = db.session.get(Campaign, campaign_id)
+        print(f"Starting scheduled campaign {campaign.id}")
+        submit_campaign(campaign)
+
+campaign_scheduler = CampaignScheduler(load_scheduled_campaigns, prepare_scheduled_campaign,
+                                       start_scheduled_campaign)
+
+def parse_send_time(value):
+    """A send time from the UI (ISO 8601) as a naive local datetime."""
+    scheduled_at = datetime.fromisoformat(value)
+    if scheduled_at.tzinfo is not None:
+        scheduled_at = scheduled_at.astimezone().replace(tzinfo=None)
+    return scheduled_at
+
 @app.route('/send_messages', methods=['POST'])
 @login_required
 def send_messages():
     try:
-        if 'uploaded_file' not in session:
+        if 'upload_id' not in session:
             return jsonify({'error': 'Please upload a file first'}), 400
         
-        filepath = session['uploaded_file']
-        if not os.path.exists(filepath):
+        upload_id = session['upload_id']
+        if staging_store.info(upload_id) is None:
             return jsonify({'error': 'File not found. Please upload again'}), 400
         
-        # Read the Excel file
-        df = pd.read_excel(filepath)
-        
         # Get message type and format preference
         data = request.get_json()
         message_type = data.get('type', session.get('message_type', 'stock'))
         
+        campaign = Campaign(owner_id=current_user.id, upload_id=upload_id, message_type=message_type)
         if message_type == 'generic':
             # For generic messages, get the message text
-            message_text = data.get('message')
-            if not message_text:
+            campaign.message_text = data.get('message')
+            if not campaign.message_text:
                 return jsonify({'error': 'No message provided'}), 400
         else:
             # For stock recommendations, get the format
-            format_type = data.get('format', 'simple')
-        
-        # Initialize Chrome options
-        chrome_options = Options()
-        chrome_options.add_argument('--start-maximized')
+            campaign.format_type = data.get('format', 'simple')
+            if campaign.format_type not in RECOMMENDATION_FORMATS:
+                return jsonify({'error': f'Unknown format: {campaign.format_type}'}), 400
+        campaign.only_changed = bool(data.get('only_changed'))
+        if data.get('scheduled_at'):
+            try:
+                campaign.scheduled_at = parse_send_time(data['scheduled_at'])
+            except ValueError:
+                return jsonify({'error': 'Invalid send time'}), 400
+            if campaign.scheduled_at <= datetime.now():
+                return jsonify({'error': 'The send time is in the past'}), 400
+            campaign.status = 'scheduled'
+        db.session.add(campaign)
+        db.session.commit()
         
-        try:
-            driver = webdriver.Chrome(
-                service=Service(ChromeDriverManager(chrome_type=ChromeType.CHROMIUM).install()),
-                options=chrome_options
-            )
-        except Exception as e:
-            print(f"First attempt failed: {str(e)}")
-            # Second attempt with different ChromeType
-            driver = webdriver.Chrome(
-                service=Service(ChromeDriverManager(chrome_type=ChromeType.GOOGLE).install()),
-                options=chrome_options
-            )
+        # The campaign holds on to the staged upload from here on
+        del session['upload_id']
+        if 'message_type' in session:
+            del session['message_type']
         
-        try:
-            # Open WhatsApp Web
-            driver.get('https://web.whatsapp.com')
-            
-            # Wait for WhatsApp to be ready (search box visible)
-            print("Waiting for WhatsApp Web to be ready...")
-            search_box = WebDriverWait(driver, 60).until(
-                EC.presence_of_element_located((By.XPATH, "//div[@contenteditable='true'][@data-tab='3']"))
-            )
-            print("WhatsApp Web is ready!")
-            
-            # Process messages based on type
-            if message_type == 'generic':
-                from whatsapp_utils import process_generic_messages
-                results = process_generic_messages(driver, df, message_text, filepath)
-            else:
-                from whatsapp_utils import process_recommendations
-                results = process_recommendations(driver, df, format_type, filepath)
-            
-            # Clean up
-            driver.quit()
-            
-            # Clear the session
-            if 'uploaded_file' in session:
-                del session['uploaded_file']
-            if 'message_type' in session:
-                del session['message_type']
-            
+        if campaign.status == 'scheduled':
+            campaign_scheduler.wake()
             return jsonify({
-                'message': 'Messages processed',
-                'details': {
-                    'successful_groups': results['success'],
-                    'failed_groups': results['failed']
-                }
-            })
-            
-        except Exception as e:
-            print(f"Error waiting for WhatsApp: {str(e)}")
-            return jsonify({'error': 'WhatsApp Web login timeout. Please try again.'}), 500
+                'message': 'Campaign scheduled',
+                'campaign_id': campaign.id,
+                'scheduled_at': campaign.scheduled_at.isoformat(),
+                'status_url': url_for('campaign_status', campaign_id=campaign.id)
+            }), 202
+        
+        job = submit_campaign(campaign)
+        return queued_response(campaign, job)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+
+def submit_campaign(campaign):
+    """Queue a run of the campaign on the job workers."""
+    payload = {
+        'campaign_id': campaign.id,
+        'upload_id': campaign.upload_id,
+        'message': campaign.message_text,
+        'format': campaign.format_type
+    }
+    job = job_manager.submit(campaign.message_type, payload, owner_id=campaign.owner_id)
+    campaign.status = 'queued'
+    campaign.last_job_id = job.id
+    db.session.commit()
+    return job
+
+def queued_response(campaign, job):
+    return jsonify({
+        'message': 'Messages queued',
+        'campaign_id': campaign.id,
+        'job_id': job.id,
+        'status_url': url_for('job_status', job_id=job.id),
+        'events_url': url_for('job_events', job_id=job.id)
+    }), 202
+
+def get_user_campaign(campaign_id):
+    campaign = db.session.get(Campaign, campaign_id)
+    if campaign is None or campaign.owner_id != current_user.id:
+        return None
+    return campaign
+
+@app.route('/campaigns/<campaign_id>')
+@login_required
+def campaign_status(campaign_id):
+    campaign = get_user_campaign(campaign_id)
+    if campaign is None:
+        return jsonify({'error': 'Campaign not found'}), 404
     
-    finally:
-        # Ensure cleanup happens even if there's an error
+    counts = dict(
+        db.session.query(SendLedger.status, db.func.count(SendLedger.id))
+        .filter_by(campaign_id=campaign.id).group_by(SendLedger.status).all()
+    )
+    confirmations = dict(
+        db.session.query(SendLedger.confirmation, db.func.count(SendLedger.id))
+        .filter(SendLedger.campaign_id == campaign.id, SendLedger.confirmation.isnot(None))
+        .group_by(SendLedger.confirmation).all()
+    )
+    undelivered = [
+        {'group': row.group_name, 'status': row.status, 'attempts': row.attempts, 'error': row.error}
+        for row in SendLedger.query.filter(SendLedger.campaign_id == campaign.id,
+                                           SendLedger.status.notin_(LEDGER_DONE))
+    ]
+    return jsonify({
+        'campaign_id': campaign.id,
+        'type': campaign.message_type,
+        'only_changed': bool(campaign.only_changed),
+        'scheduled_at': campaign.scheduled_at.isoformat() if campaign.scheduled_at else None,
+        'status': campaign.status,
+        'last_job_id': campaign.last_job_id,
+        'counts': counts,
+        'confirmations': confirmations,
+        'undelivered': undelivered,
+        'resumable': campaign.status != 'completed' and staging_store.info(campaign.upload_id) is not None
+    })
+
+@app.route('/campaigns/<campaign_id>/resume', methods=['POST'])
+@login_required
+def resume_campaign(campaign_id):
+    """Send the groups of a campaign that have not been delivered yet."""
+    campaign = get_user_campaign(campaign_id)
+    if campaign is None:
+        return jsonify({'error': 'Campaign not found'}), 404
+    # A queued/running status whose job is gone, or was failed when the
+    # sender daemon restarted, was left behind by a crash and can be resumed
+    job = job_manager.get(campaign.last_job_id) if campaign.last_job_id else None
+    if campaign.status in ('queued', 'running') and job is not None and not job.is_done:
+        return jsonify({'error': 'Campaign is already running'}), 409
+    if campaign.status == 'completed':
+        return jsonify({'error': 'All groups have already been delivered'}), 400
+    if campaign.status in ('scheduled', 'cancelled'):
+        return jsonify({'error': f'Campaign is {campaign.status}'}), 400
+    if staging_store.info(campaign.upload_id) is None:
+        return jsonify({'error': 'The upload for this campaign is no longer available'}), 400
+    
+    job = submit_campaign(campaign)
+    return queued_response(campaign, job)
+
+def preview_request():
+    """(upload id, renderer, message text) for a preview of the uploaded sheet,
+    rendered exactly like a campaign with the same options would be."""
+    data = request.get_json(silent=True) or {}
+    upload_id = session.get('upload_id')
+    if upload_id is None or staging_store.info(upload_id) is None:
+        raise ValueError('Please upload a file first')
+    message_type = data.get('type', session.get('message_type', 'stock'))
+    message_text = data.get('message')
+    if message_type == 'generic' and not message_text:
+        raise ValueError('No message provided')
+    if message_type != 'generic' and data.get('format', 'simple') not in RECOMMENDATION_FORMATS:
+        raise ValueError(f"Unknown format: {data.get('format')}")
+    kind = template_kind(message_type, data.get('format', 'simple'))
+    return upload_id, MessageRenderer(kind, template_body(kind)), message_text, data
+
+@app.route('/preview', methods=['POST'])
+@login_required
+def preview_messages():
+    """One page of the messages the uploaded sheet would send; only the groups
+    on the page are loaded and rendered."""
+    try:
+        upload_id, message_renderer, message_text, data = preview_request()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        page, page_size = int(data.get('page') or 1), int(data.get('page_size') or 0)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid page or page size'}), 400
+    try:
+        from preview import iter_messages, iter_group_frames, page_bounds
+        group_names = staging_store.group_names(upload_id)
+        page, page_size, start, end, pages = page_bounds(len(group_names), page, page_size)
+        frames = iter_group_frames(staging_store, upload_id, group_names[start:end], batch_groups=page_size)
+        messages = list(iter_messages(frames, message_renderer, message_text))
+        return jsonify({
+            'upload_id': upload_id,
+            'total_groups': len(group_names),
+            'page': page,
+            'page_size': page_size,
+            'pages': pages,
+            'messages': messages
+        })
+    except Exception as e:
+        print(f"Preview error: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/preview/export', methods=['POST'])
+@login_required
+def export_messages():
+    """Every message the uploaded sheet would send, as a CSV download."""
+    try:
+        upload_id, message_renderer, message_text, _ = preview_request()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    from preview import iter_messages, iter_group_frames, iter_csv
+    # Rendered while the file is downloaded, a batch of groups at a time
+    frames = iter_group_frames(staging_store, upload_id, staging_store.group_names(upload_id))
+    entries = iter_messages(frames, message_renderer, message_text)
+    filename = f"messages_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+    return Response(iter_csv(entries), mimetype='text/csv',
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+@app.route('/campaigns/scheduled')
+@login_required
+def scheduled_campaigns():
+    campaigns = (Campaign.query.filter_by(owner_id=current_user.id, status='scheduled')
+                 .order_by(Campaign.scheduled_at))
+    entries = []
+    for campaign in campaigns:
+        entry = {
+            'campaign_id': campaign.id,
+            'type': campaign.message_type,
+            'format': campaign.format_type,
+            'scheduled_at': campaign.scheduled_at.isoformat()
+        }
+        # Warm-ups are held by the process that ran them, which in daemon
+        # mode is the sender daemon, not this one
+        if SEND_MODE != 'daemon':
+            entry['prepared'] = campaign.id in prepared_campaigns
+        entries.append(entry)
+    return jsonify({'campaigns': entries})
+
+@app.route('/campaigns/<campaign_id>/cancel', methods=['POST'])
+@login_required
+def cancel_campaign(campaign_id):
+    """Cancel a scheduled campaign that has not started yet."""
+    campaign = get_user_campaign(campaign_id)
+    if campaign is None:
+        return jsonify({'error': 'Campaign not found'}), 404
+    if campaign.status != 'scheduled':
+        return jsonify({'error': 'Only scheduled campaigns can be cancelled'}), 400
+    campaign.status = 'cancelled'
+    db.session.commit()
+    prepared_campaigns.pop(campaign.id, None)
+    release_upload(campaign.upload_id)
+    campaign_scheduler.wake()
+    return jsonify({'campaign_id': campaign.id, 'status': campaign.status})
+
+def template_info(kind):
+    body = template_body(kind)
+    return {
+        'kind': kind,
+        'label': TEMPLATE_LABELS[kind],
+        'fields': TEMPLATE_FIELDS[kind],
+        'body': body,
+        'is_default': body == DEFAULT_TEMPLATES[kind],
+        'default_body': DEFAULT_TEMPLATES[kind],
+        'preview': MessageRenderer(kind, body).sample()
+    }
+
+@app.route('/message_templates')
+@login_required
+def list_message_templates():
+    return jsonify({'templates': [template_info(kind) for kind in DEFAULT_TEMPLATES]})
+
+@app.route('/message_templates/<kind>', methods=['PUT', 'DELETE'])
+@login_required
+def edit_message_template(kind):
+    """Save (PUT {"body": ...}) or reset to the default (DELETE) a template."""
+    if kind not in DEFAULT_TEMPLATES:
+        return jsonify({'error': 'Unknown template'}), 404
+    template = MessageTemplate.query.filter_by(kind=kind).first()
+    old_body = template.body if template is not None else None
+    
+    if request.method == 'DELETE':
+        if template is not None:
+            db.session.delete(template)
+    else:
+        body = (request.get_json(silent=True) or {}).get('body')
+        if not body or not body.strip():
+            return jsonify({'error': 'The template is empty'}), 400
+        # Refuse templates that do not compile or render
         try:
-            if 'driver' in locals():
-                driver.quit()
-            if 'uploaded_file' in session:
-                filepath = session['uploaded_file']
-                if os.path.exists(filepath):
-                    os.remove(filepath)
-                del session['uploaded_file']
-            if 'message_type' in session:
-                del session['message_type']
+            MessageRenderer(kind, body).sample()
         except Exception as e:
-            print(f"Error during cleanup: {str(e)}")
+            return jsonify({'error': f'Invalid template: {str(e)}'}), 400
+        if template is None:
+            template = MessageTemplate(kind=kind)
+            db.session.add(template)
+        template.body = body
+        template.updated_by = current_user.id
+    db.session.commit()
+    
+    # Campaigns already running keep the renderer they compiled
+    if old_body is not None:
+        message_templates.invalidate(old_body)
+    return jsonify(template_info(kind))
+
+def get_user_job(job_id):
+    job = job_manager.get(job_id)
+    if job is None or job.owner_id != current_user.id:
+        return None
+    return job
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Send pipeline metrics in the Prometheus text format."""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/jobs/<job_id>')
+@login_required
+def job_status(job_id):
+    job = get_user_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/jobs/<job_id>/events')
+@login_required
+def job_events(job_id):
+    """Stream job progress as Server-Sent Events."""
+    job = get_user_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    # Browsers resend the last id they saw when reconnecting
+    last_seq = int(request.headers.get('Last-Event-ID') or request.args.get('after', 0))
+    
+    def stream():
+        seq = last_seq
+        while True:
+            events = job.events_after(seq, timeout=15)
+            if not events:
+                if job.is_done:
+                    return
+                # Keep proxies from closing an idle connection
+                yield ': keepalive\n\n'
+                continue
+            for event in events:
+                seq = event['seq']
+                yield f"id: {seq}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+                if event['type'] in (JOB_FINISHED, JOB_FAILED):
+                    return
+    
+    return Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+def upgrade_schema():
+    """Add the columns and indexes introduced after a table was created;
+    db.create_all() only creates missing tables."""
+    inspector = db.inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                print(f"Adding column {table.name}.{column.name}")
+                column_type = column.type.compile(dialect=db.engine.dialect)
+                db.session.execute(db.text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+        db.session.commit()
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
 
 def create_tables():
     with app.app_context():
         db.create_all()
+        upgrade_schema()
+
+def preload_modules():
+    """Import the upload and send stack (pandas, selenium) in the background,
+    so the first upload or campaign does not pay for it."""
+    def load():
+        try:
+            import ingest
+            import renderer
+            import whatsapp_utils
+            print("Preloaded upload and send modules")
+        except Exception as e:
+            print(f"Error preloading modules: {str(e)}")
+
+    import threading
+    threading.Thread(target=load, name='preload-modules', daemon=True).start()
+
+# Not when a table image worker (see table_images), started from
+# `python app.py`, imports this module as __mp_main__
+if __name__ != '__mp_main__':
+    if os.getenv('PRELOAD_MODULES', '').lower() in ('1', 'true', 'yes'):
+        preload_modules()
+    
+    if SEND_MODE != 'daemon' and os.getenv('PREWARM_DRIVERS', '').lower() in ('1', 'true', 'yes'):
+        driver_pool.warm()
 
 if __name__ == '__main__':
     create_tables()
+    # Scheduled campaigns start on time even if no one opens the app. Only
+    # in the process serving requests, not the reloader watching the files;
+    # in daemon mode the sender daemon, which has the browsers, runs them
+    if SEND_MODE != 'daemon' and os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        campaign_scheduler.ensure_running()
     app.run(debug=True, port=8080) 
\ No newline at end of file
@@ -0,0 +1,77 @@
+"""Compare render_recommendations() with per-group format_recommendation_message().
+
+Usage:
+    python benchmarks/bench_render.py --rows 50000 --groups 5000
+
+Builds a synthetic recommendation sheet, renders it both ways for the
+simple and table formats, checks the text is identical and prints timings.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+from renderer import render_recommendations
+from whatsapp_utils import format_recommendation_message
+
+
+def make_sheet(rows, groups, seed=0):
+    rng = random.Random(seed)
+    group_names = [f"Client Group {i}" for i in range(groups)]
+    # A few test groups so the [TEST MODE] path is covered too
+    for i in range(0, groups, 50):
+        group_names[i] += " testing"
+    names = [rng.choice(group_names) for _ in range(rows)]
+    return pd.DataFrame({
+        'Sr': range(1, rows + 1),
+        'group_name': names,
+        'client_name': [name.split()[-1] for name in names],
+        'Company': [f"Company {rng.randint(1, 500)}" for _ in range(rows)],
+        'NSE ticker': [f"TICK{rng.randint(1, 500)}" for _ in range(rows)],
+        'Reco.': [rng.choice(['BUY', 'SELL', 'buy', 'Sell', 'HOLD']) for _ in range(rows)],
+        'Quantity': [rng.randint(1, 1000) for _ in range(rows)],
+        'Approx. CMP ₹': [round(rng.uniform(10, 5000), 2) for _ in range(rows)],
+        'Approx. Value @CMP ₹ Lakh': [round(rng.uniform(0.1, 50), 2) for _ in range(rows)],
+        'Order Type': [rng.choice(['Market', 'Limit']) for _ in range(rows)],
+    })
+
+
+def render_per_group(df, format_type):
+    return {
+        group_name: format_recommendation_message(group_data, group_name, format_type)
+        for group_name, group_data in df.groupby('group_name')
+    }
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--groups', type=int, default=5000)
+    args = parser.parse_args()
+
+    df = make_sheet(args.rows, args.groups)
+    print(f"{args.rows} rows, {df['group_name'].nunique()} groups")
+
+    for format_type in ('simple', 'table'):
+        expected, legacy_time = timed(render_per_group, df, format_type)
+        actual, fast_time = timed(render_recommendations, df, format_type)
+        if actual != expected:
+            mismatched = [name for name in expected if actual.get(name) != expected[name]]
+            raise SystemExit(f"{format_type}: {len(mismatched)} groups differ, e.g. {mismatched[:3]}")
+        print(f"{format_type:>6}: per-group {legacy_time:8.3f}s  columnar {fast_time:8.3f}s  "
+              f"({legacy_time / fast_time:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
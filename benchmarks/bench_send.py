@@ -0,0 +1,138 @@
+"""Send throughput against a local fake WhatsApp Web page.
+
+Usage:
+    python benchmarks/bench_send.py --groups 10,100,1000 --latency-ms 100 --fail-rate 0.01
+
+For each sheet size, serves benchmarks/fake_whatsapp.py with one chat per
+group, resolves the groups through the chat index and runs
+process_recommendations() (or process_generic_messages() with --type
+generic) on a headless Chrome, exactly as a campaign would. Prints groups per
+minute, p50/p99 time per group and peak Python memory. Needs Chrome and
+ChromeDriver (CHROMEDRIVER_PATH or webdriver_manager) but no network.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.chrome.service import Service
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
+
+from bench_render import make_sheet
+from fake_whatsapp import FakeWhatsApp
+from chat_index import ChatIndex
+from driver_pool import resolve_driver_path, SEARCH_BOX_XPATH
+from pacing import Pacer
+from retry import RetryScheduler
+from whatsapp_utils import process_recommendations, process_generic_messages, count_commands
+
+
+def start_browser(show=False):
+    options = Options()
+    if not show:
+        options.add_argument('--headless=new')
+    options.add_argument('--no-sandbox')
+    options.add_argument(f'--user-data-dir={tempfile.mkdtemp(prefix="bench-chrome-")}')
+    return webdriver.Chrome(service=Service(resolve_driver_path()), options=options)
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def run_size(driver, groups, args):
+    df = make_sheet(groups * args.rows_per_group, groups, seed=groups)
+    names = sorted(df['group_name'].unique())
+    rng = random.Random(groups)
+    chats = [name for name in names if rng.random() >= args.missing_rate]
+
+    fake = FakeWhatsApp(chats, args.latency_ms, args.jitter_ms, args.fail_rate).start()
+    try:
+        driver.get(fake.url)
+        WebDriverWait(driver, 30).until(EC.presence_of_element_located((By.XPATH, SEARCH_BOX_XPATH)))
+
+        # Every chat is rendered at once on the fake page, no scrolling needed
+        index = ChatIndex('bench')
+        index.snapshot(driver, full=False)
+        chat_titles, _ = index.resolve(names)
+
+        stamps = []
+        progress = lambda *args: stamps.append(time.perf_counter())
+        pacer = Pacer(min_gap=args.min_gap)
+        retry = RetryScheduler(base_delay=args.retry_delay)
+        sends_before = len(count_commands(driver).sends)
+
+        tracemalloc.start()
+        started = time.perf_counter()
+        if args.type == 'generic':
+            clients = df[['group_name', 'client_name']].drop_duplicates()
+            results = process_generic_messages(driver, clients, 'Benchmark message\nSecond line', None,
+                                               progress_callback=progress, pacer=pacer,
+                                               chat_titles=chat_titles, retry=retry)
+        else:
+            results = process_recommendations(driver, df, args.format, progress_callback=progress,
+                                              pacer=pacer, chat_titles=chat_titles, retry=retry)
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        fake.stop()
+
+    per_group = [later - earlier for earlier, later in zip([started] + stamps, stamps)]
+    stats = count_commands(driver).summary(since=sends_before)
+    return {
+        'groups': len(names),
+        'sent': len(results['success']),
+        'failed': len(results['failed']),
+        'seconds': elapsed,
+        'per_minute': len(names) * 60 / elapsed if elapsed else 0,
+        'p50': percentile(per_group, 0.5),
+        'p99': percentile(per_group, 0.99),
+        'peak_mb': peak / (1024 * 1024),
+        'commands': stats['avg_commands_per_send']
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--groups', default='10,100,1000',
+                        help='comma-separated sheet sizes in groups, e.g. 10,100,1000,10000')
+    parser.add_argument('--rows-per-group', type=int, default=5)
+    parser.add_argument('--type', choices=['stock', 'generic'], default='stock')
+    parser.add_argument('--format', choices=['simple', 'table'], default='simple')
+    parser.add_argument('--latency-ms', type=int, default=100, help='render latency of each page step')
+    parser.add_argument('--jitter-ms', type=int, default=50)
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='share of sends silently dropped')
+    parser.add_argument('--missing-rate', type=float, default=0.0, help='share of groups without a chat')
+    parser.add_argument('--min-gap', type=float, default=0.0, help='SEND_MIN_GAP for the run')
+    parser.add_argument('--retry-delay', type=float, default=0.5, help='SEND_RETRY_BASE_DELAY for the run')
+    parser.add_argument('--show', action='store_true', help='show the browser instead of running headless')
+    args = parser.parse_args()
+
+    driver = start_browser(args.show)
+    try:
+        print(f"{'groups':>7} {'sent':>6} {'failed':>6} {'seconds':>9} {'groups/min':>10} "
+              f"{'p50 s':>7} {'p99 s':>7} {'peak MB':>8} {'cmds/send':>9}")
+        for size in [int(value) for value in args.groups.split(',')]:
+            row = run_size(driver, size, args)
+            print(f"{row['groups']:>7} {row['sent']:>6} {row['failed']:>6} {row['seconds']:>9.1f} "
+                  f"{row['per_minute']:>10.1f} {row['p50']:>7.3f} {row['p99']:>7.3f} "
+                  f"{row['peak_mb']:>8.1f} {row['commands']:>9}")
+    finally:
+        driver.quit()
+
+
+if __name__ == '__main__':
+    main()
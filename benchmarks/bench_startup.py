@@ -0,0 +1,73 @@
+"""Cold start cost of the app: import time, memory and heavy modules loaded.
+
+Usage:
+    python benchmarks/bench_startup.py --runs 5
+
+Each run is a fresh interpreter, like a new gunicorn worker. Measures
+`import app`, `import init_db` and `import app` followed by a GET of the
+login page, and prints the median wall time, the resident memory (VmRSS) of
+the process afterwards and which of pandas, numpy, openpyxl, selenium and
+webdriver_manager got imported. None of them should be needed for these
+paths; they load with the first upload or campaign.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ['pandas', 'numpy', 'openpyxl', 'selenium', 'webdriver_manager']
+
+SCENARIOS = {
+    'import app': "import app",
+    'import init_db': "import init_db",
+    'login page': "import app\nclient = app.app.test_client()\nclient.get('/login')"
+}
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+{code}
+elapsed = time.perf_counter() - started
+rss_kb = 0
+try:
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                rss_kb = int(line.split()[1])
+except OSError:
+    import resource
+    rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({{'seconds': elapsed, 'rss_kb': rss_kb,
+                  'heavy': [name for name in {heavy!r} if name in sys.modules]}}))
+"""
+
+
+def run_once(code):
+    env = dict(os.environ, PREWARM_DRIVERS='', PRELOAD_MODULES='')
+    script = PROBE.format(code=code, heavy=HEAVY_MODULES)
+    output = subprocess.run([sys.executable, '-c', script], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    # The app prints while importing; the measurement is the last line
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5, help='fresh interpreters per scenario')
+    args = parser.parse_args()
+
+    print(f"{'scenario':<16} {'median s':>9} {'max s':>7} {'RSS MB':>7}  heavy modules loaded")
+    for name, code in SCENARIOS.items():
+        runs = [run_once(code) for _ in range(args.runs)]
+        seconds = [run['seconds'] for run in runs]
+        rss_mb = statistics.median(run['rss_kb'] for run in runs) / 1024
+        heavy = ', '.join(runs[-1]['heavy']) or '-'
+        print(f"{name:<16} {statistics.median(seconds):>9.3f} {max(seconds):>7.3f} {rss_mb:>7.1f}  {heavy}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+"""A local stand-in for WhatsApp Web, for benchmarking the send path offline.
+
+Usage:
+    python benchmarks/fake_whatsapp.py --groups 100 --latency-ms 150
+
+The page has just the DOM the senders rely on: the chat search box
+(div[contenteditable][data-tab='3']), a #pane-side chat list of
+span[title] rows, a chat header, the compose box (data-tab='10'), the send
+icon (span[data-icon='send']), outgoing message bubbles and the status icon of
+each chat's last message in the chat list (msg-time, then msg-check, then
+msg-dblcheck). Search results, opening a chat and the send confirmation each
+render after a configurable latency, and a configurable share of sends is
+silently dropped (no bubble appears and the chat stays on msg-time), which
+is how a throttled or flaky session looks to the sender.
+"""
+import argparse
+import json
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+PAGE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>WhatsApp</title>
+<style>
+body { margin: 0; font-family: sans-serif; display: flex; height: 100vh; }
+#side { width: 340px; display: flex; flex-direction: column; border-right: 1px solid #ccc; }
+#side [data-tab='3'] { border: 1px solid #999; margin: 8px; min-height: 20px; padding: 4px; }
+#pane-side { flex: 1; overflow-y: auto; }
+#pane-side [role='listitem'] { padding: 4px 8px; cursor: pointer; }
+#main { flex: 1; display: flex; flex-direction: column; }
+#main header { padding: 8px; border-bottom: 1px solid #ccc; }
+#messages { flex: 1; overflow-y: auto; }
+.message-out { white-space: pre-wrap; margin: 4px; padding: 4px; background: #dcf8c6; }
+footer { display: flex; padding: 8px; }
+footer [data-tab='10'] { flex: 1; border: 1px solid #999; min-height: 20px; white-space: pre-wrap; }
+span[data-icon='send'] { display: inline-block; width: 40px; height: 24px; background: #25d366; }
+</style>
+</head>
+<body>
+<div id="side">
+  <div contenteditable="true" data-tab="3" role="textbox"></div>
+  <div id="pane-side"></div>
+</div>
+<div id="app-main"></div>
+<script>
+const CONFIG = __CONFIG__;
+let sent = 0;
+const statuses = {};
+const later = (fn) => setTimeout(fn, CONFIG.latency_ms + Math.random() * CONFIG.jitter_ms);
+const pane = document.getElementById('pane-side');
+const search = document.querySelector("#side [data-tab='3']");
+
+function renderChats(filter) {
+  pane.innerHTML = '';
+  const needle = filter.trim().toLowerCase();
+  for (const title of CONFIG.chats) {
+    if (needle && !title.toLowerCase().includes(needle)) { continue; }
+    const row = document.createElement('div');
+    row.setAttribute('role', 'listitem');
+    const span = document.createElement('span');
+    span.setAttribute('title', title);
+    span.textContent = title;
+    row.appendChild(span);
+    if (statuses[title]) {
+      const icon = document.createElement('span');
+      icon.setAttribute('data-icon', statuses[title]);
+      row.appendChild(icon);
+    }
+    row.addEventListener('click', () => later(() => openChat(title)));
+    pane.appendChild(row);
+  }
+}
+
+// Status icon of a chat's last message, in the chat list
+function setStatus(title, icon) {
+  statuses[title] = icon;
+  for (const span of pane.querySelectorAll('span[title]')) {
+    if (span.getAttribute('title') !== title) { continue; }
+    let status = span.parentElement.querySelector('span[data-icon]');
+    if (!status) {
+      status = document.createElement('span');
+      span.parentElement.appendChild(status);
+    }
+    status.setAttribute('data-icon', icon);
+  }
+}
+
+function selectAllOnShortcut(box) {
+  box.addEventListener('keydown', (e) => {
+    if ((e.metaKey || e.ctrlKey) && e.key.toLowerCase() === 'a') {
+      e.preventDefault();
+      const range = document.createRange();
+      range.selectNodeContents(box);
+      const selection = window.getSelection();
+      selection.removeAllRanges();
+      selection.addRange(range);
+    }
+  });
+}
+
+function openChat(title) {
+  const main = document.getElementById('app-main');
+  main.innerHTML = '';
+  const chat = document.createElement('div');
+  chat.id = 'main';
+  const header = document.createElement('header');
+  const name = document.createElement('span');
+  name.setAttribute('title', title);
+  name.textContent = title;
+  header.appendChild(name);
+  const messages = document.createElement('div');
+  messages.id = 'messages';
+  const footer = document.createElement('footer');
+  const box = document.createElement('div');
+  box.setAttribute('contenteditable', 'true');
+  box.setAttribute('data-tab', '10');
+  box.setAttribute('role', 'textbox');
+  selectAllOnShortcut(box);
+  box.addEventListener('paste', (e) => {
+    e.preventDefault();
+    document.execCommand('insertText', false, e.clipboardData.getData('text/plain'));
+  });
+  box.addEventListener('input', () => toggleSend());
+  const sendSlot = document.createElement('div');
+  footer.appendChild(box);
+  footer.appendChild(sendSlot);
+  chat.appendChild(header);
+  chat.appendChild(messages);
+  chat.appendChild(footer);
+  main.appendChild(chat);
+
+  // The send icon only exists while there is something to send
+  function toggleSend() {
+    const hasText = box.innerText.trim().length > 0;
+    const icon = sendSlot.querySelector("span[data-icon='send']");
+    if (hasText && !icon) {
+      const send = document.createElement('span');
+      send.setAttribute('data-icon', 'send');
+      send.addEventListener('click', () => {
+        const text = box.innerText;
+        box.innerHTML = '';
+        toggleSend();
+        setStatus(title, 'msg-time');
+        if (Math.random() < CONFIG.fail_rate) { return; }
+        later(() => {
+          const bubble = document.createElement('div');
+          bubble.className = 'message-out';
+          bubble.textContent = text;
+          messages.appendChild(bubble);
+          sent += 1;
+          setStatus(title, 'msg-check');
+          later(() => setStatus(title, 'msg-dblcheck'));
+        });
+      });
+      sendSlot.appendChild(send);
+    } else if (!hasText && icon) {
+      icon.remove();
+    }
+  }
+}
+
+selectAllOnShortcut(search);
+search.addEventListener('input', () => {
+  const text = search.innerText;
+  later(() => { if (search.innerText === text) { renderChats(text); } });
+});
+renderChats('');
+</script>
+</body>
+</html>
+"""
+
+
+class FakeWhatsApp:
+    """Serves the stand-in page on localhost from a background thread."""
+
+    def __init__(self, chats, latency_ms=100, jitter_ms=50, fail_rate=0.0, port=0):
+        self.config = {
+            'chats': list(chats),
+            'latency_ms': latency_ms,
+            'jitter_ms': jitter_ms,
+            'fail_rate': fail_rate
+        }
+        page = PAGE.replace('__CONFIG__', json.dumps(self.config)).encode('utf-8')
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(page)))
+                self.end_headers()
+                self.wfile.write(page)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}/'
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name='fake-whatsapp', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--groups', type=int, default=100)
+    parser.add_argument('--latency-ms', type=int, default=100)
+    parser.add_argument('--jitter-ms', type=int, default=50)
+    parser.add_argument('--fail-rate', type=float, default=0.0)
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    chats = [f"Client Group {i}" for i in range(args.groups)]
+    fake = FakeWhatsApp(chats, args.latency_ms, args.jitter_ms, args.fail_rate, args.port).start()
+    print(f"Serving a fake WhatsApp Web with {len(chats)} chats at {fake.url} (Ctrl+C to stop)")
+    try:
+        fake._thread.join()
+    except KeyboardInterrupt:
+        fake.stop()
+
+
+if __name__ == '__main__':
+    main()
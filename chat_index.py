@@ -0,0 +1,134 @@
+"""Chat list snapshot and exact group-name resolution.
+
+The chat list of a session is captured once (scrolling the whole side pane in
+a single script call) and kept as normalized name -> chat title. Group names
+from the sheet are resolved against it before a campaign starts, so each send
+can open its chat directly and names that do not exist, or match several
+chats, are known up front instead of failing one by one.
+"""
+import os
+import unicodedata
+from datetime import datetime, timedelta
+
+from metrics import phase
+
+GROUP_NOT_FOUND = 'Group not found in chat list'
+GROUP_AMBIGUOUS = 'Ambiguous group name, matches {count} chats'
+
+# Scrolls #pane-side from top to bottom and returns the title of every chat
+# row it renders on the way. With arguments[0] false only the rows currently
+# rendered are read, which is enough to pick up recently active chats.
+SNAPSHOT_CHAT_LIST_JS = """
+const full = arguments[0], done = arguments[arguments.length - 1];
+const pane = document.querySelector('#pane-side');
+if (!pane) { done(null); return; }
+const titles = new Set();
+const collect = () => pane.querySelectorAll("[role='listitem'], [role='row']").forEach(row => {
+    const span = row.querySelector('span[title]');
+    if (span && span.getAttribute('title')) { titles.add(span.getAttribute('title')); }
+});
+collect();
+if (!full) { done(Array.from(titles)); return; }
+pane.scrollTop = 0;
+let last = -1;
+const step = () => {
+    collect();
+    if (pane.scrollTop === last || pane.scrollTop + pane.clientHeight >= pane.scrollHeight) {
+        pane.scrollTop = 0;
+        done(Array.from(titles));
+        return;
+    }
+    last = pane.scrollTop;
+    pane.scrollTop += Math.floor(pane.clientHeight * 0.8);
+    setTimeout(step, 150);
+};
+setTimeout(step, 150);
+"""
+
+
+def normalize_name(name):
+    """Canonical form used to match sheet names against chat titles."""
+    return ' '.join(unicodedata.normalize('NFKC', str(name)).casefold().split())
+
+
+class ChatIndex:
+    """Normalized group name -> exact chat title for one WhatsApp session.
+
+    `load(session_key)` returns (title, last_seen) pairs and
+    `save(session_key, titles, seen_at)` upserts them; both are optional so
+    the index also works purely in memory.
+    """
+
+    def __init__(self, session_key, load=None, save=None, max_age=None):
+        self.session_key = session_key
+        self._save = save
+        self.max_age = timedelta(hours=float(max_age if max_age is not None else os.getenv('CHAT_INDEX_MAX_AGE_HOURS', '24')))
+        self.titles = {}
+        self.by_name = {}
+        self.refreshed_at = None
+        if load is not None:
+            for title, last_seen in load(session_key):
+                self._add(title, last_seen)
+            if self.titles:
+                self.refreshed_at = max(self.titles.values())
+
+    def _add(self, title, seen_at):
+        self.titles[title] = seen_at
+        self.by_name.setdefault(normalize_name(title), set()).add(title)
+
+    @property
+    def is_stale(self):
+        return self.refreshed_at is None or datetime.now() - self.refreshed_at > self.max_age
+
+    def snapshot(self, driver, full=True):
+        """Read the chat list and merge it into the index; returns new titles."""
+        previous_timeout = None
+        if full:
+            # Scrolling a long chat list can take a while; other scripts
+            # should still fail fast afterwards
+            previous_timeout = driver.timeouts.script
+            driver.set_script_timeout(300)
+        try:
+            with phase('chat_list_snapshot'):
+                titles = driver.execute_async_script(SNAPSHOT_CHAT_LIST_JS, full)
+        finally:
+            if previous_timeout is not None:
+                driver.set_script_timeout(previous_timeout)
+        if titles is None:
+            raise RuntimeError('Chat list not found on the WhatsApp page')
+
+        seen_at = datetime.now()
+        new_titles = [title for title in titles if title not in self.titles]
+        for title in titles:
+            self._add(title, seen_at)
+        if self._save is not None and titles:
+            self._save(self.session_key, titles, seen_at)
+        if full:
+            self.refreshed_at = seen_at
+        print(f"Chat list snapshot: {len(titles)} chats read, {len(new_titles)} new")
+        return new_titles
+
+    def resolve(self, names):
+        """Split names into ({name: title}, {name: reason}) without touching the page."""
+        resolved = {}
+        unresolved = {}
+        for name in names:
+            titles = self.by_name.get(normalize_name(name), set())
+            if len(titles) == 1:
+                resolved[name] = next(iter(titles))
+            elif titles:
+                unresolved[name] = GROUP_AMBIGUOUS.format(count=len(titles))
+            else:
+                unresolved[name] = GROUP_NOT_FOUND
+        return resolved, unresolved
+
+    def prepare(self, driver, names):
+        """Refresh as little as possible and resolve every name for a campaign."""
+        full = self.is_stale
+        self.snapshot(driver, full=full)
+        resolved, unresolved = self.resolve(names)
+        if unresolved and not full:
+            # Something may have been renamed or scrolled out; one full pass
+            self.snapshot(driver, full=True)
+            resolved, unresolved = self.resolve(names)
+        return resolved, unresolved
@@ -0,0 +1,144 @@
+"""Send confirmation from the chat list.
+
+The chat list shows the status of each chat's last message: a clock while
+it is pending, one tick once WhatsApp's server has it, two ticks once it is
+delivered. Instead of waiting in every chat for its message bubble, the
+sender moves on to the next group and a ConfirmationTracker reads those
+icons for the chats it sent to a few groups back, all in one script call.
+
+A message still showing the clock SEND_CONFIRM_TIMEOUT seconds after it was
+sent is reported as stuck, so the group is failed and a resume of the
+campaign sends it again. One whose chat row cannot be seen (scrolled away,
+or someone replied since) is reported as unconfirmed and counts as sent.
+SEND_CONFIRM=bubble waits for each bubble instead, as before.
+"""
+import os
+import time
+
+CONFIRM_PENDING = 'pending'
+CONFIRM_SENT = 'sent'
+CONFIRM_DELIVERED = 'delivered'
+CONFIRM_UNCONFIRMED = 'unconfirmed'
+
+# {title: data-icon of the row's message status, or null} for the chat-list
+# rows among arguments[0] that are rendered right now
+CHAT_STATUS_JS = """
+const wanted = new Set(arguments[0]), statuses = {};
+for (const span of document.querySelectorAll('#pane-side span[title]')) {
+    const title = span.getAttribute('title');
+    if (!wanted.has(title) || title in statuses) { continue; }
+    const row = span.closest("[role='listitem']") || span.parentElement;
+    const icon = row.querySelector("span[data-icon$='-time'], span[data-icon$='check'], span[data-icon*='dblcheck']");
+    statuses[title] = icon ? icon.getAttribute('data-icon') : null;
+}
+return statuses;
+"""
+
+
+def icon_status(icon):
+    """CONFIRM_* for a status icon name (msg-time, msg-check, msg-dblcheck...)."""
+    if not icon:
+        return None
+    if 'dblcheck' in icon:
+        return CONFIRM_DELIVERED
+    if icon.endswith('check'):
+        return CONFIRM_SENT
+    if icon.endswith('-time'):
+        return CONFIRM_PENDING
+    return None
+
+
+class StuckPendingError(Exception):
+    """A sent message never left the pending state.
+
+    Not retried within the campaign: it may still go out on its own, so it
+    is left to a resume.
+    """
+    retryable = False
+
+
+class ConfirmationTracker:
+    """Confirms sent messages from the chat list while the sender moves on.
+
+    on_settled(context, confirmation) is called exactly once per tracked
+    send, with CONFIRM_SENT, CONFIRM_DELIVERED, CONFIRM_UNCONFIRMED or, for a
+    stuck message, CONFIRM_PENDING.
+    """
+
+    def __init__(self, driver, on_settled, lag=None, timeout=None, poll=1.0, enabled=None,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.driver = driver
+        self.on_settled = on_settled
+        self.lag = int(lag if lag is not None else os.getenv('SEND_CONFIRM_LAG', '3'))
+        self.timeout = float(timeout if timeout is not None else os.getenv('SEND_CONFIRM_TIMEOUT', '30'))
+        self.poll = poll
+        self.enabled = os.getenv('SEND_CONFIRM', 'chat_list') != 'bubble' if enabled is None else enabled
+        self.clock = clock
+        self.sleep = sleep
+        # [chat title, sent at, context, status last seen]
+        self._entries = []
+
+    @property
+    def pending(self):
+        return len(self._entries)
+
+    def track(self, chat_title, context):
+        """Follow a message just sent to `chat_title`."""
+        if not self.enabled or chat_title is None:
+            self.on_settled(context, CONFIRM_UNCONFIRMED)
+            return
+        self._entries.append([chat_title, self.clock(), context, None])
+
+    def _settle(self, entry, confirmation):
+        self._entries.remove(entry)
+        try:
+            self.on_settled(entry[2], confirmation)
+        except Exception as e:
+            print(f"Error recording confirmation: {str(e)}")
+
+    def check(self, final=False):
+        """Read the chat list once and settle what it shows. Only sends at
+        least `lag` behind the latest are looked at, unless `final`.
+        Returns how many of those chats were not in the list."""
+        entries = list(self._entries if final or not self.lag else self._entries[:-self.lag])
+        if not entries:
+            return 0
+        try:
+            icons = self.driver.execute_script(CHAT_STATUS_JS, sorted({entry[0] for entry in entries})) or {}
+        except Exception as e:
+            print(f"Error reading message statuses: {str(e)}")
+            icons = {}
+
+        now = self.clock()
+        missing = 0
+        for entry in entries:
+            chat_title, sent_at, _, _ = entry
+            if chat_title not in icons:
+                missing += 1
+            else:
+                entry[3] = icon_status(icons[chat_title])
+            if entry[3] in (CONFIRM_SENT, CONFIRM_DELIVERED):
+                self._settle(entry, entry[3])
+            elif now - sent_at >= self.timeout:
+                self._settle(entry, CONFIRM_PENDING if entry[3] == CONFIRM_PENDING else CONFIRM_UNCONFIRMED)
+        return missing
+
+    def finish(self, reveal=None):
+        """Settle every remaining send, waiting up to the timeout for each.
+
+        reveal() is called once if some chats are not in the list, e.g. to
+        clear a search that filtered it.
+        """
+        revealed = reveal is None
+        while self._entries:
+            missing = self.check(final=True)
+            if not self._entries:
+                break
+            if missing and not revealed:
+                revealed = True
+                try:
+                    reveal()
+                except Exception as e:
+                    print(f"Error revealing the chat list: {str(e)}")
+                continue
+            self.sleep(self.poll)
@@ -0,0 +1,269 @@
+"""Long-lived WhatsApp Web browser sessions.
+
+Starting Chrome, loading WhatsApp Web and scanning the QR code is by far the
+most expensive part of a campaign, so sessions are kept open between jobs.
+Each session uses its own persistent Chrome profile (--user-data-dir), which
+keeps it logged in across restarts of the app.
+
+Selenium and webdriver_manager are imported when the first browser starts,
+so importing this module (and the app) stays cheap.
+"""
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+from metrics import phase
+
+WHATSAPP_URL = 'https://web.whatsapp.com'
+SEARCH_BOX_XPATH = "//div[@contenteditable='true'][@data-tab='3']"
+
+_driver_path = None
+_driver_path_lock = threading.Lock()
+
+
+def resolve_driver_path():
+    """Return the ChromeDriver path, installing it only on the first call."""
+    global _driver_path
+    with _driver_path_lock:
+        if _driver_path:
+            return _driver_path
+
+        # An explicit path skips webdriver_manager entirely
+        path = os.getenv('CHROMEDRIVER_PATH')
+        if not path:
+            from webdriver_manager.chrome import ChromeDriverManager
+            from webdriver_manager.core.os_manager import ChromeType
+            with phase('driver_install'):
+                try:
+                    path = ChromeDriverManager(chrome_type=ChromeType.CHROMIUM).install()
+                except Exception as e:
+                    print(f"Chromium driver install failed: {str(e)}")
+                    path = ChromeDriverManager(chrome_type=ChromeType.GOOGLE).install()
+
+        print(f"Using ChromeDriver at {path}")
+        _driver_path = path
+        return _driver_path
+
+
+class BrowserSession:
+    """One Chrome instance logged in to WhatsApp Web."""
+
+    def __init__(self, session_id, profile_dir):
+        self.id = session_id
+        self.profile_dir = profile_dir
+        self.driver = None
+        self.ready = False
+        self.started_at = None
+        self.last_used = None
+
+    def start(self):
+        if os.getenv('WHATSAPP_DRIVER', 'chrome') == 'fake':
+            # In-memory WhatsApp for running without Chrome (see fake_driver.py)
+            from fake_driver import FakeWhatsAppDriver
+            with phase('browser_start'):
+                self.driver = FakeWhatsAppDriver()
+                self.driver.get(WHATSAPP_URL)
+            self.ready = False
+            self.started_at = time.time()
+            print(f"Started fake browser session {self.id}")
+            return
+
+        from selenium import webdriver
+        from selenium.webdriver.chrome.service import Service
+        from selenium.webdriver.chrome.options import Options
+
+        os.makedirs(self.profile_dir, exist_ok=True)
+        chrome_options = Options()
+        chrome_options.add_argument('--start-maximized')
+        chrome_options.add_argument(f'--user-data-dir={os.path.abspath(self.profile_dir)}')
+
+        service = Service(resolve_driver_path())
+        with phase('browser_start'):
+            self.driver = webdriver.Chrome(service=service, options=chrome_options)
+            self.driver.get(WHATSAPP_URL)
+        self.ready = False
+        self.started_at = time.time()
+        print(f"Started browser session {self.id}")
+
+    def wait_until_ready(self, timeout=60):
+        """Block until the WhatsApp search box is visible (i.e. logged in)."""
+        from selenium.webdriver.support.ui import WebDriverWait
+        from selenium.webdriver.support import expected_conditions as EC
+        from selenium.webdriver.common.by import By
+
+        with phase('whatsapp_ready'):
+            WebDriverWait(self.driver, timeout).until(
+                EC.presence_of_element_located((By.XPATH, SEARCH_BOX_XPATH))
+            )
+        self.ready = True
+
+    def is_healthy(self):
+        """Cheap check that the browser is alive and still on a logged-in WhatsApp page."""
+        if self.driver is None:
+            return False
+        from selenium.webdriver.common.by import By
+        try:
+            if not self.driver.current_url.startswith(WHATSAPP_URL):
+                return False
+            return bool(self.driver.find_elements(By.XPATH, SEARCH_BOX_XPATH))
+        except Exception as e:
+            print(f"Session {self.id} failed health check: {str(e)}")
+            return False
+
+    def quit(self):
+        try:
+            if self.driver is not None:
+                self.driver.quit()
+        except Exception as e:
+            print(f"Error closing session {self.id}: {str(e)}")
+        self.driver = None
+        self.ready = False
+
+    def restart(self):
+        self.quit()
+        self.start()
+
+
+class DriverPool:
+    """Hands out ready browser sessions to campaigns and takes them back.
+
+    Sessions are created lazily (or up front with warm()), health-checked on
+    every checkout and checkin, and restarted when a check fails.
+    """
+
+    def __init__(self, size=1, profile_root='chrome_profiles', ready_timeout=60):
+        self.size = size
+        self.profile_root = profile_root
+        self.ready_timeout = ready_timeout
+        self.sessions = [
+            BrowserSession(i, os.path.join(profile_root, f'session-{i}'))
+            for i in range(size)
+        ]
+        self._idle = queue.Queue()
+        for browser in self.sessions:
+            self._idle.put(browser)
+
+    def warm(self, wait=False):
+        """Start every idle session and wait for WhatsApp in the background."""
+        def warm_session(browser):
+            try:
+                self._prepare(browser)
+                print(f"Session {browser.id} is warm")
+            except Exception as e:
+                print(f"Error warming session {browser.id}: {str(e)}")
+            finally:
+                self._idle.put(browser)
+
+        threads = []
+        while True:
+            try:
+                browser = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            thread = threading.Thread(target=warm_session, args=(browser,), daemon=True)
+            thread.start()
+            threads.append(thread)
+
+        if wait:
+            for thread in threads:
+                thread.join()
+
+    def checkout(self, timeout=None, on_wait=None):
+        """Take an idle session, making sure it is up and logged in.
+
+        on_wait() is called if the session is not ready yet, e.g. because the
+        QR code has to be scanned.
+        """
+        try:
+            browser = self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise RuntimeError('No WhatsApp session available')
+
+        try:
+            self._prepare(browser, on_wait)
+        except Exception:
+            self._idle.put(browser)
+            raise
+        return browser
+
+    def checkout_many(self, count, timeout=None, on_wait=None):
+        """Take up to `count` idle sessions (at least one) and get them all ready.
+
+        Sessions that fail to come up are returned to the pool; an error is
+        only raised if none of them could be prepared.
+        """
+        try:
+            browsers = [self._idle.get(timeout=timeout)]
+        except queue.Empty:
+            raise RuntimeError('No WhatsApp session available')
+        while len(browsers) < count:
+            try:
+                browsers.append(self._idle.get_nowait())
+            except queue.Empty:
+                break
+
+        errors = {}
+
+        def prepare(browser):
+            try:
+                self._prepare(browser, on_wait)
+            except Exception as e:
+                errors[browser.id] = e
+
+        threads = [threading.Thread(target=prepare, args=(browser,), daemon=True) for browser in browsers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        ready = [browser for browser in browsers if browser.id not in errors]
+        for browser in browsers:
+            if browser.id in errors:
+                print(f"Session {browser.id} not ready: {str(errors[browser.id])}")
+                self._idle.put(browser)
+        if not ready:
+            raise next(iter(errors.values()))
+        return ready
+
+    def checkin(self, browser):
+        browser.last_used = time.time()
+        if not browser.is_healthy():
+            print(f"Session {browser.id} unhealthy after job, restarting on next checkout")
+            browser.quit()
+        self._idle.put(browser)
+
+    @contextmanager
+    def session(self, timeout=None, on_wait=None):
+        browser = self.checkout(timeout, on_wait)
+        try:
+            yield browser
+        finally:
+            self.checkin(browser)
+
+    def _prepare(self, browser, on_wait=None):
+        if browser.ready and browser.is_healthy():
+            return
+
+        if browser.driver is None:
+            browser.start()
+        elif not browser.is_healthy():
+            # Reload first; a full restart only if the browser itself is gone
+            try:
+                browser.driver.get(WHATSAPP_URL)
+            except Exception:
+                browser.restart()
+
+        if on_wait is not None and not browser.is_healthy():
+            on_wait()
+
+        try:
+            browser.wait_until_ready(self.ready_timeout)
+        except Exception as e:
+            print(f"Error waiting for WhatsApp: {str(e)}")
+            raise RuntimeError('WhatsApp Web login timeout. Please try again.')
+
+    def shutdown(self):
+        for browser in self.sessions:
+            browser.quit()
@@ -0,0 +1,292 @@
+"""An in-memory stand-in for Chrome on WhatsApp Web.
+
+With WHATSAPP_DRIVER=fake every browser session gets a FakeWhatsAppDriver
+instead of starting Chrome, so the whole send path, the sender daemon
+included, runs on a machine without a browser. It answers exactly the
+WebDriver calls the senders make (the locators and scripts of
+whatsapp_utils, chat_index and confirmation), always looks logged in, and
+keeps what was sent in `sent`, with the pictures attached in `attached`.
+
+- FAKE_WHATSAPP_CHATS - text file with the chat list, one title per line
+- FAKE_WHATSAPP_LATENCY_MS - time each WebDriver command takes (default 0)
+- FAKE_WHATSAPP_DROP_RATE - share of sends silently dropped (default 0): no
+  bubble appears and the chat stays pending, like on a throttled session
+"""
+import itertools
+import os
+import platform
+import random
+import time
+from types import SimpleNamespace
+
+from selenium.common.exceptions import (NoSuchElementException, WebDriverException, InvalidArgumentException,
+                                        StaleElementReferenceException)
+from selenium.webdriver.common.by import By
+from selenium.webdriver.common.keys import Keys
+
+from chat_index import SNAPSHOT_CHAT_LIST_JS
+from confirmation import CHAT_STATUS_JS
+from whatsapp_utils import (SEARCH_BOX_XPATH, MESSAGE_BOX_XPATH, SEND_BUTTON_XPATH, CHAT_HEADER_TITLE_CSS,
+                            OUTGOING_MESSAGE_CSS, PASTE_MESSAGE_JS, FIND_CHAT_JS, ATTACH_BUTTON_XPATH,
+                            IMAGE_INPUT_CSS, CAPTION_BOX_XPATH, MEDIA_SEND_BUTTON_XPATH)
+
+# Like a real browser, only this platform's select-all selects
+SELECT_ALL_KEYS = (Keys.COMMAND if platform.system() == 'Darwin' else Keys.CONTROL) + 'a'
+
+
+def load_chats(path=None):
+    """Chat titles from FAKE_WHATSAPP_CHATS (or `path`), one per line."""
+    path = path or os.getenv('FAKE_WHATSAPP_CHATS')
+    if not path:
+        print("FAKE_WHATSAPP_CHATS is not set, the fake chat list is empty")
+        return []
+    with open(path, encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+class FakeElement:
+    """A node of the fake page: a search, chat, header, compose, send or bubble
+    element, or one of the attach, file, caption and media-send elements."""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, driver, kind, title=None, text=''):
+        self.id = f'fake-{next(self._ids)}'
+        self.kind = kind
+        self.title = title
+        self._driver = driver
+        self._text = text
+
+    @property
+    def text(self):
+        return self._driver.execute('get_text', {'element': self})
+
+    def get_attribute(self, name):
+        return self._driver.execute('get_attribute', {'element': self, 'name': name})
+
+    def click(self):
+        self._driver.execute('click', {'element': self})
+
+    def send_keys(self, *values):
+        self._driver.execute('send_keys', {'element': self, 'text': ''.join(values)})
+
+    def clear(self):
+        self._driver.execute('clear', {'element': self})
+
+    def is_displayed(self):
+        return self._driver.execute('is_displayed', {'element': self})
+
+    def is_enabled(self):
+        return self._driver.execute('is_enabled', {'element': self})
+
+
+class FakeWhatsAppDriver:
+    """Just enough of a Selenium WebDriver on a logged-in WhatsApp Web page.
+
+    Every call goes through execute(), like a WebDriver round trip, so
+    command counting and FAKE_WHATSAPP_LATENCY_MS apply to all of them.
+    """
+
+    def __init__(self, chats=None, latency=None, drop_rate=None):
+        self.chats = list(chats) if chats is not None else load_chats()
+        self.latency = (latency if latency is not None else float(os.getenv('FAKE_WHATSAPP_LATENCY_MS', '0'))) / 1000
+        self.drop_rate = drop_rate if drop_rate is not None else float(os.getenv('FAKE_WHATSAPP_DROP_RATE', '0'))
+        self.sent = []
+        self.closed = False
+        self.script_timeout = 30
+        self._url = None
+        self._search = FakeElement(self, 'search')
+        self._compose = FakeElement(self, 'compose')
+        self._send = FakeElement(self, 'send')
+        self._attach = FakeElement(self, 'attach')
+        self._file = FakeElement(self, 'file')
+        self._caption = FakeElement(self, 'caption')
+        self._media_send = FakeElement(self, 'media-send')
+        self.attached = []
+        self._rows = {title: FakeElement(self, 'chat', title=title) for title in self.chats}
+        self._bubbles = {}
+        self._statuses = {}
+        self._open = None
+        self._selected = False
+        # Attach menu open, and the picture in the media editor
+        self._menu = False
+        self._media = None
+
+    def execute(self, driver_command, params=None):
+        if self.closed:
+            raise WebDriverException('The browser has been closed')
+        if self.latency:
+            time.sleep(self.latency)
+        return getattr(self, f'_{driver_command}')(**(params or {}))
+
+    # The WebDriver API used by the senders
+
+    @property
+    def current_url(self):
+        return self.execute('current_url')
+
+    def get(self, url):
+        self.execute('get', {'url': url})
+
+    def quit(self):
+        self.execute('quit')
+
+    @property
+    def timeouts(self):
+        return self.execute('get_timeouts')
+
+    def set_script_timeout(self, seconds):
+        self.execute('set_script_timeout', {'seconds': seconds})
+
+    def find_element(self, by, value):
+        return self.execute('find_element', {'by': by, 'value': value})
+
+    def find_elements(self, by, value):
+        return self.execute('find_elements', {'by': by, 'value': value})
+
+    def execute_script(self, script, *args):
+        return self.execute('execute_script', {'script': script, 'args': args})
+
+    def execute_async_script(self, script, *args):
+        return self.execute('execute_async_script', {'script': script, 'args': args})
+
+    # What the page does
+
+    def _visible_rows(self):
+        """Chat rows the list shows, narrowed down by the search box."""
+        needle = self._search._text.strip().lower()
+        return [row for title, row in self._rows.items() if not needle or needle in title.lower()]
+
+    def _current_url(self):
+        return self._url
+
+    def _get(self, url):
+        self._url = url
+        self._open = None
+        self._search._text = ''
+        self._compose._text = ''
+        self._menu = False
+        self._media = None
+
+    def _quit(self):
+        self.closed = True
+
+    def _get_timeouts(self):
+        return SimpleNamespace(script=self.script_timeout)
+
+    def _set_script_timeout(self, seconds):
+        self.script_timeout = seconds
+
+    def _find_elements(self, by, value):
+        if self._url is None:
+            return []
+        if by == By.XPATH and value == SEARCH_BOX_XPATH:
+            return [self._search]
+        if by == By.XPATH and value == MESSAGE_BOX_XPATH:
+            return [self._compose] if self._open else []
+        if by == By.XPATH and value == SEND_BUTTON_XPATH:
+            return [self._send] if self._open and self._compose._text.strip() else []
+        if by == By.CSS_SELECTOR and value == CHAT_HEADER_TITLE_CSS:
+            return [FakeElement(self, 'header', title=self._open)] if self._open else []
+        if by == By.CSS_SELECTOR and value == OUTGOING_MESSAGE_CSS:
+            return list(self._bubbles.get(self._open, []))
+        if by == By.XPATH and value == ATTACH_BUTTON_XPATH:
+            return [self._attach] if self._open else []
+        if by == By.CSS_SELECTOR and value == IMAGE_INPUT_CSS:
+            return [self._file] if self._menu else []
+        if by == By.XPATH and value == CAPTION_BOX_XPATH:
+            return [self._caption] if self._media else []
+        if by == By.XPATH and value == MEDIA_SEND_BUTTON_XPATH:
+            return [self._media_send] if self._media else []
+        return []
+
+    def _find_element(self, by, value):
+        elements = self._find_elements(by, value)
+        if not elements:
+            raise NoSuchElementException(f"No element at {by} {value}")
+        return elements[0]
+
+    def _execute_script(self, script, args):
+        if script == FIND_CHAT_JS:
+            return next((row for row in self._visible_rows() if row.title == args[0]), None)
+        if script == CHAT_STATUS_JS:
+            wanted = set(args[0])
+            return {row.title: self._statuses.get(row.title) for row in self._visible_rows() if row.title in wanted}
+        raise WebDriverException('Script not supported by the fake driver')
+
+    def _execute_async_script(self, script, args):
+        if script == SNAPSHOT_CHAT_LIST_JS:
+            return [row.title for row in self._visible_rows()]
+        if script == PASTE_MESSAGE_JS:
+            box, text = args
+            box._text = text
+            return box._text
+        raise WebDriverException('Script not supported by the fake driver')
+
+    def _get_text(self, element):
+        return element.title if element.kind in ('chat', 'header') else element._text
+
+    def _get_attribute(self, element, name):
+        return element.title if name == 'title' else None
+
+    def _is_displayed(self, element):
+        return True
+
+    def _is_enabled(self, element):
+        if element.kind == 'caption' and (element is not self._caption or not self._media):
+            raise StaleElementReferenceException('The media editor has been closed')
+        return True
+
+    def _click(self, element):
+        if element.kind == 'chat':
+            self._open = element.title
+            self._compose._text = ''
+            self._menu = False
+            self._media = None
+        elif element.kind == 'send':
+            self._deliver()
+        elif element.kind == 'attach':
+            self._menu = True
+        elif element.kind == 'media-send':
+            self._deliver_media()
+
+    def _send_keys(self, element, text):
+        if element.kind == 'file':
+            if not os.path.isfile(text):
+                raise InvalidArgumentException(f"File not found : {text}")
+            self._menu = False
+            self._media = text
+            self._caption = FakeElement(self, 'caption')
+            return
+        if text == SELECT_ALL_KEYS:
+            self._selected = True
+            return
+        if text in (Keys.DELETE, Keys.BACKSPACE) and self._selected:
+            element._text = ''
+        elif text == Keys.SHIFT + Keys.ENTER:
+            element._text += '\n'
+        else:
+            element._text += text
+        self._selected = False
+
+    def _clear(self, element):
+        element._text = ''
+
+    def _deliver(self):
+        text, self._compose._text = self._compose._text, ''
+        self._post(text)
+
+    def _deliver_media(self):
+        image, self._media = self._media, None
+        if self._post(self._caption._text):
+            self.attached.append((self._open, image))
+
+    def _post(self, text):
+        """Put a message in the open chat, unless it is dropped."""
+        if random.random() < self.drop_rate:
+            self._statuses[self._open] = 'msg-time'
+            return False
+        self._bubbles.setdefault(self._open, []).append(FakeElement(self, 'bubble', text=text))
+        self._statuses[self._open] = 'msg-dblcheck'
+        self.sent.append((self._open, text))
+        return True
@@ -0,0 +1,121 @@
+"""Streaming ingestion of large CSV/XLSX sheets.
+
+Rows are read incrementally (openpyxl read-only mode for .xlsx, pandas'
+chunked reader for .csv), the header is validated before any data row is
+read, and each chunk is normalized and appended to the staging table. Peak
+memory is one chunk, however long the sheet is.
+"""
+import csv
+import os
+
+import pandas as pd
+from openpyxl import load_workbook
+
+from staging import missing_columns, canonical_renames, kept_columns
+
+CHUNK_ROWS = int(os.getenv('INGEST_CHUNK_ROWS', '5000'))
+# .xlsx files larger than this are streamed instead of read with pd.read_excel
+STREAM_THRESHOLD_BYTES = int(os.getenv('INGEST_STREAM_THRESHOLD_BYTES', str(5 * 1024 * 1024)))
+
+
+class MissingColumnsError(ValueError):
+    """The sheet header lacks required columns."""
+
+    def __init__(self, missing):
+        self.missing = missing
+        super().__init__(f'Missing required columns: {", ".join(missing)}')
+
+
+def should_stream(path):
+    if path.lower().endswith('.csv'):
+        return True
+    return path.lower().endswith('.xlsx') and os.path.getsize(path) > STREAM_THRESHOLD_BYTES
+
+
+def _header_names(values):
+    # Same placeholder names pd.read_excel gives blank header cells
+    return [str(value) if value is not None else f'Unnamed: {i}' for i, value in enumerate(values)]
+
+
+class _WorkbookChunks:
+    """The chunks of an open workbook. close() releases the workbook even if
+    no chunk was read, which closing a generator that never started does not."""
+
+    def __init__(self, workbook, chunks):
+        self.workbook = workbook
+        self.chunks = chunks
+
+    def __iter__(self):
+        return self.chunks
+
+    def close(self):
+        self.chunks.close()
+        self.workbook.close()
+
+
+def _open_xlsx(path, chunk_rows):
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    rows = workbook.active.iter_rows(values_only=True)
+    try:
+        header = _header_names(next(rows))
+    except StopIteration:
+        workbook.close()
+        raise ValueError('The sheet is empty')
+
+    def chunks():
+        try:
+            batch = []
+            for row in rows:
+                if all(value is None for value in row):
+                    continue
+                batch.append(row[:len(header)])
+                if len(batch) >= chunk_rows:
+                    yield pd.DataFrame.from_records(batch, columns=header)
+                    batch = []
+            if batch:
+                yield pd.DataFrame.from_records(batch, columns=header)
+        finally:
+            workbook.close()
+
+    return header, _WorkbookChunks(workbook, chunks())
+
+
+def _open_csv(path, chunk_rows):
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        try:
+            header = next(csv.reader(f))
+        except StopIteration:
+            raise ValueError('The sheet is empty')
+    return header, pd.read_csv(path, chunksize=chunk_rows, encoding='utf-8-sig')
+
+
+def open_sheet(path, chunk_rows=None):
+    """(header, iterator of DataFrame chunks) for a .csv or .xlsx file."""
+    chunk_rows = chunk_rows or CHUNK_ROWS
+    if path.lower().endswith('.csv'):
+        return _open_csv(path, chunk_rows)
+    return _open_xlsx(path, chunk_rows)
+
+
+def stream_to_staging(path, message_type, store, source_name=None, chunk_rows=None, upload_id=None):
+    """Validate the header, then stage the sheet chunk by chunk.
+
+    Returns the upload id. Raises MissingColumnsError straight after the
+    header is read if required columns are missing.
+    """
+    header, chunks = open_sheet(path, chunk_rows)
+    missing = missing_columns(header, message_type)
+    if missing:
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
+        raise MissingColumnsError(missing)
+
+    renames = canonical_renames(header)
+    columns = kept_columns([renames.get(name, name) for name in header], message_type)
+
+    def normalized():
+        for chunk in chunks:
+            yield chunk.rename(columns=renames)[columns]
+
+    return store.stage_chunks(normalized(), message_type, source_name=source_name, upload_id=upload_id)
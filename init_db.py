@@ -1,9 +1,10 @@
-from app import app, db, User
+from app import app, db, User, upgrade_schema
 
 def init_database():
     with app.app_context():
         # Create all tables
         db.create_all()
+        upgrade_schema()
         
         # Check if admin user exists
         admin = User.query.filter_by(username='admin').first()
@@ -0,0 +1,232 @@
+"""Send jobs queued in SQLite, for running the senders in their own process.
+
+With SEND_MODE=daemon the web workers only add campaigns to a SQLite file
+(JOB_QUEUE_DB) and read their status and events back from it, while
+sender_daemon.py owns the browser sessions and runs the jobs. Any number
+of gunicorn workers can then share the queue, and browser memory stays
+in one process no matter how many of them there are.
+
+JobQueue is a JobManager whose jobs live in the database: a QueuedJob
+writes its state together with every event it emits, so the run itself
+is the same code as with the in-memory manager.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from jobs import Job, JobManager, JOB_QUEUED, JOB_RUNNING, JOB_FAILED
+
+JOB_COLUMNS = ('id, kind, payload, owner_id, status, total, done, results, error, '
+               'created_at, started_at, finished_at')
+
+
+def _timestamp(value):
+    return value.isoformat() if value else None
+
+
+def _datetime(value):
+    return datetime.fromisoformat(value) if value else None
+
+
+class QueuedJob(Job):
+    """A Job whose state and events are kept in a JobQueue's database."""
+
+    def __init__(self, store, kind, payload, owner_id=None):
+        super().__init__(kind, payload, owner_id)
+        self._store = store
+
+    def emit(self, event_type, **data):
+        self._store.emit(self, event_type, data)
+
+    def events_after(self, seq, timeout=None):
+        return self._store.events_after(self, seq, timeout)
+
+
+class JobQueue(JobManager):
+    """JobManager backed by a SQLite file shared between processes.
+
+    Web workers only submit() and get(); the process that calls start()
+    (the sender daemon) claims queued jobs, oldest first, and runs them
+    with `runner` on its worker threads. Other processes see new events
+    within `poll` seconds.
+    """
+
+    def __init__(self, path, runner=None, workers=1, keep_finished=100, batch_runner=None, max_batch=10, poll=0.5):
+        super().__init__(runner, workers, keep_finished, batch_runner, max_batch)
+        self.path = path
+        self.poll = poll
+        self._wakeup = threading.Event()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            # Readers (the SSE streams) do not block the writer
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS send_jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    owner_id INTEGER,
+                    status TEXT NOT NULL,
+                    total INTEGER NOT NULL DEFAULT 0,
+                    done INTEGER NOT NULL DEFAULT 0,
+                    results TEXT,
+                    error TEXT,
+                    created_at TEXT NOT NULL,
+                    started_at TEXT,
+                    finished_at TEXT
+                )
+            """)
+            conn.execute('CREATE INDEX IF NOT EXISTS send_jobs_status ON send_jobs (status, created_at)')
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS send_job_events (
+                    job_id TEXT NOT NULL,
+                    seq INTEGER NOT NULL,
+                    type TEXT NOT NULL,
+                    time REAL NOT NULL,
+                    data TEXT NOT NULL,
+                    PRIMARY KEY (job_id, seq)
+                )
+            """)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _save(self, conn, job):
+        conn.execute(
+            'UPDATE send_jobs SET status = ?, total = ?, done = ?, results = ?, error = ?, '
+            'started_at = ?, finished_at = ? WHERE id = ?',
+            (job.status, job.total, job.done, json.dumps(job.results, default=str), job.error,
+             _timestamp(job.started_at), _timestamp(job.finished_at), job.id)
+        )
+
+    def _load(self, row, job=None):
+        job_id, kind, payload, owner_id, status, total, done, results, error, created_at, started_at, finished_at = row
+        if job is None:
+            job = QueuedJob(self, kind, json.loads(payload), owner_id)
+            job.id = job_id
+            job.created_at = _datetime(created_at)
+        job.status = status
+        job.total = total
+        job.done = done
+        job.results = json.loads(results) if results else None
+        job.error = error
+        job.started_at = _datetime(started_at)
+        job.finished_at = _datetime(finished_at)
+        return job
+
+    def _select(self, conn, where, params):
+        return conn.execute(f'SELECT {JOB_COLUMNS} FROM send_jobs WHERE {where}', params).fetchone()
+
+    def submit(self, kind, payload, owner_id=None):
+        job = QueuedJob(self, kind, payload, owner_id)
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                'INSERT INTO send_jobs (id, kind, payload, owner_id, status, created_at) VALUES (?, ?, ?, ?, ?, ?)',
+                (job.id, kind, json.dumps(payload), owner_id, job.status, _timestamp(job.created_at))
+            )
+            position = conn.execute('SELECT COUNT(*) FROM send_jobs WHERE status = ?', (JOB_QUEUED,)).fetchone()[0]
+        job.emit('queued', position=position)
+        # Wakes this process's workers; a daemon elsewhere polls
+        self._wakeup.set()
+        return job
+
+    def get(self, job_id):
+        with self._connect() as conn:
+            row = self._select(conn, 'id = ?', (job_id,))
+        return self._load(row) if row is not None else None
+
+    def emit(self, job, event_type, data):
+        """Store the job's current state and a new event in one transaction."""
+        event = {'type': event_type, 'time': time.time()}
+        event.update(data)
+        with self._lock, self._connect() as conn:
+            self._save(conn, job)
+            conn.execute(
+                'INSERT INTO send_job_events (job_id, seq, type, time, data) '
+                'SELECT ?, COALESCE(MAX(seq), 0) + 1, ?, ?, ? FROM send_job_events WHERE job_id = ?',
+                (job.id, event_type, event['time'], json.dumps(data, default=str), job.id)
+            )
+
+    def events_after(self, job, seq, timeout=None):
+        """Events of `job` newer than `seq`, polling up to `timeout` seconds
+        for one. Also refreshes the job's state from the database."""
+        deadline = time.monotonic() + (timeout or 0)
+        while True:
+            with self._connect() as conn:
+                rows = conn.execute(
+                    'SELECT seq, type, time, data FROM send_job_events WHERE job_id = ? AND seq > ? ORDER BY seq',
+                    (job.id, seq)
+                ).fetchall()
+                row = self._select(conn, 'id = ?', (job.id,))
+            if row is not None:
+                self._load(row, job)
+            if rows or job.is_done or time.monotonic() >= deadline:
+                break
+            time.sleep(self.poll)
+
+        events = []
+        for event_seq, event_type, event_time, data in rows:
+            event = {'seq': event_seq, 'type': event_type, 'time': event_time}
+            event.update(json.loads(data))
+            events.append(event)
+        return events
+
+    def _claim(self, limit=1):
+        """Mark up to `limit` of the oldest queued jobs as running and return them."""
+        with self._lock, self._connect() as conn:
+            # Taken and marked in one write transaction
+            conn.execute('BEGIN IMMEDIATE')
+            rows = conn.execute(
+                f'SELECT {JOB_COLUMNS} FROM send_jobs WHERE status = ? ORDER BY created_at, rowid LIMIT ?',
+                (JOB_QUEUED, limit)
+            ).fetchall()
+            conn.executemany('UPDATE send_jobs SET status = ? WHERE id = ?', [(JOB_RUNNING, row[0]) for row in rows])
+        return [self._load(row) for row in rows]
+
+    def _work(self):
+        while True:
+            jobs = self._claim(self.max_batch if self.batch_runner is not None else 1)
+            if not jobs:
+                self._wakeup.wait(self.poll)
+                self._wakeup.clear()
+                continue
+            if len(jobs) > 1:
+                self._run_batch(jobs)
+            else:
+                self._run(jobs[0])
+
+    def _retire(self, job):
+        with self._lock, self._connect() as conn:
+            stale = [row[0] for row in conn.execute(
+                'SELECT id FROM send_jobs WHERE finished_at IS NOT NULL ORDER BY finished_at DESC LIMIT -1 OFFSET ?',
+                (self.keep_finished,)
+            )]
+            for job_id in stale:
+                conn.execute('DELETE FROM send_job_events WHERE job_id = ?', (job_id,))
+                conn.execute('DELETE FROM send_jobs WHERE id = ?', (job_id,))
+
+    def recover(self):
+        """Fail the jobs a previous run left running; their campaigns can be
+        resumed. Only call this with no other process running jobs."""
+        with self._connect() as conn:
+            rows = [self._select(conn, 'id = ?', (job_id,)) for job_id, in conn.execute(
+                'SELECT id FROM send_jobs WHERE status = ?', (JOB_RUNNING,)
+            ).fetchall()]
+        for row in rows:
+            job = self._load(row)
+            print(f"Job {job.id} was interrupted, marking it failed")
+            job.status = JOB_FAILED
+            job.error = 'The sender stopped while this job was running'
+            job.finished_at = datetime.now()
+            job.emit(job.status, results=None, error=job.error)
+        return len(rows)
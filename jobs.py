@@ -0,0 +1,179 @@
+"""Background send jobs.
+
+/send_messages only queues a job here and returns its id. A worker thread runs
+the campaign and records progress events that the status and SSE endpoints
+read back.
+"""
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_FINISHED = 'finished'
+JOB_FAILED = 'failed'
+
+
+class Job:
+    """A single queued campaign and its progress events."""
+
+    def __init__(self, kind, payload, owner_id=None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.payload = payload
+        self.owner_id = owner_id
+        self.status = JOB_QUEUED
+        self.total = 0
+        self.done = 0
+        self.results = None
+        self.error = None
+        self.created_at = datetime.now()
+        self.started_at = None
+        self.finished_at = None
+        self._events = []
+        self._cond = threading.Condition()
+
+    @property
+    def is_done(self):
+        return self.status in (JOB_FINISHED, JOB_FAILED)
+
+    def emit(self, event_type, **data):
+        """Record an event and wake up anyone streaming this job."""
+        with self._cond:
+            event = {'seq': len(self._events) + 1, 'type': event_type, 'time': time.time()}
+            event.update(data)
+            self._events.append(event)
+            self._cond.notify_all()
+
+    def events_after(self, seq, timeout=None):
+        """Return events newer than `seq`, waiting up to `timeout` seconds for one."""
+        with self._cond:
+            if len(self._events) <= seq and not self.is_done and timeout:
+                self._cond.wait(timeout)
+            return list(self._events[seq:])
+
+    def progress(self, index, total, group_name, status, error=None):
+        """Progress callback handed to process_recommendations/process_generic_messages."""
+        self.total = total
+        self.done = index
+        self.emit('progress', index=index, total=total, group=group_name, status=status, error=error)
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'type': self.kind,
+            'status': self.status,
+            'total': self.total,
+            'done': self.done,
+            'error': self.error,
+            'results': self.results,
+            'created_at': self.created_at.isoformat(),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+class JobManager:
+    """Runs queued jobs on a small pool of worker threads.
+
+    `runner` is called with the Job and must return the results dict. Only
+    the most recent `keep_finished` completed jobs are kept in memory.
+
+    With a `batch_runner`, a worker that finds several jobs queued takes
+    them all (up to `max_batch`) and calls batch_runner(jobs) once; it
+    returns {job id: results dict, or the exception that failed the job}.
+    """
+
+    def __init__(self, runner, workers=1, keep_finished=100, batch_runner=None, max_batch=10):
+        self.runner = runner
+        self.workers = workers
+        self.keep_finished = keep_finished
+        self.batch_runner = batch_runner
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._jobs = {}
+        self._finished = []
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f'send-worker-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, kind, payload, owner_id=None):
+        job = Job(kind, payload, owner_id)
+        with self._lock:
+            self._jobs[job.id] = job
+        job.emit('queued', position=self._queue.qsize() + 1)
+        self._queue.put(job)
+        self.start()
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _work(self):
+        while True:
+            jobs = [self._queue.get()]
+            while self.batch_runner is not None and len(jobs) < self.max_batch:
+                try:
+                    jobs.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                if len(jobs) > 1:
+                    self._run_batch(jobs)
+                else:
+                    self._run(jobs[0])
+            finally:
+                for _ in jobs:
+                    self._queue.task_done()
+
+    def _start(self, job):
+        job.status = JOB_RUNNING
+        job.started_at = datetime.now()
+        job.emit('started')
+
+    def _finish(self, job, outcome):
+        if isinstance(outcome, Exception):
+            print(f"Job {job.id} failed: {str(outcome)}")
+            job.error = str(outcome)
+            job.status = JOB_FAILED
+        else:
+            job.results = outcome
+            job.status = JOB_FINISHED
+        job.finished_at = datetime.now()
+        job.emit(job.status, results=job.results, error=job.error)
+        self._retire(job)
+
+    def _run(self, job):
+        self._start(job)
+        try:
+            outcome = self.runner(job)
+        except Exception as e:
+            outcome = e
+        self._finish(job, outcome)
+
+    def _run_batch(self, jobs):
+        for job in jobs:
+            self._start(job)
+        try:
+            outcomes = self.batch_runner(jobs)
+        except Exception as e:
+            outcomes = {job.id: e for job in jobs}
+        for job in jobs:
+            self._finish(job, outcomes.get(job.id, RuntimeError('No result for this job')))
+
+    def _retire(self, job):
+        with self._lock:
+            self._finished.append(job.id)
+            while len(self._finished) > self.keep_finished:
+                self._jobs.pop(self._finished.pop(0), None)
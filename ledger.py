@@ -0,0 +1,91 @@
+"""Batched writes to the per-group send ledger.
+
+The send loop only appends to an in-memory buffer; a background thread
+flushes it to the database every `batch_size` records or `interval`
+seconds, whichever comes first, so the ledger costs the loop next to
+nothing while still surviving a crash with at most one batch lost.
+"""
+import hashlib
+import os
+import threading
+from datetime import datetime
+
+LEDGER_PENDING = 'pending'
+LEDGER_DELIVERED = 'delivered'
+LEDGER_FAILED = 'failed'
+# Not sent because the group's message matched its last delivered one
+LEDGER_UNCHANGED = 'unchanged'
+# Statuses that need no further send
+LEDGER_DONE = (LEDGER_DELIVERED, LEDGER_UNCHANGED)
+
+
+def message_hash(message):
+    """Stable fingerprint of a rendered message, and of the table picture
+    sent with it (see table_images.ImageMessage)."""
+    if message is None:
+        return None
+    digest = hashlib.sha256(message.encode('utf-8'))
+    image = getattr(message, 'image', None)
+    if image is not None:
+        digest.update(image.digest.encode('utf-8'))
+    return digest.hexdigest()
+
+
+class LedgerWriter:
+    """Buffers send outcomes and hands them to `flush_func(records)` in batches.
+
+    Each record is a dict with group_name, status, message_hash, error,
+    attempts (tries it took, including in-campaign retries), confirmation
+    (what the chat list showed for it, see confirmation.py) and at (when the
+    last attempt finished).
+    """
+
+    def __init__(self, flush_func, batch_size=None, interval=None):
+        self.flush_func = flush_func
+        self.batch_size = int(batch_size or os.getenv('LEDGER_BATCH_SIZE', '50'))
+        self.interval = float(interval or os.getenv('LEDGER_FLUSH_INTERVAL', '2.0'))
+        self._buffer = []
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='ledger-writer', daemon=True)
+        self._thread.start()
+
+    def record(self, group_name, message, status, error=None, attempts=1, confirmation=None):
+        with self._cond:
+            self._buffer.append({
+                'group_name': group_name,
+                'status': status,
+                'message_hash': message_hash(message),
+                'error': error,
+                'attempts': attempts,
+                'confirmation': confirmation,
+                'at': datetime.now()
+            })
+            if len(self._buffer) >= self.batch_size:
+                self._cond.notify()
+
+    def _take(self):
+        records, self._buffer = self._buffer, []
+        return records
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._closed and len(self._buffer) < self.batch_size:
+                    self._cond.wait(self.interval)
+                records = self._take()
+                closed = self._closed
+            if records:
+                try:
+                    self.flush_func(records)
+                except Exception as e:
+                    print(f"Error writing send ledger: {str(e)}")
+            if closed:
+                return
+
+    def close(self):
+        """Flush whatever is left and stop the writer thread."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
@@ -0,0 +1,185 @@
+"""Editable message wording.
+
+The text of each message kind (generic, simple and table recommendations, and
+the caption of a table sent as a picture) is a Jinja template, stored in the
+database when it has been edited and taken from DEFAULT_TEMPLATES otherwise;
+the defaults produce exactly the text the app always sent. A campaign
+compiles its template once into a MessageRenderer. Groups whose template
+fields are identical share one rendered string, and compiled templates are
+cached by their text until a template is edited.
+
+Templates render in a sandbox, as their text comes from the web UI. The
+[TEST MODE] markers of test groups are added outside the template.
+
+The columnar helpers in renderer (pandas) are only imported when a
+recommendations message is rendered.
+"""
+import hashlib
+import threading
+
+from jinja2 import meta
+from jinja2.sandbox import SandboxedEnvironment
+
+TEMPLATE_GENERIC = 'generic'
+TEMPLATE_SIMPLE = 'simple'
+TEMPLATE_TABLE = 'table'
+# Caption of the table picture (see table_images)
+TEMPLATE_IMAGE = 'image'
+# Values of the recommendations `format` option
+RECOMMENDATION_FORMATS = (TEMPLATE_SIMPLE, TEMPLATE_TABLE, TEMPLATE_IMAGE)
+
+TEST_PREFIX = "[TEST MODE] "
+TEST_SUFFIX = "\n\n[THIS IS A TEST MESSAGE - PLEASE IGNORE]"
+
+_ROW_BLOCK = (
+    "\n*{{ row.company }} ({{ row.ticker }})*"
+    "\n• Quantity: {{ row.quantity }}"
+    "\n• CMP: Rs.{{ row.cmp }}"
+    "\n• Value: Rs.{{ row.value }} Lakh"
+    "\n• Order Type: {{ row.order_type }}"
+    "\n-------------------"
+)
+
+DEFAULT_TEMPLATES = {
+    TEMPLATE_GENERIC: "Dear {{ client_name }},\n\n{{ message_text }}",
+    TEMPLATE_SIMPLE: (
+        "Dear {{ client_name }},\n\nHere are your stock recommendations:\n"
+        "{% if buys %}\n*BUY RECOMMENDATIONS:*\n{% for row in buys %}" + _ROW_BLOCK + "{% endfor %}{% endif %}"
+        "{% if sells %}\n*SELL RECOMMENDATIONS:*\n{% for row in sells %}" + _ROW_BLOCK + "{% endfor %}{% endif %}"
+        "\n\n*Note:* Please execute orders as early as you can."
+    ),
+    TEMPLATE_TABLE: (
+        "Dear {{ client_name }},\n\nHere are your stock recommendations:\n"
+        "Sr | Company | NSE ticker | Reco. | Quantity | Approx. CMP Rs. | Approx. Value @ CMP Rs. Lakh | Order Type\n"
+        "---|---------|------------|--------|----------|----------------|---------------------------|------------\n"
+        "{% for row in rows %}{{ row.sr }} | {{ row.company }} | {{ row.ticker }} | {{ row.reco }} | "
+        "{{ row.quantity }} | {{ row.cmp }} | {{ row.value }} | {{ row.order_type }}\n{% endfor %}"
+        "\n\n*Note:* Please execute orders as early as you can."
+    ),
+    TEMPLATE_IMAGE: (
+        "Dear {{ client_name }},\n\nHere are your stock recommendations (table attached)."
+        "\n\n*Note:* Please execute orders as early as you can."
+    )
+}
+
+TEMPLATE_LABELS = {
+    TEMPLATE_GENERIC: 'Generic message',
+    TEMPLATE_SIMPLE: 'Stock recommendations (simple)',
+    TEMPLATE_TABLE: 'Stock recommendations (table)',
+    TEMPLATE_IMAGE: 'Stock recommendations (caption of the table image)'
+}
+
+# Fields each kind of template can use
+TEMPLATE_FIELDS = {
+    TEMPLATE_GENERIC: ['client_name', 'group_name', 'message_text'],
+    TEMPLATE_SIMPLE: ['client_name', 'group_name', 'rows', 'buys', 'sells'],
+    TEMPLATE_TABLE: ['client_name', 'group_name', 'rows', 'buys', 'sells'],
+    TEMPLATE_IMAGE: ['client_name', 'group_name', 'rows', 'buys', 'sells']
+}
+
+_environment = SandboxedEnvironment(autoescape=False, keep_trailing_newline=True)
+_compiled = {}
+_compiled_lock = threading.Lock()
+
+
+def template_kind(message_type, format_type=None):
+    """The template a campaign uses; unknown formats are simple, as always."""
+    if message_type == 'generic':
+        return TEMPLATE_GENERIC
+    return format_type if format_type in RECOMMENDATION_FORMATS else TEMPLATE_SIMPLE
+
+
+def compile_template(body):
+    """(compiled template, names of the fields it uses), cached by its text.
+
+    Raises jinja2.TemplateSyntaxError for a broken template.
+    """
+    key = hashlib.sha256(body.encode('utf-8')).hexdigest()
+    with _compiled_lock:
+        compiled = _compiled.get(key)
+    if compiled is None:
+        fields = sorted(meta.find_undeclared_variables(_environment.parse(body)))
+        compiled = (_environment.from_string(body), fields)
+        with _compiled_lock:
+            _compiled[key] = compiled
+    return compiled
+
+
+def invalidate(body=None):
+    """Drop a compiled template (all of them without `body`) after an edit."""
+    with _compiled_lock:
+        if body is None:
+            _compiled.clear()
+        else:
+            _compiled.pop(hashlib.sha256(body.encode('utf-8')).hexdigest(), None)
+
+
+def _frozen(value):
+    if isinstance(value, list):
+        return tuple(_frozen(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(value.items())
+    return value
+
+
+class MessageRenderer:
+    """One campaign's compiled template plus the messages rendered so far."""
+
+    def __init__(self, kind, body=None):
+        self.kind = kind
+        self.body = body if body is not None else DEFAULT_TEMPLATES[kind]
+        self.is_default = self.body == DEFAULT_TEMPLATES[kind]
+        self.template, self.fields = compile_template(self.body)
+        self._rendered = {}
+
+    def render(self, **context):
+        """Render the template; identical fields give the very same string."""
+        key = tuple(_frozen(context.get(field)) for field in self.fields)
+        message = self._rendered.get(key)
+        if message is None:
+            message = self._rendered.setdefault(key, self.template.render(**context))
+        return message
+
+    @staticmethod
+    def _mark_test(group_name, message):
+        if "testing" in group_name.lower():
+            return f"{TEST_PREFIX}{message}{TEST_SUFFIX}"
+        return message
+
+    def generic_message(self, group_name, client_name, message_text):
+        return self._mark_test(group_name, self.render(
+            client_name=client_name, group_name=group_name, message_text=message_text
+        ))
+
+    def _recommendation(self, group_name, client_name, rows):
+        return self._mark_test(group_name, self.render(
+            client_name=client_name if client_name is not None else "Client",
+            group_name=group_name,
+            rows=rows,
+            buys=[row for row in rows if row['kind'] == 'BUY'],
+            sells=[row for row in rows if row['kind'] == 'SELL']
+        ))
+
+    def recommendation_messages(self, df):
+        """{group_name: message} for every group of a recommendations sheet."""
+        from renderer import group_rows
+        return {
+            group_name: self._recommendation(group_name, client_name, rows)
+            for group_name, client_name, rows in group_rows(df)
+            if isinstance(group_name, str)
+        }
+
+    def recommendation_message(self, group_data, group_name):
+        """The message for one group's rows."""
+        from renderer import group_rows
+        for _, client_name, rows in group_rows(group_data):
+            return self._recommendation(group_name, client_name, rows)
+        return self._recommendation(group_name, None, [])
+
+    def sample(self):
+        """Render with placeholder data, to check an edited template."""
+        row = {'sr': '1', 'company': 'Company', 'ticker': 'TICKER', 'reco': 'BUY', 'quantity': '10',
+               'cmp': '100.0', 'value': '0.01', 'order_type': 'Market', 'kind': 'BUY'}
+        if self.kind == TEMPLATE_GENERIC:
+            return self.generic_message('Sample group', 'Client', 'Your message')
+        return self._recommendation('Sample group', 'Client', [row])
@@ -0,0 +1,161 @@
+"""Timing and counters for the send pipeline.
+
+Phases of a send (browser start, WhatsApp readiness, search, click,
+compose, send confirmation, upload parsing, ...) are timed with
+`phase(name)`. Every observation goes into process-wide histograms, exposed
+in the Prometheus text format by render() (see the /metrics route), and into
+the timings of the campaign running on the current thread, if any, for the
+per-campaign summary in the job result.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; WhatsApp steps range from milliseconds to the 60 s login wait
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+COMMAND_BUCKETS = (5, 10, 15, 20, 30, 50, 75, 100, 150)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _label_text(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(str(labels.get(name, '')) for name in self.labels), 0)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_label_text(self.labels, key)} {value}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # key -> [per-bucket counts..., +Inf count], sum
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ('+Inf',), counts):
+                    cumulative += count
+                    lines.append(f'{self.name}_bucket{_label_text(self.labels, key, [("le", bound)])} {cumulative}')
+                lines.append(f'{self.name}_sum{_label_text(self.labels, key)} {total}')
+                lines.append(f'{self.name}_count{_label_text(self.labels, key)} {cumulative}')
+        return lines
+
+
+PHASE_SECONDS = Histogram('whatsapp_phase_seconds', 'Time spent in each phase of the send pipeline.', ['phase'])
+SENDS_TOTAL = Counter('whatsapp_sends_total', 'Groups sent to, by final outcome.', ['status'])
+SEND_FAILURES = Counter('whatsapp_send_failures_total', 'Groups that could not be sent to, by reason.', ['reason'])
+SEND_RETRIES = Counter('whatsapp_send_retries_total', 'Sends queued for another attempt.')
+COMMANDS_PER_SEND = Histogram('whatsapp_webdriver_commands_per_send', 'WebDriver commands issued per delivered message.',
+                              buckets=COMMAND_BUCKETS)
+
+REGISTRY = [PHASE_SECONDS, SENDS_TOTAL, SEND_FAILURES, SEND_RETRIES, COMMANDS_PER_SEND]
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+class CampaignTimings:
+    """Per-phase totals for one campaign, shared by its shard threads."""
+
+    def __init__(self):
+        self._phases = {}
+        self._lock = threading.Lock()
+        self.started = time.monotonic()
+
+    def add(self, phase, seconds):
+        with self._lock:
+            count, total, longest = self._phases.get(phase, (0, 0.0, 0.0))
+            self._phases[phase] = (count + 1, total + seconds, max(longest, seconds))
+
+    @contextmanager
+    def active(self):
+        """Collect the phases timed on the current thread."""
+        previous = getattr(_local, 'timings', None)
+        _local.timings = self
+        try:
+            yield self
+        finally:
+            _local.timings = previous
+
+    def summary(self, sends=None):
+        elapsed = time.monotonic() - self.started
+        with self._lock:
+            phases = {
+                phase: {
+                    'count': count,
+                    'total_seconds': round(total, 3),
+                    'avg_seconds': round(total / count, 3),
+                    'max_seconds': round(longest, 3)
+                }
+                for phase, (count, total, longest) in sorted(self._phases.items())
+            }
+        summary = {'elapsed_seconds': round(elapsed, 1), 'phases': phases}
+        if sends is not None:
+            summary['sends_per_minute'] = round(sends * 60 / elapsed, 1) if elapsed else 0
+        return summary
+
+
+_local = threading.local()
+
+
+def observe_phase(name, seconds):
+    PHASE_SECONDS.observe(seconds, phase=name)
+    timings = getattr(_local, 'timings', None)
+    if timings is not None:
+        timings.add(name, seconds)
+
+
+@contextmanager
+def phase(name):
+    """Time the enclosed block as phase `name` (also when it raises)."""
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        observe_phase(name, time.monotonic() - started)
@@ -0,0 +1,67 @@
+"""Pacing between WhatsApp sends.
+
+Instead of fixed sleeps, each step of a send waits on a DOM condition and the
+time those waits take is fed back here. The gap enforced between two messages
+never drops below SEND_MIN_GAP and grows when the page gets slow, which is
+usually the first sign of WhatsApp throttling.
+
+A `throttle` callable (see throttle.SendScheduler) can be given to also wait
+for a slot under the rate limits shared with other sessions and campaigns.
+"""
+import os
+import time
+from contextlib import contextmanager
+
+
+class Pacer:
+    """Adaptive minimum gap between consecutive messages on one session."""
+
+    def __init__(self, min_gap=None, max_gap=None, factor=None, poll_interval=None, smoothing=0.3, throttle=None):
+        self.min_gap = float(min_gap if min_gap is not None else os.getenv('SEND_MIN_GAP', '1.0'))
+        self.max_gap = float(max_gap if max_gap is not None else os.getenv('SEND_MAX_GAP', '10.0'))
+        # How many times the average page response the gap should be
+        self.factor = float(factor if factor is not None else os.getenv('SEND_GAP_FACTOR', '2.0'))
+        self.poll_interval = float(poll_interval if poll_interval is not None else os.getenv('SEND_POLL_INTERVAL', '0.1'))
+        self.smoothing = smoothing
+        self.throttle = throttle
+        self.avg_response = None
+        self._last_send = None
+
+    def wait(self, driver, timeout):
+        """A WebDriverWait that polls faster than Selenium's 0.5 s default."""
+        from selenium.webdriver.support.ui import WebDriverWait
+        return WebDriverWait(driver, timeout, poll_frequency=self.poll_interval)
+
+    def observe(self, seconds):
+        """Feed back how long the page took to respond to one step."""
+        if self.avg_response is None:
+            self.avg_response = seconds
+        else:
+            self.avg_response += self.smoothing * (seconds - self.avg_response)
+
+    @contextmanager
+    def timed(self):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - started)
+
+    @property
+    def gap(self):
+        if self.avg_response is None:
+            return self.min_gap
+        return max(self.min_gap, min(self.max_gap, self.avg_response * self.factor))
+
+    def wait_turn(self):
+        """Sleep only for whatever is left of the gap since the last send,
+        then for a slot from the throttle if there is one."""
+        if self._last_send is not None:
+            remaining = self._last_send + self.gap - time.monotonic()
+            if remaining > 0:
+                time.sleep(remaining)
+        if self.throttle is not None:
+            self.throttle()
+
+    def mark_sent(self):
+        self._last_send = time.monotonic()
@@ -0,0 +1,104 @@
+"""Dry runs of a campaign: the messages it would send, without a browser.
+
+Messages are rendered lazily, a batch of whole groups at a time ordered by
+group name: a page of a preview only loads and renders the groups on it, and
+an export of a large sheet never holds all messages at once. Each batch is
+rendered in one pass (splitting pandas frames group by group costs about a
+millisecond per group). The text is exactly what the senders would send,
+[TEST MODE] markers of test groups included.
+
+The order is by group name, like recommendations are sent. A generic
+campaign sends its rows in sheet order, so its preview lists the same
+messages in a different order than they go out.
+"""
+import csv
+import io
+import os
+
+from message_templates import TEMPLATE_GENERIC, TEST_PREFIX
+
+PREVIEW_PAGE_SIZE = int(os.getenv('PREVIEW_PAGE_SIZE', '20'))
+# Keeps one batch's group names within SQLite's parameter limit
+MAX_PREVIEW_PAGE_SIZE = 200
+EXPORT_BATCH_GROUPS = 500
+
+EXPORT_COLUMNS = ['group_name', 'client_name', 'test', 'message', 'error']
+
+
+def iter_group_frames(staging_store, upload_id, group_names, batch_groups=EXPORT_BATCH_GROUPS):
+    """Yield the staged rows of `group_names`, `batch_groups` groups per frame."""
+    for start in range(0, len(group_names), batch_groups):
+        yield staging_store.load_groups(upload_id, group_names[start:start + batch_groups])
+
+
+def _entry(group_name, client_name, message=None, error=None):
+    return {
+        'group_name': str(group_name),
+        'client_name': str(client_name) if client_name is not None else None,
+        'test': bool(message and message.startswith(TEST_PREFIX)),
+        'message': message,
+        'error': error
+    }
+
+
+def _generic_entries(df, message_renderer, message_text):
+    # One message per distinct (group, client) row, like the generic sender,
+    # but listed by group name rather than in sheet order
+    columns = ['group_name', 'client_name'] if 'client_name' in df.columns else ['group_name']
+    rows = df[columns][df['group_name'].notna()].drop_duplicates()
+    rows = rows.sort_values('group_name', kind='stable')
+    for values in rows.itertuples(index=False):
+        group_name = values[0]
+        client_name = values[1] if len(values) > 1 else "Client"
+        try:
+            yield _entry(group_name, client_name,
+                         message_renderer.generic_message(group_name, client_name, message_text))
+        except Exception as e:
+            yield _entry(group_name, client_name, error=str(e))
+
+
+def _recommendation_entries(df, message_renderer):
+    firsts = df[df['group_name'].notna()].drop_duplicates('group_name')
+    clients = firsts['client_name'].tolist() if 'client_name' in firsts.columns else [None] * len(firsts)
+    messages = message_renderer.recommendation_messages(df)
+    for group_name, client_name in sorted(zip(firsts['group_name'].tolist(), clients), key=lambda pair: str(pair[0])):
+        message = messages.get(group_name)
+        if message is None:
+            # Left out by the renderer, and failed the same way by the sender
+            yield _entry(group_name, client_name, error='Group name is not text')
+        else:
+            yield _entry(group_name, client_name, message)
+
+
+def iter_messages(frames, message_renderer, message_text=None):
+    """Yield one dict per message (group_name, client_name, test, message,
+    error) for frames holding whole groups, by group name per frame."""
+    for df in frames:
+        if message_renderer.kind == TEMPLATE_GENERIC:
+            yield from _generic_entries(df, message_renderer, message_text)
+        else:
+            yield from _recommendation_entries(df, message_renderer)
+
+
+def page_bounds(total, page, page_size):
+    """(page, page_size, first index, last index + 1, pages), clamped to the data."""
+    page_size = max(1, min(page_size or PREVIEW_PAGE_SIZE, MAX_PREVIEW_PAGE_SIZE))
+    pages = max(1, -(-total // page_size))
+    page = max(1, min(page or 1, pages))
+    start = (page - 1) * page_size
+    return page, page_size, start, min(start + page_size, total), pages
+
+
+def iter_csv(entries):
+    """CSV text of the entries, one chunk per row, for a streamed download."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS)
+    # The byte order mark makes Excel read the file as UTF-8
+    buffer.write('\ufeff')
+    writer.writeheader()
+    for entry in entries:
+        writer.writerow(entry)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
@@ -0,0 +1,151 @@
+"""Columnar rendering of recommendation messages.
+
+format_recommendation_message() renders one group at a time with iterrows()
+and string concatenation. render_recommendations() produces the exact same
+text for every group of a sheet in one pass: the columns are normalized to
+strings once, each row's block is formatted once, and the blocks are joined
+per group.
+"""
+import numpy as np
+import pandas as pd
+
+from message_templates import TEST_PREFIX, TEST_SUFFIX
+
+TABLE_HEADER = (
+    "Sr | Company | NSE ticker | Reco. | Quantity | Approx. CMP Rs. | Approx. Value @ CMP Rs. Lakh | Order Type\n"
+    "---|---------|------------|--------|----------|----------------|---------------------------|------------\n"
+)
+NOTE = "\n\n*Note:* Please execute orders as early as you can."
+
+ROW_COLUMNS = ['Sr', 'Company', 'NSE ticker', 'Reco.', 'Quantity', 'Approx. CMP ₹',
+               'Approx. Value @CMP ₹ Lakh', 'Order Type']
+# Names the sheet columns go by in message templates
+ROW_FIELDS = dict(zip(['sr', 'company', 'ticker', 'reco', 'quantity', 'cmp', 'value', 'order_type'], ROW_COLUMNS))
+
+
+def _column_strings(frame, name):
+    """A column as the strings iterrows() + f-string would have produced."""
+    if name not in frame.columns:
+        return [''] * len(frame)
+    # tolist() yields the same Python scalars iterrows() hands out
+    return [f"{value}" for value in frame[name].tolist()]
+
+
+def _reco_kinds(values):
+    """Upper-cased Reco. values, None for non-strings (like .str.upper())."""
+    return [value.upper() if isinstance(value, str) else None for value in values]
+
+
+def _grouped(df):
+    """(frame sorted by group, group names, per-row group codes, starts, ends),
+    grouped exactly like df.groupby('group_name'); None if there is nothing."""
+    if df.empty or 'group_name' not in df.columns:
+        return None
+
+    frame = df[df['group_name'].notna()]
+    if frame.empty:
+        return None
+    codes, uniques = pd.factorize(frame['group_name'], sort=True)
+    order = np.argsort(codes, kind='stable')
+    frame = frame.take(order)
+    sorted_codes = codes[order]
+    # Row offsets where each group starts, plus the end
+    bounds = np.flatnonzero(np.diff(sorted_codes)) + 1
+    starts = np.concatenate(([0], bounds)).tolist()
+    ends = np.concatenate((bounds, [len(frame)])).tolist()
+    return frame, uniques, sorted_codes, starts, ends
+
+
+def group_rows(df):
+    """Yield (group_name, client_name, rows) per group, in groupby order.
+
+    Each row is a dict of the ROW_FIELDS formatted as the message builders
+    format them, plus `kind`: the upper-cased Reco. (None if not text).
+    client_name is None when the sheet has no client_name column.
+    """
+    grouped = _grouped(df)
+    if grouped is None:
+        return
+    frame, uniques, sorted_codes, starts, ends = grouped
+    columns = [_column_strings(frame, name) for name in ROW_FIELDS.values()]
+    kinds = _reco_kinds(frame['Reco.'].tolist()) if 'Reco.' in frame.columns else [None] * len(frame)
+    rows = [dict(zip(ROW_FIELDS, values), kind=kind) for *values, kind in zip(*columns, kinds)]
+    clients = _column_strings(frame, 'client_name') if 'client_name' in frame.columns else None
+    for start, end in zip(starts, ends):
+        yield uniques[sorted_codes[start]], clients[start] if clients is not None else None, rows[start:end]
+
+
+def render_recommendations(df, format_type='simple'):
+    """Render every group's message; returns {group_name: message}.
+
+    Groups are keyed exactly like df.groupby('group_name'). A group whose
+    text cannot be guaranteed identical to format_recommendation_message()
+    (e.g. a non-string group name or a non-text Reco. column) is left out so
+    the caller falls back to the per-group function for it.
+    """
+    grouped = _grouped(df)
+    if grouped is None:
+        return {}
+    frame, uniques, sorted_codes, starts, ends = grouped
+
+    columns = {name: _column_strings(frame, name) for name in ROW_COLUMNS}
+    clients = _column_strings(frame, 'client_name') if 'client_name' in frame.columns else None
+
+    if format_type == 'table':
+        rows = [
+            f"{sr} | {company} | {ticker} | {reco} | {quantity} | {cmp} | {value} | {order_type}\n"
+            for sr, company, ticker, reco, quantity, cmp, value, order_type in zip(*(columns[name] for name in ROW_COLUMNS))
+        ]
+    else:
+        reco_dtype = frame['Reco.'].dtype if 'Reco.' in frame.columns else None
+        if reco_dtype is None or not (pd.api.types.is_object_dtype(reco_dtype) or pd.api.types.is_string_dtype(reco_dtype)):
+            return {}
+        reco_values = frame['Reco.'].tolist()
+        kinds = _reco_kinds(reco_values)
+        rows = [
+            f"\n*{company} ({ticker})*"
+            f"\n• Quantity: {quantity}"
+            f"\n• CMP: Rs.{cmp}"
+            f"\n• Value: Rs.{value} Lakh"
+            f"\n• Order Type: {order_type}"
+            "\n-------------------"
+            for company, ticker, quantity, cmp, value, order_type in zip(
+                columns['Company'], columns['NSE ticker'], columns['Quantity'],
+                columns['Approx. CMP ₹'], columns['Approx. Value @CMP ₹ Lakh'], columns['Order Type']
+            )
+        ]
+
+    messages = {}
+    for start, end in zip(starts, ends):
+        group_name = uniques[sorted_codes[start]]
+        if not isinstance(group_name, str):
+            continue
+
+        is_test = "testing" in group_name.lower()
+        client_name = clients[start] if clients is not None else "Client"
+        parts = [f"{TEST_PREFIX if is_test else ''}Dear {client_name},\n\nHere are your stock recommendations:\n"]
+
+        if format_type == 'table':
+            parts.append(TABLE_HEADER)
+            parts.append(''.join(rows[start:end]))
+        else:
+            group_kinds = kinds[start:end]
+            # .str.upper() refuses a slice with no text at all
+            if not any(isinstance(value, str) for value in reco_values[start:end]) and \
+                    any(pd.notna(value) for value in reco_values[start:end]):
+                continue
+            buys = [rows[i] for i, kind in zip(range(start, end), group_kinds) if kind == 'BUY']
+            sells = [rows[i] for i, kind in zip(range(start, end), group_kinds) if kind == 'SELL']
+            if buys:
+                parts.append("\n*BUY RECOMMENDATIONS:*\n")
+                parts.append(''.join(buys))
+            if sells:
+                parts.append("\n*SELL RECOMMENDATIONS:*\n")
+                parts.append(''.join(sells))
+
+        parts.append(NOTE)
+        if is_test:
+            parts.append(TEST_SUFFIX)
+        messages[group_name] = ''.join(parts)
+
+    return messages
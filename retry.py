@@ -0,0 +1,80 @@
+"""In-campaign retries for failed sends.
+
+Most send failures (a wait timing out, a click intercepted by a toast, the
+send button not showing up) are transient. A failed send is classified; a
+retryable one is put back in a queue with exponential backoff and tried
+again once the rest of the campaign has been sent, up to an attempt budget.
+"""
+import heapq
+import itertools
+import os
+import time
+
+from metrics import SEND_RETRIES
+
+# Errors that mean the data or the group itself is wrong; retrying won't help
+PERMANENT_ERRORS = (ValueError, TypeError, KeyError)
+
+
+def is_retryable(error):
+    """Errors can opt out with a `retryable = False` attribute."""
+    retryable = getattr(error, 'retryable', None)
+    if retryable is not None:
+        return retryable
+    return not isinstance(error, PERMANENT_ERRORS)
+
+
+class RetryScheduler:
+    """Runs sends, parking retryable failures until the first pass is over.
+
+    attempt() runs a send immediately; drain() then retries the parked ones
+    in order of when their backoff expires.
+    """
+
+    def __init__(self, max_attempts=None, base_delay=None, max_delay=None, clock=time.monotonic, sleep=time.sleep):
+        self.max_attempts = int(max_attempts or os.getenv('SEND_MAX_ATTEMPTS', '3'))
+        self.base_delay = float(base_delay if base_delay is not None else os.getenv('SEND_RETRY_BASE_DELAY', '5'))
+        self.max_delay = float(max_delay if max_delay is not None else os.getenv('SEND_RETRY_MAX_DELAY', '60'))
+        self.clock = clock
+        self.sleep = sleep
+        self._queue = []
+        self._order = itertools.count()
+
+    def backoff(self, attempts):
+        """Delay before the next try after `attempts` failed ones."""
+        return min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+
+    def attempt(self, send, context, attempts=1):
+        """Call send(). Returns True on success, or None if the failure was
+        queued for a retry. Permanent errors, and retryable ones once the
+        attempt budget is spent, are raised as they are."""
+        try:
+            send()
+            return True
+        except Exception as e:
+            if not is_retryable(e) or attempts >= self.max_attempts:
+                e.attempts = attempts
+                raise
+            delay = self.backoff(attempts)
+            print(f"Send failed ({str(e)}), retrying in {delay:.0f}s (attempt {attempts + 1}/{self.max_attempts})")
+            SEND_RETRIES.inc()
+            heapq.heappush(self._queue, (self.clock() + delay, next(self._order), attempts + 1, send, context))
+            return None
+
+    @property
+    def pending(self):
+        return len(self._queue)
+
+    def drain(self, on_done):
+        """Retry every queued send; on_done(context, error, attempts) is
+        called once per send with error None if it went through."""
+        while self._queue:
+            ready_at, _, attempts, send, context = heapq.heappop(self._queue)
+            wait = ready_at - self.clock()
+            if wait > 0:
+                self.sleep(wait)
+            try:
+                if self.attempt(send, context, attempts):
+                    on_done(context, None, attempts)
+            except Exception as e:
+                on_done(context, e, attempts)
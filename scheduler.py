@@ -0,0 +1,95 @@
+"""Scheduled campaigns.
+
+A campaign can be given a send time instead of being queued right away.
+SCHEDULE_WARMUP_SECONDS before that time (default 300) it is prepared: its
+messages are rendered, every group is resolved against the chat list and
+the browser sessions are started and logged in. At the send time itself it
+is only queued, so the first message goes out within seconds.
+
+CampaignScheduler only does the timing; loading campaigns and what preparing
+and starting one means are passed in. Time comes from `clock` (time.time by
+default), so a fake clock and direct calls to tick() are enough to test it.
+"""
+import os
+import threading
+import time
+
+SCHEDULE_WARMUP_SECONDS = float(os.getenv('SCHEDULE_WARMUP_SECONDS', '300'))
+# Upper bound on a sleep, in case a campaign is scheduled from elsewhere
+SCHEDULE_POLL_SECONDS = float(os.getenv('SCHEDULE_POLL_SECONDS', '30'))
+
+
+class CampaignScheduler:
+    """Prepares and starts scheduled campaigns on a background thread.
+
+    load() returns [(campaign_id, send time as a timestamp)] for every
+    campaign still waiting for its time. prepare(campaign_id) runs on its own
+    thread, as it may wait for a QR scan; start(campaign_id) is called once
+    the send time has come, whether or not preparing has finished.
+    """
+
+    def __init__(self, load, prepare, start, warmup=None, poll=None, clock=time.time):
+        self.load = load
+        self.prepare = prepare
+        self.start = start
+        self.warmup = SCHEDULE_WARMUP_SECONDS if warmup is None else warmup
+        self.poll = SCHEDULE_POLL_SECONDS if poll is None else poll
+        self.clock = clock
+        self._prepared = set()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _prepare(self, campaign_id):
+        try:
+            self.prepare(campaign_id)
+        except Exception as e:
+            print(f"Error preparing scheduled campaign {campaign_id}: {str(e)}")
+
+    def tick(self):
+        """Prepare and start whatever is due; returns seconds until the next
+        thing to do (None if nothing is scheduled)."""
+        now = self.clock()
+        next_in = None
+        scheduled = self.load()
+        for campaign_id, send_at in scheduled:
+            if send_at <= now:
+                self._prepared.discard(campaign_id)
+                if send_at < now - self.poll:
+                    print(f"Scheduled campaign {campaign_id} is {now - send_at:.0f}s late")
+                try:
+                    self.start(campaign_id)
+                except Exception as e:
+                    print(f"Error starting scheduled campaign {campaign_id}: {str(e)}")
+                continue
+
+            if campaign_id not in self._prepared and send_at - self.warmup <= now:
+                self._prepared.add(campaign_id)
+                threading.Thread(target=self._prepare, args=(campaign_id,),
+                                 name=f'prepare-{campaign_id}', daemon=True).start()
+            wake_at = send_at if campaign_id in self._prepared else send_at - self.warmup
+            next_in = wake_at - now if next_in is None else min(next_in, wake_at - now)
+
+        # Forget campaigns that were cancelled or started elsewhere
+        self._prepared &= {campaign_id for campaign_id, _ in scheduled}
+        return next_in
+
+    def run(self):
+        while True:
+            try:
+                next_in = self.tick()
+            except Exception as e:
+                print(f"Error checking scheduled campaigns: {str(e)}")
+                next_in = None
+            self._wakeup.wait(self.poll if next_in is None else max(0, min(next_in, self.poll)))
+            self._wakeup.clear()
+
+    def wake(self):
+        """Look at the schedule again now, e.g. after a campaign was scheduled."""
+        self._wakeup.set()
+
+    def ensure_running(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self.run, name='campaign-scheduler', daemon=True)
+                self._thread.start()
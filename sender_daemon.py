@@ -0,0 +1,96 @@
+"""Standalone sender: owns the WhatsApp browser sessions and runs send jobs.
+
+With SEND_MODE=daemon the web workers only queue campaigns in the job queue
+(JOB_QUEUE_DB, see job_queue.py); this process takes them from there, sends
+them on its browser sessions and writes progress back for the status and
+SSE endpoints. It also prepares and starts scheduled campaigns. Run one of
+it next to as many web workers as needed:
+
+    SEND_MODE=daemon gunicorn -w 4 --threads 8 app:app
+    SEND_MODE=daemon python sender_daemon.py
+
+--fake uses in-memory browsers instead of Chrome (see fake_driver.py).
+"""
+import argparse
+import fcntl
+import os
+import signal
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+def serve_metrics(port):
+    """Serve this process's /metrics, where the send metrics now live."""
+    import metrics
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != '/metrics':
+                self.send_error(404)
+                return
+            body = metrics.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    print(f"Serving sender metrics on http://127.0.0.1:{port}/metrics")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the WhatsApp sender daemon')
+    parser.add_argument('--fake', action='store_true',
+                        help='use in-memory fake browsers instead of Chrome')
+    parser.add_argument('--no-warm', action='store_true',
+                        help='start the browser sessions with the first campaign instead of now')
+    parser.add_argument('--metrics-port', type=int, default=int(os.getenv('SENDER_METRICS_PORT', '0')),
+                        help='serve /metrics on this port (default: off)')
+    args = parser.parse_args()
+
+    # Set before the app reads its configuration
+    os.environ['SEND_MODE'] = 'daemon'
+    if args.fake:
+        os.environ['WHATSAPP_DRIVER'] = 'fake'
+    import app
+
+    # Two daemons would share browser profiles and fail each other's jobs
+    lock = open(app.job_manager.path + '.lock', 'w')
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        sys.exit('Another sender daemon is already running on this job queue')
+
+    app.create_tables()
+    interrupted = app.job_manager.recover()
+    if interrupted:
+        print(f"{interrupted} interrupted jobs failed, their campaigns can be resumed")
+    if not args.no_warm:
+        app.driver_pool.warm()
+    if args.metrics_port:
+        serve_metrics(args.metrics_port)
+    app.campaign_scheduler.ensure_running()
+    app.job_manager.start()
+    print(f"Sender daemon running {app.job_manager.workers} workers on {app.job_manager.path}")
+
+    # Stop like on Ctrl+C, so the browsers are closed
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print("Stopping sender daemon")
+        app.driver_pool.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+"""Fan one campaign out over several WhatsApp sessions.
+
+Every group is assigned to exactly one session: one whose chat list contains
+it, preferring the session with the fewest groups so far. Each session then
+sends its shard on its own thread with its own Pacer, so SEND_MIN_GAP and
+the adaptive gap apply per session, and the per-shard results are merged
+into a single report.
+
+Threads are enough here: a send is almost entirely waiting on ChromeDriver
+HTTP calls and on the page, not on Python.
+"""
+import threading
+
+from chat_index import GROUP_NOT_FOUND
+
+
+def assign_groups(group_names, resolutions):
+    """Split groups across sessions.
+
+    `resolutions` maps session id -> ({name: title}, {name: reason}) as
+    returned by ChatIndex.prepare(). Returns ({session id: {name: title}},
+    {name: reason}) where the second dict holds groups no session can reach.
+    These are never searched for at send time: a search matches titles that
+    merely contain the name.
+    """
+    shards = {session_id: {} for session_id in resolutions}
+    unresolved = {}
+    for name in group_names:
+        candidates = [
+            session_id for session_id, (resolved, _) in resolutions.items()
+            if name in resolved
+        ]
+        if not candidates:
+            # Report the first session's reason other than not found, e.g. ambiguous
+            reasons = [reasons.get(name) for _, reasons in resolutions.values()
+                       if reasons.get(name, GROUP_NOT_FOUND) != GROUP_NOT_FOUND]
+            unresolved[name] = reasons[0] if reasons else GROUP_NOT_FOUND
+            continue
+        session_id = min(candidates, key=lambda candidate: len(shards[candidate]))
+        shards[session_id][name] = resolutions[session_id][0][name]
+    return shards, unresolved
+
+
+class ProgressMerger:
+    """Turns per-shard progress callbacks into one campaign-wide count."""
+
+    def __init__(self, total, callback=None):
+        self.total = total
+        self.callback = callback
+        self.done = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, index, total, group_name, status, error=None):
+        with self._lock:
+            self.done += 1
+            done = self.done
+        if self.callback is not None:
+            self.callback(done, self.total, group_name, status, error)
+
+
+def merge_results(shard_results):
+    """Combine the results dicts of several shards into one."""
+    merged = {'success': [], 'failed': [], 'unchanged': [], 'confirmations': {},
+              'stats': {'webdriver_commands': 0, 'sends': 0}, 'sessions': {}}
+    for session_id, results in shard_results.items():
+        merged['success'].extend(results['success'])
+        merged['failed'].extend(results['failed'])
+        merged['unchanged'].extend(results.get('unchanged', []))
+        for confirmation, count in results.get('confirmations', {}).items():
+            merged['confirmations'][confirmation] = merged['confirmations'].get(confirmation, 0) + count
+        stats = results.get('stats', {})
+        merged['stats']['webdriver_commands'] += stats.get('webdriver_commands', 0)
+        merged['stats']['sends'] += stats.get('sends', 0)
+        merged['sessions'][session_id] = {
+            'success': len(results['success']),
+            'failed': len(results['failed']),
+            'unchanged': len(results.get('unchanged', []))
+        }
+    sends = merged['stats']['sends']
+    merged['stats']['avg_commands_per_send'] = round(merged['stats']['webdriver_commands'] / sends, 1) if sends else 0
+    return merged
+
+
+def run_shards(browsers, shards, send_shard):
+    """Call send_shard(browser, chat_titles) for every browser that has a
+    shard, each on its own thread. Returns {session id: what it returned,
+    or the exception it raised}."""
+    active = [browser for browser in browsers if shards.get(browser.id)]
+    outcomes = {}
+
+    def run(browser):
+        chat_titles = shards[browser.id]
+        print(f"Session {browser.id}: sending to {len(chat_titles)} groups")
+        try:
+            outcomes[browser.id] = send_shard(browser, chat_titles)
+        except Exception as e:
+            print(f"Session {browser.id} failed: {str(e)}")
+            outcomes[browser.id] = e
+
+    if len(active) == 1:
+        run(active[0])
+    else:
+        threads = [
+            threading.Thread(target=run, args=(browser,), name=f'shard-{browser.id}')
+            for browser in active
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    return outcomes
+
+
+def failed_shard(chat_titles, error, generic=False):
+    """Results of a shard whose session failed as a whole. Failed groups are
+    listed like the senders list them: {'group', 'error'} dicts for generic
+    messages, plain names for recommendations."""
+    return {
+        'success': [],
+        'failed': [{'group': name, 'error': str(error)} if generic else name for name in chat_titles]
+    }
+
+
+def send_sharded(browsers, shards, send_shard, progress_callback=None, generic=False):
+    """Send every shard on its own browser and merge the results.
+
+    `send_shard(browser, chat_titles, progress_callback)` loads the rows for
+    the groups in `chat_titles`, runs process_recommendations or
+    process_generic_messages (`generic`) on them and returns the results dict.
+    """
+    total = sum(len(shards.get(browser.id, ())) for browser in browsers)
+    progress = ProgressMerger(total, progress_callback)
+    outcomes = run_shards(browsers, shards, lambda browser, chat_titles: send_shard(browser, chat_titles, progress))
+    return merge_results({
+        session_id: failed_shard(shards[session_id], outcome, generic) if isinstance(outcome, Exception) else outcome
+        for session_id, outcome in outcomes.items()
+    })
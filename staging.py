@@ -0,0 +1,250 @@
+"""Staged uploads.
+
+An uploaded sheet is parsed and validated once, normalized to the canonical
+column names, trimmed to the columns the senders use and written to a SQLite
+table keyed by upload id. The send path loads it back from there instead of
+parsing the Excel file again.
+
+Upload ids are a hash of the file's content (see content_hash()), so
+uploading the same sheet again reuses the staged table.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+# Canonical name -> accepted spellings in uploaded sheets
+REQUIRED_COLUMNS = {
+    'group_name': ['group_name'],
+    'Company': ['Company'],
+    'NSE ticker': ['NSE ticker'],
+    'Reco.': ['Reco.'],
+    'Quantity': ['Quantity'],
+    'Approx. CMP ₹': ['Approx. CMP ₹'],
+    'Approx. Value @CMP ₹ Lakh': ['Approx. Value @CMP ₹ Lakh', 'Approx. Value @CMP ₹ Lakhs'],
+    'Order Type': ['Order Type']
+}
+GENERIC_COLUMNS = ['group_name', 'client_name']
+
+# Short names used in error messages, as before
+COLUMN_LABELS = {'Approx. Value @CMP ₹ Lakh': 'Value'}
+
+
+def content_hash(path, message_type):
+    """Upload id for a file: sha256 of its bytes and the message type."""
+    digest = hashlib.sha256(message_type.encode('utf-8') + b'\0')
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def missing_columns(columns, message_type):
+    """Labels of the required columns a sheet header lacks."""
+    if message_type == 'generic':
+        return [] if 'group_name' in columns else ['group_name']
+    return [
+        COLUMN_LABELS.get(canonical, canonical)
+        for canonical, variations in REQUIRED_COLUMNS.items()
+        if not any(var in columns for var in variations)
+    ]
+
+
+def canonical_renames(columns):
+    """{sheet column: canonical column} for columns spelled differently."""
+    renames = {}
+    for canonical, variations in REQUIRED_COLUMNS.items():
+        for var in variations:
+            if var != canonical and var in columns and canonical not in columns:
+                renames[var] = canonical
+    return renames
+
+
+def kept_columns(columns, message_type):
+    """The canonical columns worth staging, in a fixed order."""
+    wanted = GENERIC_COLUMNS if message_type == 'generic' else \
+        ['group_name', 'client_name', 'Sr'] + [name for name in REQUIRED_COLUMNS if name != 'group_name']
+    return [name for name in wanted if name in columns]
+
+
+def normalize_frame(df, message_type):
+    """Rename to canonical columns and drop everything the senders ignore."""
+    df = df.rename(columns=canonical_renames(df.columns))
+    return df[kept_columns(df.columns, message_type)]
+
+
+class StagingStore:
+    """SQLite file holding one table per staged upload plus an index table."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS staged_uploads (
+                    id TEXT PRIMARY KEY,
+                    message_type TEXT NOT NULL,
+                    source_name TEXT,
+                    rows INTEGER NOT NULL,
+                    groups INTEGER NOT NULL,
+                    dtypes TEXT NOT NULL,
+                    created_at TEXT NOT NULL
+                )
+            """)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _table(upload_id):
+        return f"upload_{upload_id}"
+
+    def stage(self, df, message_type, source_name=None, upload_id=None):
+        """Store a normalized frame and return its upload id."""
+        return self.stage_chunks([df], message_type, source_name, upload_id)
+
+    def stage_chunks(self, chunks, message_type, source_name=None, upload_id=None):
+        """Append normalized frames to a new staged table; returns the upload id.
+
+        Only the dtypes every chunk agreed on are recorded for load().
+        """
+        upload_id = upload_id or uuid.uuid4().hex
+        table = self._table(upload_id)
+        dtypes = None
+        rows = 0
+        with self._lock, self._connect() as conn:
+            conn.execute(f'DROP TABLE IF EXISTS "{table}"')
+            for chunk in chunks:
+                chunk_dtypes = {column: str(dtype) for column, dtype in chunk.dtypes.items()}
+                if dtypes is None:
+                    dtypes = chunk_dtypes
+                else:
+                    dtypes = {column: dtype for column, dtype in dtypes.items() if chunk_dtypes.get(column) == dtype}
+                chunk.to_sql(table, conn, if_exists='append', index=False)
+                rows += len(chunk)
+            if dtypes is None:
+                raise ValueError('The sheet has no rows')
+            conn.execute(f'CREATE INDEX IF NOT EXISTS "ix_{upload_id}_group" ON "{table}" (group_name)')
+            groups = conn.execute(f'SELECT COUNT(DISTINCT group_name) FROM "{table}"').fetchone()[0]
+            conn.execute(
+                "INSERT OR REPLACE INTO staged_uploads VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (upload_id, message_type, source_name, rows, groups,
+                 json.dumps(dtypes), datetime.now().isoformat())
+            )
+        return upload_id
+
+    def info(self, upload_id):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT id, message_type, source_name, rows, groups, dtypes, created_at "
+                "FROM staged_uploads WHERE id = ?", (upload_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        keys = ['id', 'message_type', 'source_name', 'rows', 'groups', 'dtypes', 'created_at']
+        info = dict(zip(keys, row))
+        info['dtypes'] = json.loads(info['dtypes'])
+        return info
+
+    def load(self, upload_id):
+        """The staged frame, with the dtypes it was staged with."""
+        import pandas as pd
+        info = self.info(upload_id)
+        if info is None:
+            raise KeyError(upload_id)
+        with self._connect() as conn:
+            df = pd.read_sql_query(f'SELECT * FROM "{self._table(upload_id)}" ORDER BY rowid', conn)
+        return self._restore_dtypes(df, info['dtypes'])
+
+    @staticmethod
+    def _restore_dtypes(df, dtypes):
+        for column, dtype in dtypes.items():
+            if column in df.columns and str(df[column].dtype) != dtype:
+                try:
+                    df[column] = df[column].astype(dtype)
+                except (TypeError, ValueError):
+                    pass
+        return df
+
+    def load_groups(self, upload_id, names):
+        """The staged rows of the given groups only, e.g. one page of a preview."""
+        import pandas as pd
+        info = self.info(upload_id)
+        if info is None:
+            raise KeyError(upload_id)
+        names = list(names)
+        placeholders = ', '.join('?' * len(names))
+        with self._connect() as conn:
+            df = pd.read_sql_query(
+                f'SELECT * FROM "{self._table(upload_id)}" WHERE group_name IN ({placeholders}) ORDER BY rowid',
+                conn, params=names
+            )
+        return self._restore_dtypes(df, info['dtypes'])
+
+    def group_names(self, upload_id):
+        """Distinct group names of a staged upload, in groupby order."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                f'SELECT DISTINCT group_name FROM "{self._table(upload_id)}" '
+                'WHERE group_name IS NOT NULL ORDER BY group_name'
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def iter_groups(self, upload_id, names=None, batch_groups=500):
+        """Yield (group_name, DataFrame) per group without loading the whole upload.
+
+        Groups are read in pages of `batch_groups`, ordered by group name
+        (SQLite's binary text order matches pandas' sort order for strings).
+        Each page is read on its own connection, closed before anything is
+        yielded, so a slow send never holds a read lock that would block
+        uploads and deletes. `names` restricts the groups yielded, e.g. to
+        one session's shard.
+        """
+        import pandas as pd
+        info = self.info(upload_id)
+        if info is None:
+            raise KeyError(upload_id)
+        table = self._table(upload_id)
+        last = None
+        while True:
+            with self._connect() as conn:
+                # Keyset paging: the next groups after the last one read
+                after = '' if last is None else 'AND group_name > ? '
+                page = [row[0] for row in conn.execute(
+                    f'SELECT DISTINCT group_name FROM "{table}" WHERE group_name IS NOT NULL {after}'
+                    'ORDER BY group_name LIMIT ?',
+                    (() if last is None else (last,)) + (batch_groups,)
+                )]
+                if not page:
+                    return
+                cursor = conn.execute(
+                    f'SELECT * FROM "{table}" WHERE group_name >= ? AND group_name <= ? ORDER BY group_name, rowid',
+                    (page[0], page[-1])
+                )
+                columns = [description[0] for description in cursor.description]
+                batch = cursor.fetchall()
+            last = page[-1]
+
+            group_index = columns.index('group_name')
+            groups = {}
+            for row in batch:
+                if names is None or row[group_index] in names:
+                    groups.setdefault(row[group_index], []).append(row)
+            for name, rows in groups.items():
+                yield name, self._restore_dtypes(pd.DataFrame.from_records(rows, columns=columns), info['dtypes'])
+
+    def delete(self, upload_id):
+        with self._lock, self._connect() as conn:
+            conn.execute(f'DROP TABLE IF EXISTS "{self._table(upload_id)}"')
+            conn.execute("DELETE FROM staged_uploads WHERE id = ?", (upload_id,))
@@ -0,0 +1,229 @@
+"""Recommendation tables sent as pictures.
+
+With the `image` format each group gets its recommendation table as one PNG
+attachment, captioned with the `image` message template, instead of the
+pipe-delimited text table that WhatsApp wraps badly and that takes a line
+per row to compose.
+
+Pictures are drawn with Pillow, imported only where they are drawn, in a
+pool of worker processes that runs ahead of the sender: a campaign submits
+its groups' tables as it starts and a send only waits if its own picture is
+not ready yet. Each picture is a file under TABLE_IMAGE_DIR named by a hash
+of its content, so a table several groups share, or that an earlier
+campaign sent, is drawn once.
+"""
+import collections
+import hashlib
+import importlib.util
+import json
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+# (row field, heading) of each column; headings as in the text table
+COLUMNS = [
+    ('sr', 'Sr'),
+    ('company', 'Company'),
+    ('ticker', 'NSE ticker'),
+    ('reco', 'Reco.'),
+    ('quantity', 'Quantity'),
+    ('cmp', 'Approx. CMP Rs.'),
+    ('value', 'Approx. Value @ CMP Rs. Lakh'),
+    ('order_type', 'Order Type')
+]
+RIGHT_ALIGNED = {'quantity', 'cmp', 'value'}
+HEADER_BACKGROUND = '#075E54'
+HEADER_TEXT = 'white'
+STRIPE = '#F2F2F2'
+GRID = '#D0D0D0'
+TEXT = '#202020'
+RECO_COLORS = {'BUY': '#1B7F3B', 'SELL': '#C0392B'}
+# Part of every picture's hash; bump it when the drawing changes
+STYLE_VERSION = 1
+
+_executor = None
+# Digest -> future of a picture being drawn, shared by all campaigns
+_pending = {}
+_lock = threading.Lock()
+
+
+def table_cells(rows):
+    """The cells of a group's table from its renderer.group_rows() rows."""
+    return [[row[field] for field, _ in COLUMNS] for row in rows]
+
+
+def table_digest(cells, font_path=None, font_size=None):
+    key = json.dumps([STYLE_VERSION, font_path, font_size, cells], ensure_ascii=False)
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+def draw_table(cells, path, font_path=None, font_size=20):
+    """Draw a table as a PNG at `path`; runs in the worker processes."""
+    from PIL import Image, ImageDraw, ImageFont
+
+    font = ImageFont.truetype(font_path, font_size) if font_path else ImageFont.load_default(font_size)
+    header = [heading for _, heading in COLUMNS]
+    pad_x = font_size // 2 + 4
+    pad_y = font_size // 3 + 4
+    row_height = font.getbbox('Ag')[3] + 2 * pad_y
+    widths = [int(max(font.getlength(text) for text in column)) + 2 * pad_x for column in zip(header, *cells)]
+    width = sum(widths) + 1
+    height = row_height * (len(cells) + 1) + 1
+
+    image = Image.new('RGB', (width, height), 'white')
+    draw = ImageDraw.Draw(image)
+    for index, row in enumerate([header] + cells):
+        top = index * row_height
+        if index == 0 or index % 2 == 0:
+            draw.rectangle((0, top, width - 1, top + row_height), fill=HEADER_BACKGROUND if index == 0 else STRIPE)
+        left = 0
+        for (field, _), text, column_width in zip(COLUMNS, row, widths):
+            if index == 0:
+                color = HEADER_TEXT
+            else:
+                color = RECO_COLORS.get(text.upper(), TEXT) if field == 'reco' else TEXT
+            x = left + pad_x
+            if index and field in RIGHT_ALIGNED:
+                x = left + column_width - pad_x - font.getlength(text)
+            draw.text((x, top + pad_y), text, font=font, fill=color)
+            left += column_width
+        draw.line((0, top + row_height, width, top + row_height), fill=GRID)
+    left = 0
+    for column_width in widths:
+        draw.line((left, row_height, left, height), fill=GRID)
+        left += column_width
+    draw.line((width - 1, row_height, width - 1, height), fill=GRID)
+
+    # Saved under a temporary name, so no one picks up a half-written file
+    partial_path = f'{path}.{os.getpid()}.tmp'
+    image.save(partial_path, 'PNG', optimize=True)
+    os.replace(partial_path, path)
+    return path
+
+
+def _pool():
+    global _executor
+    if _executor is None:
+        workers = int(os.getenv('TABLE_IMAGE_WORKERS', '0')) or min(4, os.cpu_count() or 1)
+        # Spawned rather than forked, as the sender runs threads
+        _executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'))
+    return _executor
+
+
+def _submit_drawing(cells, path, font_path, font_size):
+    global _executor
+    try:
+        return _pool().submit(draw_table, cells, path, font_path, font_size)
+    except BrokenProcessPool:
+        # A worker died; start a fresh pool
+        print("Table image workers stopped, restarting them")
+        _executor = None
+        return _pool().submit(draw_table, cells, path, font_path, font_size)
+
+
+def _forget(digest):
+    with _lock:
+        _pending.pop(digest, None)
+
+
+class TableImageError(Exception):
+    """A table picture could not be drawn; drawing it again won't help."""
+    retryable = False
+
+
+class TableImage:
+    """One group's table picture: its content digest and its file, drawn
+    (or being drawn) by `future`."""
+
+    def __init__(self, digest, path, future):
+        self.digest = digest
+        self.path = path
+        self.future = future
+
+    def wait(self, timeout=None):
+        """The picture's path once it has been drawn."""
+        timeout = timeout or float(os.getenv('TABLE_IMAGE_TIMEOUT', '60'))
+        try:
+            self.future.result(timeout)
+        except TimeoutError:
+            raise
+        except Exception as e:
+            raise TableImageError(f"Could not draw the table picture: {str(e)}")
+        return self.path
+
+
+class ImageMessage(str):
+    """A caption sent with a table picture (`image`, a TableImage).
+
+    Wherever a message is text it is the caption; ledger.message_hash()
+    also covers the picture.
+    """
+
+    def __new__(cls, caption, image):
+        message = super().__new__(cls, caption)
+        message.image = image
+        return message
+
+
+class TableImages:
+    """The table pictures of one campaign, drawn ahead of its sends.
+
+    image() hands out a group's TableImage, submitting its drawing the
+    first time. prerender() submits every group of a sheet at once and
+    ahead() keeps a few groups of a stream submitted ahead of the sender.
+    """
+
+    def __init__(self, directory=None, font_path=None, font_size=None):
+        # Checked up front so a campaign fails before its first send
+        if importlib.util.find_spec('PIL') is None:
+            raise RuntimeError('Sending tables as images needs Pillow (pip install Pillow)')
+        self.directory = directory or os.getenv('TABLE_IMAGE_DIR', os.path.join('uploads', 'table_images'))
+        self.font_path = font_path or os.getenv('TABLE_IMAGE_FONT') or None
+        self.font_size = int(font_size or os.getenv('TABLE_IMAGE_FONT_SIZE', '20'))
+        self.images = {}
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _submit(self, cells):
+        digest = table_digest(cells, self.font_path, self.font_size)
+        path = os.path.join(self.directory, f'{digest}.png')
+        drawing = None
+        with _lock:
+            future = _pending.get(digest)
+            if future is None and os.path.exists(path):
+                future = Future()
+                future.set_result(path)
+            elif future is None:
+                future = drawing = _pending[digest] = _submit_drawing(cells, path, self.font_path, self.font_size)
+        if drawing is not None:
+            drawing.add_done_callback(lambda done: _forget(digest))
+        return TableImage(digest, path, future)
+
+    def prerender(self, df):
+        """Submit the table of every group of a recommendations sheet."""
+        from renderer import group_rows
+        for group_name, _, rows in group_rows(df):
+            if group_name not in self.images:
+                self.images[group_name] = self._submit(table_cells(rows))
+
+    def image(self, group_name, group_data):
+        """The TableImage for one group's rows."""
+        image = self.images.get(group_name)
+        if image is None:
+            from renderer import group_rows
+            cells = [table_cells(rows) for _, _, rows in group_rows(group_data)]
+            image = self.images[group_name] = self._submit(cells[0] if cells else [])
+        return image
+
+    def ahead(self, groups, depth=None):
+        """Yield the (group_name, group_data) pairs of `groups`, with the
+        tables of up to `depth` groups after the current one submitted."""
+        depth = depth or int(os.getenv('TABLE_IMAGE_AHEAD', '20'))
+        window = collections.deque()
+        for group_name, group_data in groups:
+            self.image(group_name, group_data)
+            window.append((group_name, group_data))
+            if len(window) > depth:
+                yield window.popleft()
+        yield from window
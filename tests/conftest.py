@@ -0,0 +1,128 @@
+"""Test setup: the app on fake browsers (see fake_driver.py), with its
+databases, job queue and staged uploads in a temporary directory.
+
+app reads its configuration when it is imported, so the environment is set
+here, before any test imports it.
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+WORK_DIR = tempfile.mkdtemp(prefix='whatsapp-tests-')
+# The fake chat list every browser session starts with
+CHATS = ['Alpha Traders', 'Beta Holdings', 'Gamma Family', 'Delta Partners']
+
+with open(os.path.join(WORK_DIR, 'chats.txt'), 'w', encoding='utf-8') as f:
+    f.write('\n'.join(CHATS) + '\n')
+
+os.environ.update({
+    'DATABASE_URL': f"sqlite:///{os.path.join(WORK_DIR, 'database.db')}",
+    'SEND_MODE': 'daemon',
+    'JOB_QUEUE_DB': os.path.join(WORK_DIR, 'jobs.db'),
+    'STAGING_DB': os.path.join(WORK_DIR, 'staging.db'),
+    'CHROME_PROFILE_DIR': os.path.join(WORK_DIR, 'chrome_profiles'),
+    'WHATSAPP_DRIVER': 'fake',
+    'FAKE_WHATSAPP_CHATS': os.path.join(WORK_DIR, 'chats.txt'),
+    # No pacing or rate limits between the fake sends
+    'SEND_MIN_GAP': '0',
+    'SEND_MAX_GAP': '0',
+    'SEND_RATE_GLOBAL': '60000',
+    'SEND_RATE_PER_SESSION': '60000',
+    'SEND_RATE_BURST': '1000',
+    'LEDGER_FLUSH_INTERVAL': '0.1',
+    'SCHEDULE_POLL_SECONDS': '1',
+})
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(WORK_DIR, ignore_errors=True)
+
+
+@pytest.fixture(scope='session')
+def app_module():
+    import app
+    app.create_tables()
+    with app.app.app_context():
+        user = app.User(username='tester')
+        user.set_password('tester')
+        app.db.session.add(user)
+        app.db.session.commit()
+    yield app
+    app.driver_pool.shutdown()
+
+
+@pytest.fixture
+def user_id(app_module):
+    with app_module.app.app_context():
+        return app_module.User.query.filter_by(username='tester').one().id
+
+
+@pytest.fixture
+def new_campaign(app_module, user_id):
+    """Stage a sheet and create a campaign for it; returns the campaign id."""
+    import pandas as pd
+    from staging import normalize_frame
+
+    def create(message_type, rows, message_text=None, format_type=None, **fields):
+        df = normalize_frame(pd.DataFrame(rows), message_type)
+        upload_id = app_module.staging_store.stage(df, message_type)
+        with app_module.app.app_context():
+            campaign = app_module.Campaign(owner_id=user_id, upload_id=upload_id, message_type=message_type,
+                                           format_type=format_type, message_text=message_text, **fields)
+            app_module.db.session.add(campaign)
+            app_module.db.session.commit()
+            return campaign.id
+
+    return create
+
+
+@pytest.fixture
+def ledger(app_module):
+    """{group name: ledger status} of a campaign."""
+    def statuses(campaign_id):
+        with app_module.app.app_context():
+            return {
+                row.group_name: row.status
+                for row in app_module.SendLedger.query.filter_by(campaign_id=campaign_id)
+            }
+
+    return statuses
+
+
+@pytest.fixture
+def campaign_status(app_module):
+    def status(campaign_id):
+        with app_module.app.app_context():
+            return app_module.db.session.get(app_module.Campaign, campaign_id).status
+
+    return status
+
+
+@pytest.fixture
+def job_queue(app_module, tmp_path, monkeypatch):
+    """A job queue of the test's own, not started, so nothing it queues is
+    left for the sender daemon test."""
+    from job_queue import JobQueue
+
+    queue = JobQueue(str(tmp_path / 'jobs.db'), app_module.run_send_job, workers=1,
+                     batch_runner=app_module.run_send_jobs, max_batch=10, poll=0.1)
+    monkeypatch.setattr(app_module, 'job_manager', queue)
+    return queue
+
+
+@pytest.fixture
+def pacer():
+    """A Pacer with no gap between sends that gives up on the page quickly."""
+    from pacing import Pacer
+
+    class QuickPacer(Pacer):
+        def wait(self, driver, timeout):
+            return super().wait(driver, min(timeout, 0.5))
+
+    return QuickPacer(min_gap=0, max_gap=0, poll_interval=0.01)
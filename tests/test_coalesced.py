@@ -0,0 +1,66 @@
+"""Campaigns queued together, sent with one visit per chat."""
+import time
+from collections import Counter
+
+from fake_driver import FakeWhatsAppDriver
+from jobs import JOB_FINISHED
+
+RECOMMENDATION = {
+    'Company': 'Infosys', 'NSE ticker': 'INFY', 'Reco.': 'BUY', 'Quantity': 10,
+    'Approx. CMP ₹': 1500.0, 'Approx. Value @CMP ₹ Lakh': 0.15, 'Order Type': 'Market'
+}
+
+
+def wait_for_jobs(queue, job_ids, timeout=60):
+    deadline = time.monotonic() + timeout
+    while True:
+        jobs = [queue.get(job_id) for job_id in job_ids]
+        if all(job.is_done for job in jobs) or time.monotonic() > deadline:
+            return jobs
+        time.sleep(0.1)
+
+
+def test_campaigns_queued_together_visit_each_chat_once(app_module, new_campaign, job_queue, ledger,
+                                                        campaign_status, monkeypatch):
+    generic_id = new_campaign('generic', [
+        {'group_name': name, 'client_name': 'Client'}
+        for name in ['Alpha Traders', 'Beta Holdings', 'Gamma Family']
+    ], message_text='Our office is closed on Friday')
+    recommendations_id = new_campaign('recommendations', [
+        dict(RECOMMENDATION, group_name=name, client_name='Client', Sr=1)
+        for name in ['Alpha Traders', 'Beta Holdings', 'Delta Partners']
+    ], format_type='simple')
+
+    visits = Counter()
+    click = FakeWhatsAppDriver._click
+
+    def counted_click(self, element):
+        if element.kind == 'chat':
+            visits[element.title] += 1
+        click(self, element)
+
+    monkeypatch.setattr(FakeWhatsAppDriver, '_click', counted_click)
+    sent_before = len(app_module.driver_pool.sessions[0].driver.sent) \
+        if app_module.driver_pool.sessions[0].driver is not None else 0
+
+    # Both are queued before a worker looks, so one worker takes them together
+    with app_module.app.app_context():
+        jobs = [app_module.submit_campaign(app_module.db.session.get(app_module.Campaign, campaign_id))
+                for campaign_id in (generic_id, recommendations_id)]
+    job_queue.start()
+    jobs = wait_for_jobs(job_queue, [job.id for job in jobs])
+
+    assert [job.status for job in jobs] == [JOB_FINISHED, JOB_FINISHED]
+    for job in jobs:
+        assert any(event['type'] == 'coalesced' for event in job.events_after(0))
+    assert visits == {'Alpha Traders': 1, 'Beta Holdings': 1, 'Gamma Family': 1, 'Delta Partners': 1}
+
+    sent = Counter(title for title, _ in app_module.driver_pool.sessions[0].driver.sent[sent_before:])
+    assert sent == {'Alpha Traders': 2, 'Beta Holdings': 2, 'Gamma Family': 1, 'Delta Partners': 1}
+
+    assert ledger(generic_id) == {'Alpha Traders': 'delivered', 'Beta Holdings': 'delivered',
+                                  'Gamma Family': 'delivered'}
+    assert ledger(recommendations_id) == {'Alpha Traders': 'delivered', 'Beta Holdings': 'delivered',
+                                          'Delta Partners': 'delivered'}
+    assert campaign_status(generic_id) == 'completed'
+    assert campaign_status(recommendations_id) == 'completed'
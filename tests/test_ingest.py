@@ -0,0 +1,64 @@
+"""Streaming a sheet into the staging store."""
+import pytest
+from openpyxl import Workbook
+
+import ingest
+from ingest import MissingColumnsError, stream_to_staging
+from staging import StagingStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return StagingStore(str(tmp_path / 'staging.db'))
+
+
+@pytest.fixture
+def closed_workbooks(monkeypatch):
+    """Workbooks opened by ingest, with whether each was closed."""
+    opened = []
+    load_workbook = ingest.load_workbook
+
+    def tracked_load_workbook(*args, **kwargs):
+        workbook = load_workbook(*args, **kwargs)
+        close = workbook.close
+        entry = {'closed': False}
+
+        def tracked_close():
+            entry['closed'] = True
+            close()
+
+        workbook.close = tracked_close
+        opened.append(entry)
+        return workbook
+
+    monkeypatch.setattr(ingest, 'load_workbook', tracked_load_workbook)
+    return opened
+
+
+def write_xlsx(path, header, rows):
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.append(header)
+    for row in rows:
+        sheet.append(row)
+    workbook.save(path)
+    return str(path)
+
+
+def test_workbook_is_closed_when_columns_are_missing(tmp_path, store, closed_workbooks):
+    path = write_xlsx(tmp_path / 'sheet.xlsx', ['client_name', 'message'], [['Asha', 'Hello']])
+
+    with pytest.raises(MissingColumnsError):
+        stream_to_staging(path, 'generic', store)
+    assert closed_workbooks == [{'closed': True}]
+
+
+def test_xlsx_is_staged_in_chunks(tmp_path, store, closed_workbooks):
+    rows = [[f'Group {i}', f'Client {i}', 'ignored'] for i in range(5)]
+    path = write_xlsx(tmp_path / 'sheet.xlsx', ['group_name', 'client_name', 'notes'], rows + [[None, None, None]])
+
+    upload_id = stream_to_staging(path, 'generic', store, chunk_rows=2)
+
+    assert store.info(upload_id)['rows'] == 5
+    assert list(store.load(upload_id).columns) == ['group_name', 'client_name']
+    assert closed_workbooks == [{'closed': True}]
@@ -0,0 +1,55 @@
+"""The per-group send ledger and resuming a campaign from it."""
+import threading
+from datetime import datetime
+
+from ledger import LEDGER_DELIVERED, LEDGER_FAILED, LEDGER_UNCHANGED, LedgerWriter
+
+
+def test_writer_flushes_in_batches_and_on_close():
+    batches = []
+    flushed = threading.Event()
+
+    def flush(records):
+        batches.append(records)
+        flushed.set()
+
+    writer = LedgerWriter(flush, batch_size=2, interval=60)
+    writer.record('Alpha Traders', 'Hello', LEDGER_DELIVERED)
+    writer.record('Beta Holdings', None, LEDGER_FAILED, error='Group not found')
+    # A full batch is written without waiting for the interval
+    assert flushed.wait(5)
+    writer.record('Gamma Family', 'Hello', LEDGER_UNCHANGED, attempts=0)
+    writer.close()
+
+    assert [[record['group_name'] for record in batch] for batch in batches] == \
+        [['Alpha Traders', 'Beta Holdings'], ['Gamma Family']]
+    assert batches[0][1]['message_hash'] is None and batches[0][1]['error'] == 'Group not found'
+
+
+def test_resumed_campaign_skips_delivered_groups(app_module, new_campaign, job_queue, ledger, campaign_status):
+    campaign_id = new_campaign('generic', [
+        {'group_name': name, 'client_name': 'Client'}
+        for name in ['Alpha Traders', 'Beta Holdings', 'Gamma Family']
+    ], message_text='Quarterly statement attached')
+    # An earlier run delivered one group and failed another before stopping
+    with app_module.app.app_context():
+        app_module.db.session.add_all([
+            app_module.SendLedger(campaign_id=campaign_id, group_name='Alpha Traders', status=LEDGER_DELIVERED,
+                                  attempts=1, delivered_at=datetime.now()),
+            app_module.SendLedger(campaign_id=campaign_id, group_name='Beta Holdings', status=LEDGER_FAILED,
+                                  attempts=3, error='Message still pending, not sent'),
+        ])
+        campaign = app_module.db.session.get(app_module.Campaign, campaign_id)
+        campaign.status = 'incomplete'
+        app_module.db.session.commit()
+        job = app_module.submit_campaign(campaign)
+
+    session = app_module.driver_pool.sessions[0]
+    sent_before = len(session.driver.sent) if session.driver is not None else 0
+    results = app_module.run_send_job(job)
+
+    assert sorted(results['successful_groups']) == ['Beta Holdings', 'Gamma Family']
+    assert sorted(title for title, _ in session.driver.sent[sent_before:]) == ['Beta Holdings', 'Gamma Family']
+    assert any(event['type'] == 'resuming' and event['delivered'] == 1 for event in job.events_after(0))
+    assert ledger(campaign_id) == {name: LEDGER_DELIVERED for name in ['Alpha Traders', 'Beta Holdings', 'Gamma Family']}
+    assert campaign_status(campaign_id) == 'completed'
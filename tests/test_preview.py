@@ -0,0 +1,38 @@
+"""Previewing the messages of an uploaded sheet."""
+import pandas as pd
+import pytest
+
+from staging import normalize_frame
+
+
+@pytest.fixture
+def client(app_module, user_id):
+    """A logged-in test client with a generic sheet uploaded."""
+    df = normalize_frame(pd.DataFrame([
+        {'group_name': name, 'client_name': 'Client'}
+        for name in ['Gamma Family', 'Alpha Traders', 'Beta Holdings']
+    ]), 'generic')
+    upload_id = app_module.staging_store.stage(df, 'generic')
+    client = app_module.app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['upload_id'] = upload_id
+        session['message_type'] = 'generic'
+    return client
+
+
+def test_preview_pages_by_group_name(client):
+    response = client.post('/preview', json={'type': 'generic', 'message': 'Hello', 'page': 2, 'page_size': 2})
+
+    assert response.status_code == 200
+    data = response.get_json()
+    assert (data['total_groups'], data['page'], data['pages']) == (3, 2, 2)
+    assert [entry['group_name'] for entry in data['messages']] == ['Gamma Family']
+
+
+@pytest.mark.parametrize('options', [{'page': 'two'}, {'page_size': 'all'}, {'page': [1]}])
+def test_invalid_page_is_a_bad_request(client, options):
+    response = client.post('/preview', json=dict(options, type='generic', message='Hello'))
+
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Invalid page or page size'}
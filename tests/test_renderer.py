@@ -0,0 +1,46 @@
+"""render_recommendations() must produce exactly the text of the per-group
+format_recommendation_message() it replaces."""
+import pandas as pd
+import pytest
+
+from renderer import render_recommendations
+from whatsapp_utils import format_recommendation_message
+
+
+@pytest.fixture
+def sheet():
+    rows = [
+        ('Alpha Traders', 'Asha', 'Infosys', 'INFY', 'BUY', 10, 1500.5, 0.15, 'Market'),
+        ('Alpha Traders', 'Asha', 'Tata Steel', 'TATASTEEL', 'sell', 200, 150.25, 0.3, 'Limit'),
+        ('Beta Holdings testing', 'Bala', 'HDFC Bank', 'HDFCBANK', 'Buy', 5, 1620.0, 0.08, 'Market'),
+        ('Beta Holdings testing', 'Bala', 'Wipro', 'WIPRO', 'HOLD', 50, 450.75, 0.23, 'Market'),
+        ('Gamma Family', 'Gita', 'ITC', 'ITC', 'Sell', 100, 430.1, 0.43, 'Limit'),
+        ('Alpha Traders', 'Asha', 'Reliance', 'RELIANCE', 'bUy', 3, 2900.0, 0.09, 'Market'),
+        ('Delta Partners TESTING', 'Dev', 'Zomato', 'ZOMATO', 'HOLD', 1000, 180.0, 1.8, 'Market'),
+    ]
+    df = pd.DataFrame(rows, columns=['group_name', 'client_name', 'Company', 'NSE ticker', 'Reco.', 'Quantity',
+                                     'Approx. CMP ₹', 'Approx. Value @CMP ₹ Lakh', 'Order Type'])
+    df.insert(0, 'Sr', range(1, len(df) + 1))
+    return df
+
+
+@pytest.mark.parametrize('format_type', ['simple', 'table'])
+def test_columnar_rendering_matches_per_group_messages(sheet, format_type):
+    expected = {
+        group_name: format_recommendation_message(group_data, group_name, format_type)
+        for group_name, group_data in sheet.groupby('group_name')
+    }
+
+    assert render_recommendations(sheet, format_type) == expected
+
+
+def test_testing_groups_and_mixed_case_recommendations(sheet):
+    messages = render_recommendations(sheet, 'simple')
+
+    assert messages['Beta Holdings testing'].startswith('[TEST MODE] Dear Bala,')
+    assert messages['Delta Partners TESTING'].startswith('[TEST MODE] ')
+    assert not messages['Alpha Traders'].startswith('[TEST MODE]')
+    # 'sell' and 'bUy' count as SELL and BUY, HOLD as neither
+    assert messages['Alpha Traders'].count('Order Type') == 3
+    assert 'SELL RECOMMENDATIONS' in messages['Alpha Traders']
+    assert 'WIPRO' not in messages['Beta Holdings testing']
@@ -0,0 +1,143 @@
+"""Retrying failed sends, and never retrying one whose send was clicked."""
+import pytest
+from selenium.common.exceptions import TimeoutException
+
+from conftest import CHATS
+from confirmation import StuckPendingError
+from driver_pool import WHATSAPP_URL
+from fake_driver import FakeWhatsAppDriver
+from retry import RetryScheduler, is_retryable
+from table_images import TableImageError
+from whatsapp_utils import GroupNotFoundError, SendNotConfirmedError, SEND_BUTTON_XPATH, deliver_message
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def retry(clock):
+    return RetryScheduler(max_attempts=3, base_delay=5, max_delay=8, clock=clock, sleep=clock.sleep)
+
+
+@pytest.mark.parametrize('error, retryable', [
+    (TimeoutException('Send button not clickable'), True),
+    (RuntimeError('Compose box did not clear after a failed paste'), True),
+    (ValueError('bad row'), False),
+    (KeyError('Reco.'), False),
+    (GroupNotFoundError('Group not found: Fund A'), False),
+    (SendNotConfirmedError('Send clicked but not seen leaving'), False),
+    (TableImageError('Could not draw the table picture'), False),
+])
+def test_classification(error, retryable):
+    assert is_retryable(error) is retryable
+
+
+def test_backoff_doubles_up_to_the_maximum(retry):
+    assert [retry.backoff(attempts) for attempts in (1, 2, 3)] == [5, 8, 8]
+
+
+def test_transient_failures_are_retried_after_the_first_pass(retry, clock):
+    calls = []
+
+    def flaky():
+        calls.append(clock.now)
+        if len(calls) < 3:
+            raise TimeoutException('Send button not clickable')
+
+    done = []
+    assert retry.attempt(flaky, 'Alpha Traders') is None
+    assert retry.pending == 1
+    retry.drain(lambda context, error, attempts: done.append((context, error, attempts)))
+
+    assert done == [('Alpha Traders', None, 3)]
+    assert clock.slept == [5, 8]
+
+
+def test_retries_stop_at_the_attempt_budget(retry):
+    def broken():
+        raise TimeoutException('Send button not clickable')
+
+    done = []
+    retry.attempt(broken, 'Alpha Traders')
+    retry.drain(lambda context, error, attempts: done.append((context, type(error), attempts)))
+
+    assert done == [('Alpha Traders', TimeoutException, 3)]
+
+
+def test_permanent_failures_are_raised_at_once(retry):
+    def missing():
+        raise StuckPendingError('Message still pending, not sent')
+
+    with pytest.raises(StuckPendingError) as raised:
+        retry.attempt(missing, 'Alpha Traders')
+    assert raised.value.attempts == 1
+    assert retry.pending == 0
+
+
+@pytest.fixture
+def driver(monkeypatch):
+    driver = FakeWhatsAppDriver(chats=CHATS)
+    driver.get(WHATSAPP_URL)
+    clicks = driver.send_clicks = []
+    click = driver._click
+
+    def counted_click(element):
+        if element.kind == 'send':
+            clicks.append(driver._open)
+        click(element)
+
+    monkeypatch.setattr(driver, '_click', counted_click)
+    return driver
+
+
+def test_send_that_was_clicked_is_not_retried(driver, pacer, retry):
+    # Every send is dropped: the button is clicked but no bubble appears
+    driver.drop_rate = 1
+
+    def send():
+        deliver_message(driver, 'Alpha Traders', 'Hello', pacer, 'Alpha Traders', wait_for_bubble=True)
+
+    with pytest.raises(SendNotConfirmedError):
+        retry.attempt(send, 'Alpha Traders')
+    assert retry.pending == 0
+    assert driver.send_clicks == ['Alpha Traders']
+
+
+def test_send_that_failed_before_the_click_is_retried(driver, pacer, retry, monkeypatch):
+    find_elements = driver._find_elements
+    tries = []
+
+    # The send button does not show up on the first try
+    def flaky_find_elements(by, value):
+        if value == SEND_BUTTON_XPATH and len(tries) == 1:
+            return []
+        return find_elements(by, value)
+
+    monkeypatch.setattr(driver, '_find_elements', flaky_find_elements)
+
+    def send():
+        tries.append(1)
+        deliver_message(driver, 'Alpha Traders', 'Hello', pacer, 'Alpha Traders', wait_for_bubble=True)
+
+    done = []
+    assert retry.attempt(send, 'Alpha Traders') is None
+    retry.drain(lambda context, error, attempts: done.append((context, error, attempts)))
+
+    assert done == [('Alpha Traders', None, 2)]
+    assert driver.send_clicks == ['Alpha Traders']
+    assert driver.sent == [('Alpha Traders', 'Hello')]
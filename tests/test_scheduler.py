@@ -0,0 +1,150 @@
+"""CampaignScheduler.tick() on a fake clock, and the app starting a
+scheduled campaign."""
+import threading
+from datetime import datetime
+
+from scheduler import CampaignScheduler
+
+
+class FakeClock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class Schedule:
+    """Scheduled campaigns as the database would hold them: starting one
+    takes it off the schedule."""
+
+    def __init__(self, campaigns):
+        self.campaigns = dict(campaigns)
+        self.started = []
+        self.prepared = []
+        self.prepared_event = threading.Event()
+
+    def load(self):
+        return list(self.campaigns.items())
+
+    def prepare(self, campaign_id):
+        self.prepared.append(campaign_id)
+        self.prepared_event.set()
+
+    def start(self, campaign_id):
+        self.started.append(campaign_id)
+        self.campaigns.pop(campaign_id)
+
+    def scheduler(self, clock):
+        return CampaignScheduler(self.load, self.prepare, self.start, warmup=300, poll=30, clock=clock)
+
+
+def test_due_campaign_starts():
+    schedule = Schedule({'due': 1000, 'future': 5000})
+    scheduler = schedule.scheduler(FakeClock(1000))
+
+    # Next wake-up is the future campaign's warm-up
+    assert scheduler.tick() == 5000 - 300 - 1000
+    assert schedule.started == ['due']
+    assert schedule.campaigns == {'future': 5000}
+
+
+def test_future_campaign_does_not_start():
+    schedule = Schedule({'future': 1200})
+    clock = FakeClock(1000)
+    scheduler = schedule.scheduler(clock)
+
+    # Within the warm-up: prepared, not started
+    assert scheduler.tick() == 200
+    assert schedule.prepared_event.wait(5)
+    assert schedule.prepared == ['future']
+    assert schedule.started == []
+
+    clock.now = 1199
+    assert scheduler.tick() == 1
+    assert schedule.started == []
+
+    clock.now = 1200
+    assert scheduler.tick() is None
+    assert schedule.started == ['future']
+    # Prepared once only
+    assert schedule.prepared == ['future']
+
+
+def test_overdue_campaign_starts_after_restart():
+    schedule = Schedule({'overdue': 2000})
+    assert schedule.scheduler(FakeClock(1000)).tick() == 2000 - 300 - 1000
+    assert schedule.started == []
+
+    # The app was down at the send time; a new scheduler starts it right away
+    restarted = schedule.scheduler(FakeClock(9000))
+    assert restarted.tick() is None
+    assert schedule.started == ['overdue']
+
+    restarted.tick()
+    assert schedule.started == ['overdue']
+
+
+def test_start_error_does_not_stop_other_campaigns():
+    schedule = Schedule({'broken': 900, 'due': 1000})
+    start = schedule.start
+
+    def failing_start(campaign_id):
+        if campaign_id == 'broken':
+            raise RuntimeError('upload is gone')
+        start(campaign_id)
+
+    scheduler = CampaignScheduler(schedule.load, schedule.prepare, failing_start,
+                                  warmup=300, poll=30, clock=FakeClock(1000))
+    scheduler.tick()
+    assert schedule.started == ['due']
+
+
+def test_scheduled_campaign_is_started_once(app_module, new_campaign, job_queue, campaign_status):
+    campaign_id = new_campaign('generic', [{'group_name': 'Alpha Traders', 'client_name': 'Asha'}],
+                               message_text='Markets open late today', status='scheduled',
+                               scheduled_at=datetime.now())
+
+    # As if several schedulers found it due at the same moment
+    threads = [threading.Thread(target=app_module.start_scheduled_campaign, args=(campaign_id,))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    with job_queue._connect() as conn:
+        queued = conn.execute('SELECT COUNT(*) FROM send_jobs').fetchone()[0]
+    assert queued == 1
+    assert campaign_status(campaign_id) == 'queued'
+
+
+def test_importing_the_app_does_not_start_the_scheduler(app_module):
+    assert app_module.campaign_scheduler._thread is None
+
+
+def test_warm_ups_of_campaigns_no_longer_waiting_are_dropped(app_module, new_campaign, monkeypatch):
+    rows = [{'group_name': 'Alpha Traders', 'client_name': 'Asha'}]
+    waiting_id = new_campaign('generic', rows, message_text='Hello', status='scheduled', scheduled_at=datetime.now())
+    done_id = new_campaign('generic', rows, message_text='Hello', status='completed')
+    cancelled_id = new_campaign('generic', rows, message_text='Hello', status='cancelled')
+    monkeypatch.setattr(app_module, 'prepared_campaigns', {
+        campaign_id: {} for campaign_id in (waiting_id, done_id, cancelled_id, 'deleted')
+    })
+
+    app_module.load_scheduled_campaigns()
+
+    assert list(app_module.prepared_campaigns) == [waiting_id]
+
+
+def test_scheduled_campaigns_leave_out_prepared_in_daemon_mode(app_module, new_campaign, user_id):
+    campaign_id = new_campaign('generic', [{'group_name': 'Alpha Traders', 'client_name': 'Asha'}],
+                               message_text='Hello', status='scheduled', scheduled_at=datetime(2100, 1, 1))
+    client = app_module.app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+
+    campaigns = client.get('/campaigns/scheduled').get_json()['campaigns']
+
+    entry = next(entry for entry in campaigns if entry['campaign_id'] == campaign_id)
+    assert 'prepared' not in entry
@@ -0,0 +1,68 @@
+"""sender_daemon.py on fake browsers: campaigns go through the job queue
+(JOB_QUEUE_DB) to the daemon, which sends them and writes the ledger."""
+import os
+import signal
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+from conftest import ROOT, WORK_DIR
+from jobs import JOB_FINISHED
+
+DONE_STATUSES = ('completed', 'incomplete')
+
+
+def campaigns(app_module, campaign_ids):
+    with app_module.app.app_context():
+        return [app_module.db.session.get(app_module.Campaign, campaign_id) for campaign_id in campaign_ids]
+
+
+def sent(app_module, campaign):
+    """Whether the daemon is done with the campaign, its job included."""
+    if campaign.status not in DONE_STATUSES:
+        return False
+    job = app_module.job_manager.get(campaign.last_job_id)
+    return job is not None and job.is_done
+
+
+def test_daemon_sends_queued_and_overdue_campaigns(app_module, new_campaign, ledger):
+    queued_id = new_campaign('generic', [
+        {'group_name': 'Alpha Traders', 'client_name': 'Asha'},
+        {'group_name': 'Beta Holdings', 'client_name': 'Bala'},
+        {'group_name': 'Not A Chat', 'client_name': 'Nobody'}
+    ], message_text='Results are out tomorrow')
+    # Its send time passed while no daemon was running
+    overdue_id = new_campaign('generic', [{'group_name': 'Gamma Family', 'client_name': 'Gita'}],
+                              message_text='Happy Diwali', status='scheduled',
+                              scheduled_at=datetime.now() - timedelta(minutes=5))
+    with app_module.app.app_context():
+        app_module.submit_campaign(app_module.db.session.get(app_module.Campaign, queued_id))
+
+    log_path = os.path.join(WORK_DIR, 'sender_daemon.log')
+    with open(log_path, 'w') as log:
+        daemon = subprocess.Popen([sys.executable, 'sender_daemon.py', '--fake', '--no-warm'],
+                                  cwd=ROOT, stdout=log, stderr=subprocess.STDOUT)
+        try:
+            deadline = time.monotonic() + 60
+            while time.monotonic() < deadline and daemon.poll() is None:
+                if all(sent(app_module, campaign) for campaign in campaigns(app_module, [queued_id, overdue_id])):
+                    break
+                time.sleep(0.2)
+        finally:
+            daemon.send_signal(signal.SIGTERM)
+            daemon.wait(30)
+    with open(log_path) as log:
+        output = log.read()
+
+    queued, overdue = campaigns(app_module, [queued_id, overdue_id])
+    # The group missing from the chat list keeps the campaign resumable
+    assert queued.status == 'incomplete', output
+    assert overdue.status == 'completed', output
+    assert ledger(queued_id) == {'Alpha Traders': 'delivered', 'Beta Holdings': 'delivered', 'Not A Chat': 'failed'}
+    assert ledger(overdue_id) == {'Gamma Family': 'delivered'}
+
+    job = app_module.job_manager.get(queued.last_job_id)
+    assert job.status == JOB_FINISHED
+    assert sorted(job.results['successful_groups']) == ['Alpha Traders', 'Beta Holdings']
+    assert app_module.job_manager.get(overdue.last_job_id).status == JOB_FINISHED
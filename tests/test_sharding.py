@@ -0,0 +1,29 @@
+"""Splitting a campaign's groups across browser sessions."""
+from chat_index import GROUP_NOT_FOUND
+from sharding import assign_groups
+
+
+def test_groups_go_to_a_session_that_has_them():
+    resolutions = {
+        0: ({'Alpha': 'Alpha', 'Beta': 'BETA'}, {'Gamma': GROUP_NOT_FOUND}),
+        1: ({'Beta': 'Beta', 'Gamma': 'Gamma'}, {'Alpha': GROUP_NOT_FOUND}),
+    }
+
+    shards, unresolved = assign_groups(['Alpha', 'Beta', 'Gamma'], resolutions)
+
+    # Beta goes to the session with fewer groups so far, with that session's title
+    assert shards == {0: {'Alpha': 'Alpha'}, 1: {'Beta': 'Beta', 'Gamma': 'Gamma'}}
+    assert unresolved == {}
+
+
+def test_groups_no_session_has_are_reported_up_front():
+    resolutions = {
+        0: ({'Alpha': 'Alpha'}, {'Fund A': GROUP_NOT_FOUND, 'Fund B': 'Ambiguous group name, matches 2 chats'}),
+        1: ({}, {'Alpha': GROUP_NOT_FOUND, 'Fund A': GROUP_NOT_FOUND, 'Fund B': GROUP_NOT_FOUND}),
+    }
+
+    shards, unresolved = assign_groups(['Alpha', 'Fund A', 'Fund B'], resolutions)
+
+    # Not handed to a session to be searched for at send time
+    assert shards == {0: {'Alpha': 'Alpha'}, 1: {}}
+    assert unresolved == {'Fund A': GROUP_NOT_FOUND, 'Fund B': 'Ambiguous group name, matches 2 chats'}
@@ -0,0 +1,47 @@
+"""Token buckets and the send slots handed out from them."""
+import pytest
+
+from throttle import SendScheduler, TokenBucket
+
+
+def test_bucket_starts_full():
+    bucket = TokenBucket(rate=0.5, burst=3, now=100)
+
+    for _ in range(3):
+        assert bucket.delay(100) == 0
+        bucket.take(100)
+    # The fourth token is one token's worth of refill away
+    assert bucket.delay(100) == pytest.approx(2)
+
+
+def test_bucket_refills_at_its_rate_up_to_the_burst():
+    bucket = TokenBucket(rate=0.5, burst=3, now=100)
+    for _ in range(3):
+        bucket.take(100)
+
+    assert bucket.delay(101) == pytest.approx(1)
+    assert bucket.delay(102) == 0
+    bucket.take(102)
+    assert bucket.delay(102) == pytest.approx(2)
+
+    # A long pause refills no more than the burst
+    assert bucket.delay(1000) == 0
+    assert bucket.tokens == 3
+
+
+def test_bucket_without_a_rate_never_waits():
+    bucket = TokenBucket(rate=0, burst=1, now=0)
+    for _ in range(10):
+        bucket.take(0)
+    assert bucket.delay(0) == 0
+
+
+def test_sends_beyond_the_burst_wait_for_a_refill():
+    # 10 messages a second per session, no global or account limit
+    scheduler = SendScheduler(global_rate=0, account_rate=0, session_rate=600, burst=2)
+    with scheduler.campaign('campaign-1', account=1, message_type='generic') as acquire:
+        assert acquire('session-0') < 0.05
+        assert acquire('session-0') < 0.05
+        assert acquire('session-0') >= 0.09
+        # Other sessions have buckets of their own
+        assert acquire('session-1') < 0.05
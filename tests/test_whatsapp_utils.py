@@ -0,0 +1,83 @@
+"""The send steps of whatsapp_utils against the fake driver."""
+import pytest
+from selenium.webdriver.common.by import By
+
+from conftest import CHATS
+from driver_pool import WHATSAPP_URL
+from fake_driver import FakeWhatsAppDriver
+from whatsapp_utils import (SEARCH_BOX_XPATH, MESSAGE_BOX_XPATH, PASTE_MESSAGE_JS, GroupNotFoundError,
+                            clear_search_box, compose_message, open_chat, search_chat)
+
+
+@pytest.fixture
+def driver():
+    driver = FakeWhatsAppDriver(chats=CHATS)
+    driver.get(WHATSAPP_URL)
+    return driver
+
+
+def test_clear_search_box_empties_the_box(driver, pacer):
+    search_box = driver.find_element(By.XPATH, SEARCH_BOX_XPATH)
+    search_box.send_keys('Alpha')
+
+    # Only the platform's own select-all works on the fake page; with the
+    # wrong one the box would never empty and this would time out
+    assert clear_search_box(driver, pacer).text == ''
+
+
+@pytest.fixture
+def message_box(driver, pacer):
+    open_chat(driver, 'Alpha Traders', pacer)
+    return driver.find_element(By.XPATH, MESSAGE_BOX_XPATH)
+
+
+@pytest.fixture
+def bad_paste(driver, monkeypatch):
+    """Pastes leave half the message in the box, as a cut-short paste would."""
+    execute_async_script = driver._execute_async_script
+
+    def half_paste(script, args):
+        if script != PASTE_MESSAGE_JS:
+            return execute_async_script(script, args)
+        box, text = args
+        box._text = text[:len(text) // 2]
+        return box._text
+
+    monkeypatch.setattr(driver, '_execute_async_script', half_paste)
+
+
+def test_message_is_typed_after_a_failed_paste(driver, pacer, message_box, bad_paste):
+    compose_message(driver, message_box, 'Dear Asha,\n\nMarkets open late today', pacer)
+
+    assert message_box.text == 'Dear Asha,\n\nMarkets open late today'
+
+
+def test_nothing_is_typed_over_a_box_that_does_not_clear(driver, pacer, message_box, bad_paste, monkeypatch):
+    monkeypatch.setattr(driver, '_clear', lambda element: None)
+
+    with pytest.raises(RuntimeError, match='did not clear'):
+        compose_message(driver, message_box, 'Dear Asha,\n\nMarkets open late today', pacer)
+    assert message_box.text == 'Dear Asha,\n\nMarke'
+
+
+def fund_driver(*chats):
+    driver = FakeWhatsAppDriver(chats=chats)
+    driver.get(WHATSAPP_URL)
+    return driver
+
+
+def test_search_does_not_open_a_chat_that_only_contains_the_name(pacer):
+    driver = fund_driver('Fund A Testing', 'Fund B')
+
+    with pytest.raises(GroupNotFoundError):
+        search_chat(driver, 'Fund A', pacer)
+    assert driver._open is None
+
+
+def test_search_opens_the_exact_title(pacer):
+    driver = fund_driver('Fund A Testing', 'FUND A', "Ravi's Family")
+
+    assert search_chat(driver, 'Fund A', pacer) == 'FUND A'
+    assert driver._open == 'FUND A'
+    # No XPath is built from the name, so quotes are fine
+    assert search_chat(driver, "Ravi's Family", pacer) == "Ravi's Family"
@@ -0,0 +1,138 @@
+"""Send rate limits shared by every campaign in the process.
+
+Each send takes one token from three token buckets: a global one, one per
+account (the operator who started the campaign) and one per WhatsApp
+session. When sends are waiting, the next token goes to the highest
+priority lane (recommendations before generic broadcasts) and, within a
+lane, to the campaign that was served longest ago, so concurrent campaigns
+share the capacity evenly instead of racing each other into throttling.
+
+Rates are messages per minute; 0 means no limit.
+"""
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+LANE_RECOMMENDATIONS = 0
+LANE_GENERIC = 1
+
+
+def lane_for(message_type):
+    return LANE_GENERIC if message_type == 'generic' else LANE_RECOMMENDATIONS
+
+
+class TokenBucket:
+    """`rate` tokens per second, holding at most `burst` of them."""
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = max(1.0, float(burst))
+        self.tokens = self.burst
+        self.updated = now
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now):
+        """Seconds until a token is available (0 if one is now)."""
+        if not self.rate:
+            return 0.0
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        if self.rate:
+            self._refill(now)
+            self.tokens -= 1
+
+
+class SendScheduler:
+    """Hands out send slots across campaigns, accounts and sessions."""
+
+    def __init__(self, global_rate=None, account_rate=None, session_rate=None, burst=None,
+                 clock=time.monotonic):
+        per_minute = lambda value, env, default: float(value if value is not None else os.getenv(env, default)) / 60
+        self.global_rate = per_minute(global_rate, 'SEND_RATE_GLOBAL', '60')
+        self.account_rate = per_minute(account_rate, 'SEND_RATE_PER_ACCOUNT', '0')
+        self.session_rate = per_minute(session_rate, 'SEND_RATE_PER_SESSION', '30')
+        self.burst = float(burst if burst is not None else os.getenv('SEND_RATE_BURST', '3'))
+        self.clock = clock
+        self._cond = threading.Condition()
+        self._buckets = {}
+        self._campaigns = {}
+        self._waiting = []
+        self._order = itertools.count()
+
+    def _bucket(self, key, rate):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(rate, self.burst, self.clock())
+        return bucket
+
+    def _buckets_for(self, waiter):
+        return [
+            self._bucket(('global',), self.global_rate),
+            self._bucket(('account', waiter['account']), self.account_rate),
+            self._bucket(('session', waiter['session']), self.session_rate)
+        ]
+
+    def _next(self, now):
+        """(waiter to serve now or None, seconds until one could be served)."""
+        soonest = None
+        for waiter in sorted(self._waiting, key=self._rank):
+            delay = max(bucket.delay(now) for bucket in self._buckets_for(waiter))
+            if delay == 0:
+                return waiter, 0
+            soonest = delay if soonest is None else min(soonest, delay)
+        return None, soonest
+
+    def _rank(self, waiter):
+        campaign = self._campaigns.get(waiter['campaign'], {})
+        return (waiter['lane'], campaign.get('last_served', float('-inf')), waiter['order'])
+
+    def acquire(self, campaign_id, session_id, account=None, lane=LANE_RECOMMENDATIONS):
+        """Block until this send may go out; returns the seconds waited."""
+        started = self.clock()
+        waiter = {
+            'campaign': campaign_id,
+            'session': session_id,
+            'account': account,
+            'lane': lane,
+            'order': next(self._order)
+        }
+        with self._cond:
+            self._waiting.append(waiter)
+            self._cond.notify_all()
+            try:
+                while True:
+                    now = self.clock()
+                    chosen, delay = self._next(now)
+                    if chosen is waiter:
+                        for bucket in self._buckets_for(waiter):
+                            bucket.take(now)
+                        if campaign_id in self._campaigns:
+                            self._campaigns[campaign_id]['last_served'] = now
+                        break
+                    # Someone else goes first; wake up when they are served
+                    # or when the next token is due
+                    self._cond.wait(delay if chosen is None else 1.0)
+            finally:
+                self._waiting.remove(waiter)
+                self._cond.notify_all()
+        return self.clock() - started
+
+    @contextmanager
+    def campaign(self, campaign_id, account=None, message_type=None):
+        """Register a campaign for fair sharing; yields acquire(session_id)."""
+        lane = lane_for(message_type)
+        with self._cond:
+            self._campaigns.setdefault(campaign_id, {})
+        try:
+            yield lambda session_id: self.acquire(campaign_id, session_id, account, lane)
+        finally:
+            with self._cond:
+                self._campaigns.pop(campaign_id, None)
+                self._cond.notify_all()
@@ -6,7 +6,18 @@ from selenium.webdriver.common.keys import Keys
 import pandas as pd
 import time
 import os
+import platform
 from selenium import webdriver
+from pacing import Pacer
+from renderer import render_recommendations
+from message_templates import MessageRenderer, TEMPLATE_GENERIC, TEMPLATE_IMAGE
+from ledger import LEDGER_DELIVERED, LEDGER_FAILED, LEDGER_UNCHANGED, message_hash
+from retry import RetryScheduler
+from confirmation import ConfirmationTracker, StuckPendingError, CONFIRM_PENDING
+from metrics import phase, SENDS_TOTAL, SEND_FAILURES, COMMANDS_PER_SEND
+from table_images import TableImages, ImageMessage
+from chat_index import normalize_name, SNAPSHOT_CHAT_LIST_JS, GROUP_AMBIGUOUS
+from functools import partial
 
 def format_recommendation_message(group_data, group_name, format_type='simple'):
     """Format the stock recommendation message with the given data."""
@@ -85,176 +96,666 @@ def format_recommendation_message(group_data, group_name, format_type='simple'):
         print(f"Error formatting message: {str(e)}")
         raise
 
-def send_whatsapp_message(driver, group_name, message):
-    """Send a WhatsApp message to a specific group."""
-    try:
-        print(f"\nTrying to send message to group: {group_name}")
-        
-        # Wait for and find the search box
-        print("Waiting for search box...")
-        search_box = WebDriverWait(driver, 20).until(
-            EC.presence_of_element_located((By.XPATH, "//div[@contenteditable='true'][@data-tab='3']"))
-        )
-        
-        # Clear the search box properly
-        search_box.click()
-        time.sleep(1)
-        # Use Command+A for Mac (instead of Ctrl+A)
-        search_box.send_keys(Keys.COMMAND + "a")
-        search_box.send_keys(Keys.DELETE)
-        time.sleep(1)  # Wait after clearing
+SEARCH_BOX_XPATH = "//div[@contenteditable='true'][@data-tab='3']"
+MESSAGE_BOX_XPATH = "//div[@contenteditable='true'][@data-tab='10']"
+SEND_BUTTON_XPATH = "//span[@data-icon='send']"
+CHAT_HEADER_TITLE_CSS = "#main header span[title]"
+OUTGOING_MESSAGE_CSS = "#main div.message-out"
+# Sending a picture: the attach menu, its photo input and the media editor
+ATTACH_BUTTON_XPATH = "//footer//span[@data-icon='plus']"
+IMAGE_INPUT_CSS = "input[type='file'][accept*='image']"
+CAPTION_BOX_XPATH = "//div[@contenteditable='true'][@aria-label='Add a caption']"
+MEDIA_SEND_BUTTON_XPATH = "//div[@role='dialog']//span[@data-icon='send']"
+
+# Pastes the whole message into the compose box in one round trip. WhatsApp
+# turns the pasted text/plain into lines itself and keeps *bold* markers as
+# typed. The callback fires once the editor has re-rendered; a timer rather
+# than requestAnimationFrame, which Chrome pauses in a hidden window.
+PASTE_MESSAGE_JS = """
+const box = arguments[0], text = arguments[1], done = arguments[arguments.length - 1];
+box.focus();
+const data = new DataTransfer();
+data.setData('text/plain', text);
+box.dispatchEvent(new ClipboardEvent('paste', {clipboardData: data, bubbles: true, cancelable: true}));
+setTimeout(() => done(box.innerText), 50);
+"""
+
+class CommandCounter:
+    """Counts the WebDriver commands (HTTP round trips) a driver makes."""
+
+    def __init__(self, driver):
+        self.total = 0
+        self.sends = []
+        self._execute = driver.execute
+        driver.execute = self._counting_execute
+
+    def _counting_execute(self, driver_command, params=None):
+        self.total += 1
+        return self._execute(driver_command, params)
+
+    def record_send(self, commands):
+        self.sends.append(commands)
+
+    def summary(self, since=0):
+        """Command totals for the sends recorded after index `since`."""
+        return command_stats(self.sends[since:])
+
+def command_stats(counts):
+    """Totals for a list of per-send WebDriver command counts."""
+    return {
+        'webdriver_commands': sum(counts),
+        'sends': len(counts),
+        'avg_commands_per_send': round(sum(counts) / len(counts), 1) if counts else 0
+    }
+
+def count_commands(driver):
+    """Attach (once) and return the CommandCounter for a driver."""
+    counter = getattr(driver, '_command_counter', None)
+    if counter is None:
+        counter = CommandCounter(driver)
+        driver._command_counter = counter
+    return counter
+
+def _normalized(text):
+    """Text as the editor may give it back: line breaks kept as they are,
+    but non-breaking and repeated spaces and spaces at line ends evened out."""
+    lines = text.replace('\r\n', '\n').replace('\xa0', ' ').split('\n')
+    return '\n'.join(' '.join(line.split()) for line in lines).strip('\n')
+
+def compose_message(driver, message_box, message, pacer):
+    """Put the full message in the compose box.
+
+    SEND_COMPOSE_MODE=paste (default) inserts it with a single script call;
+    if the box does not end up holding the message, or with
+    SEND_COMPOSE_MODE=type, it is typed line by line with Shift+Enter.
+    """
+    if os.getenv('SEND_COMPOSE_MODE', 'paste') == 'paste':
+        try:
+            composed = driver.execute_async_script(PASTE_MESSAGE_JS, message_box, message)
+            if _normalized(composed or '') == _normalized(message):
+                return
+            print("Pasted text did not match the message, typing it instead")
+        except Exception as e:
+            print(f"Paste failed, typing message instead: {str(e)}")
+        # Whatever the paste left would end up in front of the typed message
+        message_box.clear()
+        try:
+            pacer.wait(driver, 5).until(element_text_is_empty(message_box))
+        except TimeoutException:
+            raise RuntimeError("Compose box did not clear after a failed paste")
+    
+    # Split message into lines
+    lines = message.split('\n')
+    
+    # Send first line
+    message_box.send_keys(lines[0])
+    
+    # For each remaining line, simulate Shift+Enter and send the line
+    for line in lines[1:]:
+        message_box.send_keys(Keys.SHIFT + Keys.ENTER)
+        message_box.send_keys(line)
+
+# Select-all in a text box: Command+A on a Mac, Ctrl+A everywhere else
+SELECT_ALL_KEYS = (Keys.COMMAND if platform.system() == 'Darwin' else Keys.CONTROL) + 'a'
+
+# Returns the chat-list entry whose title is exactly arguments[0], or null.
+# Compared in JS so names with quotes need no XPath escaping.
+FIND_CHAT_JS = """
+const title = arguments[0];
+for (const span of document.querySelectorAll('#pane-side span[title]')) {
+    if (span.getAttribute('title') === title) { return span; }
+}
+return null;
+"""
+
+class GroupNotFoundError(Exception):
+    """The group's chat does not exist (or could not be found); not worth retrying."""
+    retryable = False
+
+class SendNotConfirmedError(Exception):
+    """Send was clicked but the page never showed the message leave. It has
+    often gone out anyway, so it is not retried: that could send it twice."""
+    retryable = False
+
+def element_text_is_empty(element):
+    """Wait condition: a contenteditable box has been cleared."""
+    def condition(driver):
+        return element.text.strip() == ''
+    return condition
+
+def chat_header_is(title):
+    """Wait condition: the open chat's header shows exactly this title."""
+    def condition(driver):
+        for header in driver.find_elements(By.CSS_SELECTOR, CHAT_HEADER_TITLE_CSS):
+            if header.get_attribute('title') == title:
+                return True
+        return False
+    return condition
+
+def last_outgoing_message(driver):
+    messages = driver.find_elements(By.CSS_SELECTOR, OUTGOING_MESSAGE_CSS)
+    return messages[-1] if messages else None
+
+def outgoing_message_appended(previous):
+    """Wait condition: a new outgoing bubble appeared after `previous`."""
+    def condition(driver):
+        latest = last_outgoing_message(driver)
+        if latest is None:
+            return False
+        return previous is None or latest.id != previous.id
+    return condition
+
+def clear_search_box(driver, pacer):
+    """Focus the chat search box and empty it."""
+    search_box = pacer.wait(driver, 20).until(
+        EC.presence_of_element_located((By.XPATH, SEARCH_BOX_XPATH))
+    )
+    search_box.click()
+    search_box.send_keys(SELECT_ALL_KEYS)
+    search_box.send_keys(Keys.DELETE)
+    pacer.wait(driver, 5).until(element_text_is_empty(search_box))
+    return search_box
+
+def search_chat(driver, group_name, pacer):
+    """Open a chat by typing its name in the search box; returns the chat title.
+
+    Only used when no title is known from a chat index. The search narrows
+    the chat list down, but only a title equal to `group_name` (ignoring case
+    and repeated spaces, like the chat index) is opened, never one that
+    merely contains it.
+    """
+    wanted = normalize_name(group_name)
+    
+    def matching_titles(d):
+        titles = d.execute_async_script(SNAPSHOT_CHAT_LIST_JS, False) or []
+        return sorted({title for title in titles if normalize_name(title) == wanted})
+    
+    with phase('search'):
+        search_box = clear_search_box(driver, pacer)
         
         # Enter group name
         search_box.send_keys(group_name)
         print("Entered group name in search box")
-        time.sleep(2)  # Wait for search results
         
-        # Try to find and click the group chat
+        # Wait for the search results to render the group
         print("Looking for group in the list...")
         try:
-            # Wait for group to be visible and clickable
-            group_element = WebDriverWait(driver, 10).until(
-                EC.presence_of_element_located((By.XPATH, f"//span[contains(@title, '{group_name}')]"))
-            )
-            time.sleep(1)  # Short wait before clicking
-            group_element.click()
-            print("Group found and clicked")
-            time.sleep(2)  # Wait after clicking group
-            
-            # Wait for message box
-            print("Waiting for message input box...")
-            message_box = WebDriverWait(driver, 10).until(
-                EC.presence_of_element_located((By.XPATH, "//div[@contenteditable='true'][@data-tab='10']"))
+            with pacer.timed():
+                titles = pacer.wait(driver, 10).until(matching_titles)
+        except TimeoutException:
+            raise GroupNotFoundError(f"Group not found: {group_name}")
+        if len(titles) > 1:
+            raise GroupNotFoundError(GROUP_AMBIGUOUS.format(count=len(titles)))
+        chat_title = titles[0]
+        group_element = driver.execute_script(FIND_CHAT_JS, chat_title)
+        if group_element is None:
+            raise GroupNotFoundError(f"Group not found: {group_name}")
+    with phase('click'):
+        group_element.click()
+    print("Group found and clicked")
+    return chat_title
+
+def open_chat(driver, chat_title, pacer):
+    """Open the chat whose title is exactly `chat_title`."""
+    if chat_header_is(chat_title)(driver):
+        return
+    
+    with phase('search'):
+        group_element = driver.execute_script(FIND_CHAT_JS, chat_title)
+        if group_element is None:
+            # Not rendered in the chat list right now; narrow the list down first
+            search_box = clear_search_box(driver, pacer)
+            search_box.send_keys(chat_title)
+            try:
+                with pacer.timed():
+                    group_element = pacer.wait(driver, 10).until(
+                        lambda d: d.execute_script(FIND_CHAT_JS, chat_title)
+                    )
+            except TimeoutException:
+                raise GroupNotFoundError(f"Group not found: {chat_title}")
+    with phase('click'):
+        group_element.click()
+    print("Group found and clicked")
+
+def send_in_open_chat(driver, chat_title, message, pacer, wait_for_bubble=True):
+    """Compose and send `message` in the chat that was just opened.
+
+    Without `wait_for_bubble` this returns as soon as WhatsApp took the
+    message from the compose box; a ConfirmationTracker checks it went out.
+    """
+    # Wait until the clicked chat is actually the one open
+    print("Waiting for message input box...")
+    with phase('chat_ready'), pacer.timed():
+        pacer.wait(driver, 10).until(chat_header_is(chat_title))
+        message_box = pacer.wait(driver, 10).until(
+            EC.presence_of_element_located((By.XPATH, MESSAGE_BOX_XPATH))
+        )
+    
+    with phase('compose'):
+        # Clear message box (it may hold a draft)
+        message_box.clear()
+        pacer.wait(driver, 5).until(element_text_is_empty(message_box))
+        
+        # Type and send message
+        print("Typing message...")
+        compose_message(driver, message_box, message, pacer)
+    
+    with phase('send_confirm'):
+        # Click send button once WhatsApp enables it
+        print("Looking for send button...")
+        send_button = pacer.wait(driver, 10).until(
+            EC.element_to_be_clickable((By.XPATH, SEND_BUTTON_XPATH))
+        )
+        previous_message = last_outgoing_message(driver) if wait_for_bubble else None
+        send_button.click()
+        
+        # Wait for the outgoing bubble instead of a fixed delay
+        try:
+            with pacer.timed():
+                if wait_for_bubble:
+                    pacer.wait(driver, 10).until(outgoing_message_appended(previous_message))
+                else:
+                    pacer.wait(driver, 10).until(element_text_is_empty(message_box))
+        except Exception as e:
+            raise SendNotConfirmedError(f"Send clicked but not seen leaving ({type(e).__name__}), not retried")
+    pacer.mark_sent()
+
+def send_image_in_open_chat(driver, chat_title, message, pacer, wait_for_bubble=True):
+    """Send an ImageMessage's table picture, captioned, in the chat that was
+    just opened; like send_in_open_chat() otherwise."""
+    with phase('chat_ready'), pacer.timed():
+        pacer.wait(driver, 10).until(chat_header_is(chat_title))
+    
+    with phase('table_image'):
+        # Usually drawn while the groups before this one were sent
+        image_path = message.image.wait()
+    
+    with phase('compose'):
+        print("Attaching table image...")
+        with pacer.timed():
+            pacer.wait(driver, 10).until(
+                EC.element_to_be_clickable((By.XPATH, ATTACH_BUTTON_XPATH))
+            ).click()
+            image_input = pacer.wait(driver, 10).until(
+                EC.presence_of_element_located((By.CSS_SELECTOR, IMAGE_INPUT_CSS))
             )
-            
-            # Clear message box and wait
-            message_box.clear()
-            time.sleep(1)
-            
-            # Type and send message
-            print("Typing message...")
-            # Split message into lines
-            lines = message.split('\n')
-            
-            # Send first line
-            message_box.send_keys(lines[0])
-            
-            # For each remaining line, simulate Shift+Enter and send the line
-            for line in lines[1:]:
-                message_box.send_keys(Keys.SHIFT + Keys.ENTER)
-                message_box.send_keys(line)
-                time.sleep(0.1)  # Small delay between lines
-            
-            time.sleep(1)  # Wait before clicking send
-            
-            # Click send button
-            print("Looking for send button...")
-            send_button = WebDriverWait(driver, 10).until(
-                EC.element_to_be_clickable((By.XPATH, "//span[@data-icon='send']"))
+        image_input.send_keys(os.path.abspath(image_path))
+        with pacer.timed():
+            caption_box = pacer.wait(driver, 10).until(
+                EC.presence_of_element_located((By.XPATH, CAPTION_BOX_XPATH))
             )
-            send_button.click()
-            print("Message sent successfully")
-            
-            # Wait before next action
-            time.sleep(3)
-            return True
-            
+        if message:
+            compose_message(driver, caption_box, str(message), pacer)
+    
+    with phase('send_confirm'):
+        send_button = pacer.wait(driver, 10).until(
+            EC.element_to_be_clickable((By.XPATH, MEDIA_SEND_BUTTON_XPATH))
+        )
+        previous_message = last_outgoing_message(driver) if wait_for_bubble else None
+        send_button.click()
+        
+        try:
+            with pacer.timed():
+                if wait_for_bubble:
+                    pacer.wait(driver, 20).until(outgoing_message_appended(previous_message))
+                else:
+                    # The media editor closes once WhatsApp took the picture
+                    pacer.wait(driver, 20).until(EC.staleness_of(caption_box))
         except Exception as e:
-            print(f"Error while interacting with group {group_name}: {str(e)}")
-            return False
-            
+            raise SendNotConfirmedError(f"Send clicked but not seen leaving ({type(e).__name__}), not retried")
+    pacer.mark_sent()
+
+def deliver_message(driver, group_name, message, pacer, chat_title=None, wait_for_bubble=True):
+    """Send a WhatsApp message to a specific group, raising on failure.
+
+    Every step waits on the page itself rather than sleeping; `pacer` keeps
+    the gap between consecutive messages and is shared across a campaign.
+    With `chat_title` (from the chat index) the chat is opened by its exact
+    title instead of searching for `group_name`. See send_in_open_chat()
+    for `wait_for_bubble`. An ImageMessage is sent as its picture with the
+    message as caption.
+    """
+    counter = count_commands(driver)
+    commands_before = counter.total
+    print(f"\nTrying to send message to group: {group_name}")
+    with phase('pacing_wait'):
+        pacer.wait_turn()
+    
+    with phase('send'):
+        if chat_title is not None:
+            open_chat(driver, chat_title, pacer)
+        else:
+            chat_title = search_chat(driver, group_name, pacer)
+        
+        if getattr(message, 'image', None) is not None:
+            send_image_in_open_chat(driver, chat_title, message, pacer, wait_for_bubble)
+        else:
+            send_in_open_chat(driver, chat_title, message, pacer, wait_for_bubble)
+    commands = counter.total - commands_before
+    counter.record_send(commands)
+    COMMANDS_PER_SEND.observe(commands)
+    print(f"Message sent successfully ({commands} WebDriver commands)")
+
+def send_whatsapp_message(driver, group_name, message, pacer=None, chat_title=None):
+    """Send a WhatsApp message to a specific group; returns True on success."""
+    try:
+        deliver_message(driver, group_name, message, pacer or Pacer(), chat_title)
+        return True
     except Exception as e:
         print(f"Error sending message to {group_name}: {str(e)}")
         return False
 
-def process_generic_messages(driver, df, message_text, filepath):
+class ProgressReporter:
+    """Records each group's final outcome in the ledger and reports progress,
+    never letting either break the send loop."""
+
+    LEDGER_STATUSES = {'success': LEDGER_DELIVERED, 'failed': LEDGER_FAILED, 'unchanged': LEDGER_UNCHANGED}
+
+    def __init__(self, progress_callback, total, ledger=None):
+        self.progress_callback = progress_callback
+        self.total = total
+        self.ledger = ledger
+        self.done = 0
+
+    def report(self, group_name, status, error=None, message=None, attempts=1, reason=None, confirmation=None):
+        self.done += 1
+        SENDS_TOTAL.inc(status=status)
+        if status == 'failed':
+            SEND_FAILURES.inc(reason=reason or 'unknown')
+        if self.ledger is not None:
+            try:
+                self.ledger.record(group_name, message, self.LEDGER_STATUSES[status], error, attempts, confirmation)
+            except Exception as e:
+                print(f"Error recording send in ledger: {str(e)}")
+        if self.progress_callback is None:
+            return
+        try:
+            self.progress_callback(self.done, self.total, group_name, status, error)
+        except Exception as e:
+            print(f"Error in progress callback: {str(e)}")
+
+def _generic_rows(groups):
+    """Unique (group_name, client_name) rows from a stream of (group_name, group_data)."""
+    for _, group_data in groups:
+        columns = ['group_name', 'client_name'] if 'client_name' in group_data.columns else ['group_name']
+        for _, row in group_data[columns].drop_duplicates().iterrows():
+            yield row
+
+def process_generic_messages(driver, df, message_text, filepath, progress_callback=None, pacer=None,
+                             chat_titles=None, total_groups=None, ledger=None, retry=None, message_renderer=None,
+                             last_delivered=None):
     """
     Process and send generic messages to WhatsApp groups.
+
+    If given, progress_callback(index, total, group_name, status, error) is
+    called after every group. chat_titles maps group names to exact chat
+    titles (see chat_index); groups missing from it are failed without
+    touching the browser.
+
+    `df` may also be an iterable of (group_name, group_data) pairs, such as
+    StagingStore.iter_groups(), so large uploads never sit in memory whole;
+    pass total_groups for the progress count then. Each outcome is also
+    recorded in `ledger` (see ledger.LedgerWriter) if one is given.
+
+    Transient failures are retried by `retry` (a RetryScheduler) after the
+    other groups have been sent. The text comes from `message_renderer` (see
+    message_templates), the default generic template if none is given.
+
+    Sends are reported once a ConfirmationTracker (see confirmation) saw
+    them leave the pending state in the chat list, a few groups later;
+    results['confirmations'] counts the outcomes. Messages stuck pending
+    are failed.
+
+    Groups whose message hashes to their entry in `last_delivered` (group
+    name -> hash of the last message delivered to it) are skipped as
+    'unchanged'.
     """
     results = {
         'success': [],
-        'failed': []
+        'failed': [],
+        'unchanged': [],
+        'confirmations': {}
     }
+    pacer = pacer or Pacer()
+    retry = retry or RetryScheduler()
+    message_renderer = message_renderer or MessageRenderer(TEMPLATE_GENERIC)
+    sends_before = len(count_commands(driver).sends)
     
     # Get unique group names and their corresponding client names
-    groups = df[['group_name', 'client_name']] if 'client_name' in df.columns else df[['group_name']]
-    groups = groups.drop_duplicates()
-    total_groups = len(groups)
+    if isinstance(df, pd.DataFrame):
+        groups = df[['group_name', 'client_name']] if 'client_name' in df.columns else df[['group_name']]
+        groups = groups.drop_duplicates()
+        total_groups = len(groups)
+        rows = (row for _, row in groups.iterrows())
+    else:
+        rows = _generic_rows(df)
     print(f"Processing {total_groups} groups...")
+    reporter = ProgressReporter(progress_callback, total_groups, ledger)
+    
+    def succeeded(group_name, formatted_message, attempts=1, confirmation=None):
+        results['success'].append(group_name)
+        print(f"Successfully sent message to {group_name}")
+        reporter.report(group_name, 'success', message=formatted_message, attempts=attempts,
+                        confirmation=confirmation)
+    
+    def failed(group_name, formatted_message, error, attempts=1):
+        print(f"Failed to send message to {group_name}: {str(error)}")
+        results['failed'].append({
+            'group': group_name,
+            'error': str(error)
+        })
+        reporter.report(group_name, 'failed', str(error), formatted_message, attempts, type(error).__name__)
+    
+    def unchanged(group_name, formatted_message):
+        print(f"Skipping {group_name}: message unchanged since its last delivery")
+        results['unchanged'].append(group_name)
+        reporter.report(group_name, 'unchanged', message=formatted_message, attempts=0)
+    
+    # A send is only reported once the chat list confirms it went out
+    def confirmed(context, confirmation):
+        group_name, formatted_message, attempts = context
+        results['confirmations'][confirmation] = results['confirmations'].get(confirmation, 0) + 1
+        if confirmation == CONFIRM_PENDING:
+            failed(group_name, formatted_message, StuckPendingError('Message still pending, not sent'), attempts)
+        else:
+            succeeded(group_name, formatted_message, attempts, confirmation)
+    
+    tracker = ConfirmationTracker(driver, confirmed)
+    
+    def sent(group_name, formatted_message, attempts=1):
+        tracker.track(chat_titles.get(group_name) if chat_titles is not None else None,
+                      (group_name, formatted_message, attempts))
+        tracker.check()
     
-    for index, row in groups.iterrows():
+    for index, row in enumerate(rows):
         group_name = row['group_name']
         # Get client name if available, otherwise use "Client"
         client_name = row['client_name'] if 'client_name' in row.index else "Client"
+        formatted_message = None
         
         try:
             print(f"\nProcessing group {index + 1}/{total_groups}: {group_name}")
             
-            # Add test mode prefix if needed
-            is_test = "testing" in group_name.lower()
-            prefix = "[TEST MODE] " if is_test else ""
+            # Format message with client name (test groups get the test markers)
+            formatted_message = message_renderer.generic_message(group_name, client_name, message_text)
             
-            # Format message with client name
-            formatted_message = f"{prefix}Dear {client_name},\n\n{message_text}"
+            if last_delivered and last_delivered.get(str(group_name)) == message_hash(formatted_message):
+                unchanged(group_name, formatted_message)
+                continue
             
-            if is_test:
-                formatted_message += "\n\n[THIS IS A TEST MESSAGE - PLEASE IGNORE]"
+            if chat_titles is not None and group_name not in chat_titles:
+                raise GroupNotFoundError('Group not found in chat list')
             
-            # Use the existing send_whatsapp_message function which handles line breaks properly
-            if send_whatsapp_message(driver, group_name, formatted_message):
-                results['success'].append(group_name)
-                print(f"Successfully sent message to {group_name}")
-            else:
-                results['failed'].append({
-                    'group': group_name,
-                    'error': 'Failed to send message'
-                })
-                print(f"Failed to send message to {group_name}")
+            # deliver_message handles line breaks properly
+            chat_title = chat_titles.get(group_name) if chat_titles is not None else None
+            send = partial(deliver_message, driver, group_name, formatted_message, pacer, chat_title,
+                           not tracker.enabled or chat_title is None)
+            if retry.attempt(send, (group_name, formatted_message)):
+                sent(group_name, formatted_message)
             
         except Exception as e:
-            print(f"Failed to send message to {group_name}: {str(e)}")
-            results['failed'].append({
-                'group': group_name,
-                'error': str(e)
-            })
+            failed(group_name, formatted_message, e, getattr(e, 'attempts', 1))
             continue
     
+    # Second chance for the groups that failed transiently
+    retry.drain(lambda context, error, attempts: sent(*context, attempts) if error is None
+                else failed(*context, error, attempts))
+    tracker.finish(reveal=lambda: clear_search_box(driver, pacer))
+    
+    results['stats'] = count_commands(driver).summary(since=sends_before)
     return results
 
-def process_recommendations(driver, df, format_type='simple', uploaded_file_path=None):
-    """Process recommendations and send messages to respective groups."""
+def process_recommendations(driver, df, format_type='simple', uploaded_file_path=None, progress_callback=None, pacer=None,
+                            chat_titles=None, total_groups=None, ledger=None, retry=None, message_renderer=None,
+                            last_delivered=None, rendered=None):
+    """Process recommendations and send messages to respective groups.
+
+    If given, progress_callback(index, total, group_name, status, error) is
+    called after every group. chat_titles maps group names to exact chat
+    titles (see chat_index); groups missing from it are failed without
+    touching the browser.
+
+    `df` may also be an iterable of (group_name, group_data) pairs, such as
+    StagingStore.iter_groups(), so large uploads never sit in memory whole;
+    pass total_groups for the progress count then. Each outcome is also
+    recorded in `ledger` (see ledger.LedgerWriter) if one is given.
+
+    Transient failures are retried by `retry` (a RetryScheduler) after the
+    other groups have been sent. An edited template is rendered through
+    `message_renderer` (see message_templates); the default wording uses the
+    columnar renderer. `rendered` ({group_name: message}, e.g. rendered ahead
+    of a scheduled campaign) skips rendering for the groups it holds.
+
+    Sends are reported once a ConfirmationTracker (see confirmation) saw
+    them leave the pending state in the chat list, a few groups later;
+    results['confirmations'] counts the outcomes. Messages stuck pending
+    are failed.
+
+    Groups whose message hashes to their entry in `last_delivered` (group
+    name -> hash of the last message delivered to it) are skipped as
+    'unchanged'.
+    
+    With format_type 'image' each group's table is sent as a picture (see
+    table_images), drawn in worker processes ahead of the sends, and the
+    rendered message is its caption.
+    """
     results = {
         'success': [],
-        'failed': []
+        'failed': [],
+        'unchanged': [],
+        'confirmations': {}
     }
+    pacer = pacer or Pacer()
+    retry = retry or RetryScheduler()
+    table_images = None
+    if format_type == TEMPLATE_IMAGE:
+        message_renderer = message_renderer or MessageRenderer(TEMPLATE_IMAGE)
+    elif message_renderer is not None and message_renderer.is_default:
+        message_renderer = None
+    sends_before = len(count_commands(driver).sends)
     
     try:
         print("\nStarting to process recommendations...")
-        print(f"Found {len(df.groupby('group_name'))} groups to process")
+        messages = {}
+        if isinstance(df, pd.DataFrame):
+            grouped = df.groupby('group_name')
+            total_groups = len(grouped)
+            
+            # Render every group's message in one pass up front
+            try:
+                if rendered is not None:
+                    messages = rendered
+                elif message_renderer is not None:
+                    messages = message_renderer.recommendation_messages(df)
+                else:
+                    messages = render_recommendations(df, format_type)
+            except Exception as e:
+                print(f"Error rendering messages, formatting per group: {str(e)}")
+        else:
+            grouped = df
+            messages = rendered or {}
+        if format_type == TEMPLATE_IMAGE:
+            # Tables are drawn while the groups before them are sent
+            table_images = TableImages()
+            if isinstance(df, pd.DataFrame):
+                table_images.prerender(df)
+            else:
+                grouped = table_images.ahead(grouped)
+        print(f"Found {total_groups} groups to process")
         print(f"Using {format_type} format for messages")
+        reporter = ProgressReporter(progress_callback, total_groups, ledger)
+        
+        def succeeded(group_name, message, attempts=1, confirmation=None):
+            results['success'].append(group_name)
+            print(f"Successfully sent message to {group_name}")
+            reporter.report(group_name, 'success', message=message, attempts=attempts, confirmation=confirmation)
+        
+        def failed(group_name, message, error, attempts=1):
+            print(f"Error processing group {group_name}: {str(error)}")
+            results['failed'].append(group_name)
+            reporter.report(group_name, 'failed', str(error), message, attempts, type(error).__name__)
+        
+        def unchanged(group_name, message):
+            print(f"Skipping {group_name}: message unchanged since its last delivery")
+            results['unchanged'].append(group_name)
+            reporter.report(group_name, 'unchanged', message=message, attempts=0)
+        
+        # A send is only reported once the chat list confirms it went out
+        def confirmed(context, confirmation):
+            group_name, message, attempts = context
+            results['confirmations'][confirmation] = results['confirmations'].get(confirmation, 0) + 1
+            if confirmation == CONFIRM_PENDING:
+                failed(group_name, message, StuckPendingError('Message still pending, not sent'), attempts)
+            else:
+                succeeded(group_name, message, attempts, confirmation)
+        
+        tracker = ConfirmationTracker(driver, confirmed)
+        
+        def sent(group_name, message, attempts=1):
+            tracker.track(chat_titles.get(group_name) if chat_titles is not None else None,
+                          (group_name, message, attempts))
+            tracker.check()
         
         # Group the data by group_name
-        for group_name, group_data in df.groupby('group_name'):
+        for group_name, group_data in grouped:
+            message = None
             try:
                 print(f"\nProcessing group: {group_name}")
                 print(f"Number of recommendations for this group: {len(group_data)}")
                 
+                if chat_titles is not None and group_name not in chat_titles:
+                    raise GroupNotFoundError('Group not found in chat list')
+                
                 # Format message for this group
-                message = format_recommendation_message(group_data, group_name, format_type)
+                message = messages.get(group_name)
+                if message is None and message_renderer is not None:
+                    message = message_renderer.recommendation_message(group_data, group_name)
+                elif message is None:
+                    message = format_recommendation_message(group_data, group_name, format_type)
+                if table_images is not None:
+                    message = ImageMessage(message, table_images.image(group_name, group_data))
                 print("Message formatted successfully")
                 
+                if last_delivered and last_delivered.get(str(group_name)) == message_hash(message):
+                    unchanged(group_name, message)
+                    continue
+                
                 # Send message
-                if send_whatsapp_message(driver, group_name, message):
-                    results['success'].append(group_name)
-                    print(f"Successfully sent message to {group_name}")
-                else:
-                    results['failed'].append(group_name)
-                    print(f"Failed to send message to {group_name}")
+                chat_title = chat_titles.get(group_name) if chat_titles is not None else None
+                send = partial(deliver_message, driver, group_name, message, pacer, chat_title,
+                               not tracker.enabled or chat_title is None)
+                if retry.attempt(send, (group_name, message)):
+                    sent(group_name, message)
                     
             except Exception as e:
-                print(f"Error processing group {group_name}: {str(e)}")
-                results['failed'].append(group_name)
+                failed(group_name, message, e, getattr(e, 'attempts', 1))
+        
+        # Second chance for the groups that failed transiently
+        retry.drain(lambda context, error, attempts: sent(*context, attempts) if error is None
+                    else failed(*context, error, attempts))
+        tracker.finish(reveal=lambda: clear_search_box(driver, pacer))
         
+        results['stats'] = count_commands(driver).summary(since=sends_before)
         print("\nFinished processing all groups")
         print(f"Successful: {len(results['success'])} groups")
         print(f"Failed: {len(results['failed'])} groups")
@@ -264,7 +765,8 @@ def process_recommendations(driver, df, format_type='simple', uploaded_file_path
         print("\nCleaning up data...")
         try:
             # Clear the DataFrame
-            df.drop(df.index, inplace=True)
+            if isinstance(df, pd.DataFrame):
+                df.drop(df.index, inplace=True)
             
             # Remove the uploaded file if path is provided
             if uploaded_file_path:
@@ -276,4 +778,170 @@ def process_recommendations(driver, df, format_type='simple', uploaded_file_path
         except Exception as e:
             print(f"Error during cleanup: {str(e)}")
     
-    return results 
\ No newline at end of file
+    return results 
+
+def campaign_messages(df, kind, message_renderer=None, message_text=None, format_type='simple', rendered=None):
+    """{group_name: [message, ...]} a campaign sends for the rows in `df`, in
+    send order and rendered like process_generic_messages (one message per
+    distinct client row) or process_recommendations (one per group) would,
+    table pictures included. A message that fails to render is kept as the
+    exception."""
+    messages = {}
+    if kind == 'generic':
+        message_renderer = message_renderer or MessageRenderer(TEMPLATE_GENERIC)
+        columns = ['group_name', 'client_name'] if 'client_name' in df.columns else ['group_name']
+        for _, row in df[columns].drop_duplicates().iterrows():
+            client_name = row['client_name'] if 'client_name' in row.index else "Client"
+            try:
+                message = message_renderer.generic_message(row['group_name'], client_name, message_text)
+            except Exception as e:
+                message = e
+            messages.setdefault(row['group_name'], []).append(message)
+        return messages
+    
+    table_images = None
+    if format_type == TEMPLATE_IMAGE:
+        message_renderer = message_renderer or MessageRenderer(TEMPLATE_IMAGE)
+        table_images = TableImages()
+        table_images.prerender(df)
+    elif message_renderer is not None and message_renderer.is_default:
+        message_renderer = None
+    try:
+        if rendered is None:
+            rendered = message_renderer.recommendation_messages(df) if message_renderer is not None \
+                else render_recommendations(df, format_type)
+    except Exception as e:
+        print(f"Error rendering messages, formatting per group: {str(e)}")
+        rendered = {}
+    for group_name, group_data in df.groupby('group_name'):
+        message = rendered.get(group_name)
+        try:
+            if message is None and message_renderer is not None:
+                message = message_renderer.recommendation_message(group_data, group_name)
+            elif message is None:
+                message = format_recommendation_message(group_data, group_name, format_type)
+            if table_images is not None:
+                message = ImageMessage(message, table_images.image(group_name, group_data))
+        except Exception as e:
+            message = e
+        messages[group_name] = [message]
+    return messages
+
+class CampaignOutbox:
+    """One campaign's share of a coalesced send (see process_coalesced).
+
+    `messages` is what campaign_messages() returns. Outcomes go to the
+    campaign's own `results`, ledger and progress callback, and each of its
+    sends waits for a slot from its own `throttle`.
+    """
+
+    def __init__(self, messages, generic=False, progress_callback=None, ledger=None, last_delivered=None,
+                 throttle=None):
+        self.messages = messages
+        self.generic = generic
+        self.last_delivered = last_delivered
+        self.throttle = throttle
+        self.reporter = ProgressReporter(progress_callback, sum(len(items) for items in messages.values()), ledger)
+        self.results = {
+            'success': [],
+            'failed': [],
+            'unchanged': [],
+            'confirmations': {}
+        }
+        # WebDriver commands of each of its sends
+        self.commands = []
+
+def process_coalesced(driver, outboxes, chat_titles=None, pacer=None, retry=None):
+    """Send the messages of several campaigns with one visit per chat.
+
+    Groups are taken in the order they first appear in `outboxes`, and all
+    of a group's messages, campaign by campaign and in order, are sent
+    before moving on. Only the first of them searches for and opens the
+    chat; the others find it open already (see open_chat), so navigation
+    is paid once per group rather than once per campaign. A group that
+    cannot be found is failed for every campaign without looking again.
+
+    Unchanged messages, retries and confirmation from the chat list work as
+    in process_generic_messages, and every outcome is reported to the
+    CampaignOutbox it belongs to. Returns the outboxes' results dicts, each
+    with the command stats of its own sends.
+    """
+    pacer = pacer or Pacer()
+    retry = retry or RetryScheduler()
+    counter = count_commands(driver)
+    not_found = {}
+    
+    def succeeded(outbox, group_name, message, attempts=1, confirmation=None):
+        outbox.results['success'].append(group_name)
+        print(f"Successfully sent message to {group_name}")
+        outbox.reporter.report(group_name, 'success', message=message, attempts=attempts, confirmation=confirmation)
+    
+    def failed(outbox, group_name, message, error, attempts=1):
+        print(f"Failed to send message to {group_name}: {str(error)}")
+        outbox.results['failed'].append({'group': group_name, 'error': str(error)} if outbox.generic else group_name)
+        outbox.reporter.report(group_name, 'failed', str(error), message, attempts, type(error).__name__)
+    
+    def unchanged(outbox, group_name, message):
+        print(f"Skipping {group_name}: message unchanged since its last delivery")
+        outbox.results['unchanged'].append(group_name)
+        outbox.reporter.report(group_name, 'unchanged', message=message, attempts=0)
+    
+    # A send is only reported once the chat list confirms it went out
+    def confirmed(context, confirmation):
+        outbox, group_name, message, attempts = context
+        outbox.results['confirmations'][confirmation] = outbox.results['confirmations'].get(confirmation, 0) + 1
+        if confirmation == CONFIRM_PENDING:
+            failed(outbox, group_name, message, StuckPendingError('Message still pending, not sent'), attempts)
+        else:
+            succeeded(outbox, group_name, message, attempts, confirmation)
+    
+    tracker = ConfirmationTracker(driver, confirmed)
+    
+    def sent(outbox, group_name, message, attempts=1):
+        tracker.track(chat_titles.get(group_name) if chat_titles is not None else None,
+                      (outbox, group_name, message, attempts))
+        tracker.check()
+    
+    def deliver(outbox, group_name, message, chat_title):
+        # Each message waits for a slot under its own campaign's limits
+        pacer.throttle = outbox.throttle
+        try:
+            deliver_message(driver, group_name, message, pacer, chat_title,
+                            not tracker.enabled or chat_title is None)
+        except GroupNotFoundError as e:
+            not_found[group_name] = e
+            raise
+        outbox.commands.append(counter.sends[-1])
+    
+    group_names = list(dict.fromkeys(group_name for outbox in outboxes for group_name in outbox.messages))
+    print(f"Processing {len(group_names)} groups for {len(outboxes)} campaigns...")
+    for index, group_name in enumerate(group_names):
+        print(f"\nProcessing group {index + 1}/{len(group_names)}: {group_name}")
+        chat_title = chat_titles.get(group_name) if chat_titles is not None else None
+        for outbox in outboxes:
+            for message in outbox.messages.get(group_name, []):
+                if isinstance(message, Exception):
+                    failed(outbox, group_name, None, message)
+                    continue
+                try:
+                    if outbox.last_delivered and outbox.last_delivered.get(str(group_name)) == message_hash(message):
+                        unchanged(outbox, group_name, message)
+                        continue
+                    if chat_titles is not None and group_name not in chat_titles:
+                        raise GroupNotFoundError('Group not found in chat list')
+                    if group_name in not_found:
+                        raise not_found[group_name]
+                    send = partial(deliver, outbox, group_name, message, chat_title)
+                    if retry.attempt(send, (outbox, group_name, message)):
+                        sent(outbox, group_name, message)
+                except Exception as e:
+                    failed(outbox, group_name, message, e, getattr(e, 'attempts', 1))
+    
+    # Second chance for the sends that failed transiently
+    retry.drain(lambda context, error, attempts: sent(*context, attempts) if error is None
+                else failed(*context, error, attempts))
+    tracker.finish(reveal=lambda: clear_search_box(driver, pacer))
+    
+    for outbox in outboxes:
+        outbox.results['stats'] = command_stats(outbox.commands)
+    return [outbox.results for outbox in outboxes]